@@ -1,5 +1,3 @@
-import pandas as pd
-
 PQ_ENGINE = "pyarrow"
 PQ_VERSION = "2.6"
 
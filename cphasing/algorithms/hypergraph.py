@@ -3,6 +3,10 @@
 import logging
 import os
 import gc
+import hashlib
+import shutil
+import tempfile
+import weakref
 import numpy as np
 import pandas as pd
 import msgspec
@@ -10,12 +14,16 @@ import igraph as ig
 
 from .._config import HYPERGRAPH_ORDER_DTYPE, HYPERGRAPH_COL_DTYPE
 
+from collections import OrderedDict
 from joblib import Parallel, delayed
+from pathlib import Path
 from scipy.sparse import (
     identity, 
     dia_matrix, 
     csr_matrix, 
     coo_matrix,
+    load_npz,
+    save_npz,
 )
 
 logger = logging.getLogger(__name__)
@@ -33,6 +41,10 @@ class HyperEdges(msgspec.Struct):
     # count: contact of a contig in a read (> 2)
     contigsizes: contig sizes
     mapq: mapq of alignments
+
+    The `list` annotations of row, col and mapq are only for decoding 
+    the legacy msgpack `.hg`, they hold numpy arrays after `to_numpy`, 
+    and `load_hyperedges` always returns numpy arrays.
     """
     idx: dict 
     row: list
@@ -42,17 +54,132 @@ class HyperEdges(msgspec.Struct):
     mapq: list
 
     def to_numpy(self):
-        self.row = np.array(self.row, dtype=np.int32)
-        self.col = np.array(self.col, dtype=HYPERGRAPH_COL_DTYPE)
+        self.row = np.asarray(self.row, dtype=np.int32)
+        self.col = np.asarray(self.col, dtype=HYPERGRAPH_COL_DTYPE)
         # self.count = np.array(self.count, dtype=np.uint32)
-        self.mapq = np.array(self.mapq, dtype=np.int8)
+        self.mapq = np.asarray(self.mapq, dtype=np.int8)
 
     def to_list(self):
-        self.row = self.row.tolist()
-        self.col = self.col.tolist()
+        self.row = np.asarray(self.row).tolist()
+        self.col = np.asarray(self.col).tolist()
         # self.count = self.count.tolist()
-        self.mapq = self.mapq.tolist()
+        self.mapq = np.asarray(self.mapq).tolist()
+
+
+HYPEREDGES_MAGIC = b"CPHG"
+HYPEREDGES_VERSION = 2
+HYPEREDGES_ALIGNMENT = 64
+HYPEREDGES_ARRAY_DTYPES = {
+    "row": np.dtype("<i4"),
+    "col": np.dtype(HYPERGRAPH_COL_DTYPE).newbyteorder("<"),
+    "mapq": np.dtype("<i1"),
+}
+
+
+def save_hyperedges(edges: HyperEdges, output):
+    """
+    Save hyperedges into the columnar `.hg` (v2) format.
+
+    The layout is `CPHG` + uint8 version + uint64 header length + 
+    msgpack header (idx, contigsizes and the dtype, length and offset 
+    of each array), followed by the raw little-endian `row`, `col` and 
+    `mapq` buffers, each aligned to 64 bytes from the start of file.
+
+    Params:
+    --------
+    edges: HyperEdges
+        hyperedges, fields can be lists or numpy arrays
+    output: str
+        output path
+    """
+    arrays = {name: np.ascontiguousarray(getattr(edges, name), dtype=dtype)
+                for name, dtype in HYPEREDGES_ARRAY_DTYPES.items()}
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // HYPEREDGES_ALIGNMENT) * HYPEREDGES_ALIGNMENT
+        layout[name] = [array.dtype.str, len(array), offset]
+        offset += array.nbytes
+
+    header = msgspec.msgpack.encode({"idx": edges.idx, 
+                                     "contigsizes": edges.contigsizes,
+                                     "arrays": layout})
+    prefix_length = len(HYPEREDGES_MAGIC) + 1 + 8
+    data_start = -(-(prefix_length + len(header)) // HYPEREDGES_ALIGNMENT) * HYPEREDGES_ALIGNMENT
+
+    with open(output, 'wb') as out:
+        out.write(HYPEREDGES_MAGIC)
+        out.write(np.uint8(HYPEREDGES_VERSION).tobytes())
+        out.write(np.uint64(len(header)).astype("<u8").tobytes())
+        out.write(header)
+        for name, array in arrays.items():
+            out.seek(data_start + layout[name][2])
+            out.write(array.tobytes())
+
+
+def load_hyperedges(path, mmap=True) -> HyperEdges:
+    """
+    Load hyperedges from `.hg` file, both columnar v2 and legacy msgpack 
+    format are supported. The arrays of v2 are memory-mapped (read-only) 
+    unless `mmap` is False.
+
+    Params:
+    --------
+    path: str
+        path of hypergraph
+    mmap: bool
+        memory-map the arrays instead of reading them into memory
+
+    Returns:
+    --------
+    HyperEdges with numpy arrays
+
+    Examples:
+    --------
+    >>> he = load_hyperedges("sample.q1.hg")
+    >>> hg = HyperGraph(he)
+    """
+    with open(path, 'rb') as fp:
+        magic = fp.read(len(HYPEREDGES_MAGIC))
+        if magic != HYPEREDGES_MAGIC:
+            fp.seek(0)
+            try:
+                edges = msgspec.msgpack.decode(fp.read(), type=HyperEdges)
+            except (msgspec.ValidationError, msgspec.DecodeError):
+                raise msgspec.ValidationError(f"`{path}` is not the hypergraph. "
+                                              "Please input correct hypergraph format")
+            edges.to_numpy()
+            return edges
         
+        version = int(np.frombuffer(fp.read(1), dtype=np.uint8)[0])
+        if version != HYPEREDGES_VERSION:
+            raise ValueError(f"Unsupported hypergraph version `{version}` of `{path}`.")
+        header_length = int(np.frombuffer(fp.read(8), dtype="<u8")[0])
+        header = msgspec.msgpack.decode(fp.read(header_length))
+        data_start = -(-fp.tell() // HYPEREDGES_ALIGNMENT) * HYPEREDGES_ALIGNMENT
+
+    arrays = {}
+    for name, (dtype, length, offset) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        if length == 0:
+            arrays[name] = np.empty(0, dtype=dtype)
+        elif mmap:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', 
+                                     offset=data_start + offset, shape=(length, ))
+        else:
+            arrays[name] = np.fromfile(path, dtype=dtype, count=length, 
+                                       offset=data_start + offset)
+
+    edges = HyperEdges(idx=header["idx"], 
+                       row=arrays["row"],
+                       col=arrays["col"],
+                       contigsizes=header["contigsizes"],
+                       mapq=arrays["mapq"])
+    edges.to_numpy()
+
+    return edges
+
 
 def merge_hyperedges(HE_list: list) -> HyperEdges:
     
@@ -64,16 +191,109 @@ def merge_hyperedges(HE_list: list) -> HyperEdges:
     
     for HE in HE_list[1:]:
         assert HE.idx == init_idx, "HyperEdges must build in the same contigsizes"
-        init_HE.row += HE.row 
-        init_HE.col += HE.col 
-        if HE.mapq:
-            init_HE.mapq += HE.mapq
-        # if HE.count:
-        #     init_HE.count += HE.count
+
+    mapq_list = [HE.mapq for HE in HE_list if len(HE.mapq)]
+    init_HE = HyperEdges(idx=init_idx, 
+                         row=np.concatenate([np.asarray(HE.row, dtype=np.int32) 
+                                                for HE in HE_list]),
+                         col=np.concatenate([np.asarray(HE.col, dtype=HYPERGRAPH_COL_DTYPE) 
+                                                for HE in HE_list]),
+                         contigsizes=init_HE.contigsizes,
+                         mapq=np.concatenate([np.asarray(mapq, dtype=np.int8) 
+                                                for mapq in mapq_list])
+                                if mapq_list else np.array([], dtype=np.int8))
 
     return init_HE
 
 
+class HyperEdgesBuilder:
+    """
+    Incrementally build the columnar hyperedges of pairs, each pair is a 
+    hyperedge with two incidences. Arrays are grown in place, so the peak 
+    memory is bounded by the typed buffers rather than intermediate tables.
+
+    Params:
+    --------
+    capacity: int
+        initial number of incidences to reserve
+    
+    Examples:
+    --------
+    >>> builder = HyperEdgesBuilder()
+    >>> for df in chunks:
+    ...     builder.add_pairs(df['chrom1'], df['chrom2'], df['mapq'])
+    >>> edges = builder.to_hyperedges(contig_idx, contigsizes)
+    """
+    def __init__(self, capacity=0):
+        self.row = np.empty(capacity, dtype=np.int32)
+        self.col = np.empty(capacity, dtype=HYPERGRAPH_COL_DTYPE)
+        self.mapq = np.empty(capacity, dtype=np.int8)
+        self.size = 0
+        self.number_of_edges = 0
+        self.with_mapq = True
+
+    def reserve(self, n):
+        """
+        make sure there are at least `n` free incidences
+        """
+        required = self.size + n 
+        if required <= len(self.row):
+            return 
+        
+        capacity = max(required, int(len(self.row) * 1.5))
+        for name in ('row', 'col', 'mapq'):
+            getattr(self, name).resize(capacity, refcheck=False)
+
+    def add_pairs(self, chrom1, chrom2, mapq=None):
+        """
+        append a chunk of pairs, column offsets continue from the previous chunk
+
+        Params:
+        --------
+        chrom1: array-like
+            contig idx of the first mate
+        chrom2: array-like
+            contig idx of the second mate
+        mapq: array-like or None
+            mapping quality of pairs
+        """
+        n = len(chrom1)
+        if n == 0:
+            return 
+        
+        self.reserve(2 * n)
+        start, mid, end = self.size, self.size + n, self.size + 2 * n
+        self.row[start:mid] = chrom1
+        self.row[mid:end] = chrom2
+
+        col = self.col[start:mid]
+        col[:] = np.arange(self.number_of_edges, self.number_of_edges + n, 
+                           dtype=HYPERGRAPH_COL_DTYPE)
+        self.col[mid:end] = col 
+
+        if mapq is None:
+            self.with_mapq = False
+        else:
+            self.mapq[start:mid] = mapq
+            self.mapq[mid:end] = mapq
+
+        self.size = end 
+        self.number_of_edges += n
+
+    def to_hyperedges(self, idx, contigsizes) -> HyperEdges:
+        """
+        shrink the buffers to the filled size and wrap them into HyperEdges
+        """
+        for name in ('row', 'col', 'mapq'):
+            getattr(self, name).resize(self.size, refcheck=False)
+        
+        if not self.with_mapq:
+            self.mapq = np.array([], dtype=np.int8)
+
+        return HyperEdges(idx=idx, row=self.row, col=self.col,
+                          contigsizes=contigsizes, mapq=self.mapq)
+
+
 class HyperGraph:
     """
     HyperGraph 
@@ -98,7 +318,7 @@ class HyperGraph:
             raise ValueError("No hyperedges found.")
 
         if self.min_quality > 1 and len(self.edges.mapq) > 1:
-            self.mapq = np.array(self.edges.mapq, dtype=np.int8)
+            self.mapq = np.asarray(self.edges.mapq, dtype=np.int8)
 
             retain_idx = self.mapq >= self.min_quality
             # self.nodes = np.array(sorted(self.edges.idx, key=self.edges.idx.get))
@@ -127,7 +347,7 @@ class HyperGraph:
             # self.count = self.edges.count
             self.remove_contigs = np.array([])
 
-        self.shape = (len(self.nodes), max(self.col) + 1)
+        self.shape = (len(self.nodes), int(self.col.max()) + 1)
         self.removed_count = 0
 
     def remove_rows(self, contigs):
@@ -212,14 +432,21 @@ class HyperGraph:
         return matrix 
 
     @staticmethod
-    def clique_expansion_init(H, P_allelic_idx=None, 
-                              P_weak_idx=None, 
-                              NW=None,
-                              W=None,
-                              allelic_factor=-1,
-                              min_weight=0.1):
+    def clique_expansion(H, W=None):
         """
-        clique expansion/reduction
+        raw clique expansion `H W D_e^-1 H^T` of hypergraph, 
+            without normalization, filter and prune.
+
+        Params:
+        --------
+        H: csr_matrix
+            incidence matrix of hypergraph
+        W: dia_matrix, default None
+            weight of hyperedges
+
+        Returns:
+        --------
+        csr_matrix
         """
         m = H.shape[1]
 
@@ -243,11 +470,30 @@ class HyperGraph:
         else:
             A = H.dot(D_e_inv).dot(H.T)
 
+        return A
+
+    @staticmethod
+    def clique_expansion_init(H, P_allelic_idx=None, 
+                              P_weak_idx=None, 
+                              NW=None,
+                              W=None,
+                              allelic_factor=-1,
+                              min_weight=0.1,
+                              A=None):
+        """
+        clique expansion/reduction
+
+        Params:
+        --------
+        A: csr_matrix, default None
+            raw clique expansion of `H`, e.g. from `CliqueExpansionCache`,
+            computed from `H` if None
+        """
+        if A is None:
+            A = HyperGraph.clique_expansion(H, W)
+
         if NW is not None:
-            A = A.toarray() * NW
-            row, col = np.nonzero(A)
-            values = A[row, col]
-            A = csr_matrix((values, (row, col)), shape=A.shape)
+            A = normalize_adjacency(A, NW)
 
         if min_weight > 0:
             mask = A >= min_weight
@@ -255,22 +501,8 @@ class HyperGraph:
             # mask += (A <= -min_weight).astype(bool)
             A = A.multiply(mask)
     
-        if P_allelic_idx or P_weak_idx:
-            # P = np.ones((H.shape[0], H.shape[0]), dtype=np.int8)
-            # P[np.diag_indices_from(P)] = 0
-            # P[P_idx[0], P_idx[1]] = 0
-            # A = A * P 
-            A = A.tolil()
-            if P_allelic_idx:
-                if allelic_factor == 0: 
-                    A[P_allelic_idx[0], P_allelic_idx[1]] = 0
-                else:
-                    A[P_allelic_idx[0], P_allelic_idx[1]] *= allelic_factor
-            
-            if P_weak_idx:
-                A[P_weak_idx[0], P_weak_idx[1]] = 0 
-                
-            A = A.tocsr()
+        A = prune_adjacency(A, P_allelic_idx, P_weak_idx,
+                            allelic_factor, cross_allelic_factor=0)
 
         # if P_allelic_idx or P_weak_idx:
         #     A = A.tocoo()
@@ -419,7 +651,321 @@ def extract_incidence_matrix2(mat, idx):
 
     return A, remove_edges_idx, non_zero_edges_idx
 
-def remove_incidence_matrix(mat, idx):   
+def normalize_adjacency(A, weight):
+    """
+    scale each A_ij by weight_i * weight_j through sparse diagonal products, 
+        A is never densified.
+
+    Params:
+    --------
+    A: csr_matrix
+        n x n adjacency matrix of clique expansion
+    weight: np.array
+        vector of length n
+
+    Returns:
+    --------
+    csr_matrix:
+        normalized adjacency matrix, explicit zeros are removed.
+
+    Examples:
+    --------
+    >>> normalize_adjacency(A, 1 / contig_lengths)
+    """
+    n = A.shape[0]
+    weight = np.asarray(weight).ravel()
+    assert len(weight) == n, "The length of weight must be equal to the number of vertices."
+
+    D = dia_matrix((weight, np.array([0])), shape=(n, n))
+    A = (D @ A @ D).tocsr()
+    A.eliminate_zeros()
+
+    return A
+
+
+class SharedIncidenceMatrix:
+    """
+    A CSR incidence matrix published once as memory-mapped `.npy` files,
+        only the file paths are pickled into the workers, and each worker
+        attach to the same pages zero-copy through `load`.
+
+    Params:
+    --------
+    H: csr_matrix
+        incidence matrix of hypergraph
+    workdir: str
+        directory to store the `.npy` files, prefer to a tmpfs like `/dev/shm`,
+            fallback to the system temporary directory if writing failed
+
+    Examples:
+    --------
+    >>> shared_H = SharedIncidenceMatrix(H, tmpdir)
+    >>> sub_H, _, _ = extract_incidence_matrix2(shared_H.load(), idx)
+    """
+    FIELDS = ("data", "indices", "indptr")
+
+    def __init__(self, H, workdir):
+        if not isinstance(H, csr_matrix):
+            H = csr_matrix(H)
+
+        self.shape = H.shape
+        self.workdir = str(workdir)
+        self.fallback_dir = None
+        try:
+            self.save(H)
+        except OSError as e:
+            ## e.g. no space left on a small `/dev/shm`
+            if os.path.realpath(self.workdir).startswith(os.path.realpath(tempfile.gettempdir())):
+                raise e
+            self.remove()
+            self.fallback_dir = tempfile.mkdtemp(prefix="shared_H_")
+            logger.warning(f"Failed to write the shared matrix into `{self.workdir}` ({e}), "
+                           f"fallback to `{self.fallback_dir}`.")
+            self.workdir = self.fallback_dir
+            try:
+                self.save(H)
+            except OSError:
+                self.remove()
+                raise
+
+    def save(self, H):
+        for name in self.FIELDS:
+            np.save(f"{self.workdir}/{name}.npy", getattr(H, name))
+
+    def load(self):
+        """
+        attach to the memory-mapped arrays without copy, the returned matrix is read-only
+        """
+        data, indices, indptr = [np.load(f"{self.workdir}/{name}.npy", mmap_mode='r')
+                                    for name in self.FIELDS]
+
+        return csr_matrix((data, indices, indptr), shape=self.shape, copy=False)
+
+    def remove(self):
+        """
+        remove the `.npy` files, and the fallback directory if it was created
+        """
+        for name in self.FIELDS:
+            try:
+                os.remove(f"{self.workdir}/{name}.npy")
+            except FileNotFoundError:
+                pass
+        
+        if self.fallback_dir:
+            shutil.rmtree(self.fallback_dir, ignore_errors=True)
+
+    @staticmethod
+    def nbytes(*matrices):
+        """
+        bytes of the `.npy` files of matrices, None is skipped
+        """
+        return sum(getattr(H, name).nbytes for H in matrices if H is not None 
+                        for name in SharedIncidenceMatrix.FIELDS)
+
+    @staticmethod
+    def shared_dir(nbytes=0):
+        """
+        return `/dev/shm` if it is writable and has free space for `nbytes`,
+            otherwise the system temporary directory
+        """
+        shm = "/dev/shm"
+        if os.path.isdir(shm) and os.access(shm, os.W_OK):
+            free = shutil.disk_usage(shm).free
+            if free > nbytes * 1.05:
+                return shm
+            
+            logger.debug(f"Only {free} bytes free in `{shm}`, {nbytes} bytes are required, "
+                         "use the temporary directory instead.")
+
+        return tempfile.gettempdir()
+
+
+class CliqueExpansionCache:
+    """
+    Cache of the raw clique expansion `H D_e^-1 H^T`, keyed by 
+        (min_quality, vertex subset). The normalization, `min_weight` filter 
+        and prune are applied on top of it by `HyperGraph.clique_expansion_init`,
+        so one expansion serves all of them. The expansion of a sub-group is 
+        sliced from its parent when no hyperedge crosses the sub-group.
+        With `cache_dir`, expansions are also stored as `.npz` files, 
+        and reused by the next run on the same hypergraph.
+
+    Params:
+    --------
+    cache_dir: str, default None
+        directory of on-disk cache
+    maxsize: int, default 2
+        number of expansions kept in memory
+
+    Examples:
+    --------
+    >>> cache = CliqueExpansionCache("expansion_cache")
+    >>> A = HyperGraph.clique_expansion_init(H, A=cache.get(H, vertices, 1))
+    >>> sub_H = cache.subset(H, idx, vertices, 1)
+    """
+    def __init__(self, cache_dir=None, maxsize=2):
+        self.cache_dir = str(cache_dir) if cache_dir else None
+        self.maxsize = maxsize
+        self.db = OrderedDict()
+        self.keys = []
+        self.orders = (None, None)
+        
+        if self.cache_dir:
+            Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+
+    def __getstate__(self):
+        ## workers only share the on-disk cache
+        state = self.__dict__.copy()
+        state['db'] = OrderedDict()
+        state['keys'] = []
+        state['orders'] = (None, None)
+
+        return state
+
+    def key(self, H, vertices, min_quality=1):
+        """
+        key of (min_quality, vertex subset), the hyperedges of `H` and their 
+            counts are also hashed, so that the on-disk cache is invalid once 
+            the hypergraph changed. The keys of the latest matrices are remembered 
+            by weak references, which do not keep the matrices alive.
+        """
+        for _H, _vertices, _min_quality, key in self.keys:
+            if _H() is H and _vertices is vertices and _min_quality == min_quality:
+                return key
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{min_quality}\t{H.shape[0]}\t{H.shape[1]}\n".encode())
+        h.update("\n".join(map(str, vertices)).encode())
+        h.update(np.ascontiguousarray(H.indptr))
+        h.update(np.ascontiguousarray(H.indices))
+        h.update(f"{H.data.dtype.str}\n".encode())
+        h.update(np.ascontiguousarray(H.data))
+        key = h.hexdigest()
+
+        self.keys.insert(0, (weakref.ref(H), vertices, min_quality, key))
+        del self.keys[self.maxsize:]
+
+        return key
+
+    def lookup(self, key):
+        """
+        return the cached expansion or None
+        """
+        if key in self.db:
+            self.db.move_to_end(key)
+            return self.db[key]
+        
+        if self.cache_dir and os.path.exists(f"{self.cache_dir}/{key}.npz"):
+            A = load_npz(f"{self.cache_dir}/{key}.npz").tocsr()
+            self.store(key, A, save=False)
+            logger.debug(f"Load clique expansion from `{self.cache_dir}/{key}.npz`.")
+            return A
+
+        return None
+
+    def store(self, key, A, save=True):
+        self.db[key] = A
+        self.db.move_to_end(key)
+        while len(self.db) > self.maxsize:
+            self.db.popitem(last=False)
+
+        if save and self.cache_dir:
+            ## write to a temporary file first, workers may store the same key
+            tmp = f"{self.cache_dir}/{key}.{os.getpid()}.tmp.npz"
+            save_npz(tmp, A, compressed=False)
+            os.replace(tmp, f"{self.cache_dir}/{key}.npz")
+
+    def get(self, H, vertices, min_quality=1):
+        """
+        raw clique expansion of `H`, computed once for each key
+
+        Params:
+        --------
+        H: csr_matrix
+            incidence matrix of hypergraph
+        vertices: list or np.array
+            names of the rows of `H`
+        min_quality: int, default 1
+            minimum mapping quality of hyperedges
+        
+        Returns:
+        --------
+        csr_matrix
+        """
+        key = self.key(H, vertices, min_quality)
+        A = self.lookup(key)
+        if A is None:
+            A = HyperGraph.clique_expansion(H).tocsr()
+            self.store(key, A)
+
+        return A
+
+    def subset(self, H, idx, vertices, min_quality=1, parent_A=None, parent_key=None,
+               sub_vertices=None):
+        """
+        incidence matrix of the sub-group `idx`, the expansion of sub-group is
+            sliced from the expansion of `H` when all hyperedges of `H` 
+            touching the sub-group lie within it, then the hyperedge filter 
+            of `extract_incidence_matrix2` keeps their orders unchanged.
+
+        Params:
+        --------
+        H: csr_matrix
+            incidence matrix of hypergraph
+        idx: np.array
+            row index of sub-group
+        vertices: list or np.array
+            names of the rows of `H`, may be None when `sub_vertices` is given,
+            then the expansion of `H` is only sliced with `parent_key`
+        min_quality: int, default 1
+            minimum mapping quality of hyperedges
+        parent_A: csr_matrix, default None
+            raw clique expansion of `H`, looked up from cache if None
+        parent_key: str, default None
+            key of `H`, computed once by the caller and passed into the workers,
+            so that `H` is not hashed again in each worker
+        sub_vertices: list or np.array, default None
+            names of the rows `idx`, so that the workers do not need 
+            the names of all rows of `H`
+        
+        Returns:
+        --------
+        csr_matrix:
+            incidence matrix of sub-group
+        """
+        idx = np.asarray(idx)
+        sub_H, _, edge_idx = extract_incidence_matrix2(H, idx)
+        if sub_vertices is None:
+            sub_vertices = np.asarray(vertices)[idx]
+        sub_key = self.key(sub_H, sub_vertices, min_quality)
+        if sub_key in self.db:
+            return sub_H
+
+        if parent_key is None and vertices is None:
+            return sub_H
+
+        key = parent_key if parent_key is not None else self.key(H, vertices, min_quality)
+        if parent_A is None:
+            parent_A = self.lookup(key)
+        if parent_A is None:
+            return sub_H
+        
+        ## the orders of hyperedges are shared by the sub-groups of H
+        if self.orders[0] != key:
+            self.orders = (key, np.bincount(H.indices, minlength=H.shape[1]))
+
+        ## no hyperedge has only one vertex in sub-group, 
+        ## and the retained hyperedges are not shrunk
+        is_closed = (np.diff(H.indptr)[idx].sum() == sub_H.nnz 
+                     and np.array_equal(np.bincount(sub_H.indices, minlength=sub_H.shape[1]),
+                                        self.orders[1][edge_idx]))
+        if is_closed:
+            self.store(sub_key, parent_A[idx][:, idx], save=False)
+            
+        return sub_H
+
+
+def remove_incidence_matrix(mat, idx):
     if not isinstance(mat, csr_matrix):
         raise ValueError("works only for CSR format -- use .tocsr() first")
     
@@ -431,6 +977,128 @@ def remove_incidence_matrix(mat, idx):
 
     return mat.T.tocsr(), remove_col_index
 
+_PRUNE_KEYS_CACHE = []
+
+def prune_pair_keys(P_idx, n):
+    """
+    sorted unique keys (`contig1_idx * n + contig2_idx`) of prune pairs, 
+        the keys of the latest pair lists are cached by the digest of their 
+        contents, so that the retries of resolution do not sort the same pairs 
+        again, while mutated or reused lists are never served stale keys.
+
+    Params:
+    --------
+    P_idx: list
+        [contig1_idx, contig2_idx] of prune pairs
+    n: int
+        number of columns of adjacency matrix
+    
+    Returns:
+    --------
+    np.ndarray:
+        read-only keys
+    """
+    rows = np.ascontiguousarray(P_idx[0], dtype=np.int64)
+    cols = np.ascontiguousarray(P_idx[1], dtype=np.int64)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{n}\t{len(rows)}\t{len(cols)}\n".encode())
+    h.update(rows)
+    h.update(cols)
+    digest = h.digest()
+    for _digest, keys in _PRUNE_KEYS_CACHE:
+        if _digest == digest:
+            return keys
+
+    keys = np.unique(rows * n + cols)
+    keys.flags.writeable = False
+    
+    _PRUNE_KEYS_CACHE.insert(0, (digest, keys))
+    del _PRUNE_KEYS_CACHE[4:]
+
+    return keys
+
+
+def pair_positions(A, keys):
+    """
+    positions in `A.data` of the stored entries of the sorted pair keys.
+
+    Params:
+    --------
+    A: csr_matrix
+        adjacency matrix with sorted indices
+    keys: np.ndarray
+        sorted keys from `prune_pair_keys`
+
+    Returns:
+    --------
+    np.ndarray
+    """
+    n = A.shape[1]
+    entry_keys = (np.repeat(np.arange(A.shape[0], dtype=np.int64), np.diff(A.indptr)) * n
+                    + A.indices)
+    pos = np.searchsorted(entry_keys, keys)
+    valid = pos < len(entry_keys)
+    pos = pos[valid]
+
+    return pos[entry_keys[pos] == keys[valid]]
+
+
+def prune_adjacency(A, P_allelic_idx=None, P_weak_idx=None,
+                    allelic_factor=-1, cross_allelic_factor=0.3):
+    """
+    scale the weight of allelic and cross-allelic contig pairs.
+        The pairs are edited on `A.data` of a csr copy, 
+        only the stored entries are touched.
+
+    Params:
+    --------
+    A: csr_matrix
+        adjacency matrix of clique expansion
+    P_allelic_idx: list, default None
+        [contig1_idx, contig2_idx] of allelic pairs
+    P_weak_idx: list, default None
+        [contig1_idx, contig2_idx] of cross-allelic pairs
+    allelic_factor: float, default -1
+        factor of allelic pairs, 0 means remove
+    cross_allelic_factor: float, default 0.3
+        factor of cross-allelic pairs, 0 means remove
+
+    Returns:
+    --------
+    csr_matrix
+    """
+    if not (P_allelic_idx or P_weak_idx):
+        return A
+
+    A = A.tocsr(copy=True)
+    A.sort_indices()
+    n = A.shape[1]
+    drop = []
+    for P_idx, factor in ((P_allelic_idx, allelic_factor), 
+                          (P_weak_idx, cross_allelic_factor)):
+        if not P_idx:
+            continue
+        pos = pair_positions(A, prune_pair_keys(P_idx, n))
+        if factor == 0:
+            A.data[pos] = 0
+        else:
+            ## scale in float64 as the fancy assignment of scipy does
+            A.data[pos] = A.data[pos].astype(np.float64) * factor
+        drop.append(pos[A.data[pos] == 0])
+
+    ## only the pruned pairs are removed, other explicit zeros are kept
+    drop = np.concatenate(drop)
+    if len(drop):
+        keep = np.ones(A.nnz, dtype=bool)
+        keep[drop] = False
+        rows = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+        row_nnz = np.bincount(rows[keep], minlength=A.shape[0])
+        A = csr_matrix((A.data[keep], A.indices[keep], 
+                        np.r_[0, np.cumsum(row_nnz)]), shape=A.shape)
+        
+    return A
+
+
 def IRMM(H, A=None,
             NW=None, 
             P_allelic_idx=None,
@@ -515,17 +1183,12 @@ def IRMM(H, A=None,
             # mask = (A >= min_weight).astype(bool)
             # mask += (A <= -min_weight).astype(bool)
             A = A.multiply(mask)
-        # normalization
+        # normalization, A_ij / sqrt(A_ii * A_jj)
         if NW is not None:
-            A = A.toarray()
-            diag_A = np.diagonal(A)
-            NW = 1 / np.sqrt(np.outer(diag_A, diag_A))
-            np.fill_diagonal(NW, 1)
-
-            A = A * NW
-            row, col = np.nonzero(A)
-            values = A[row, col]
-            A = csr_matrix((values, (row, col)), shape=A.shape, dtype=np.float32)
+            diag_A = A.diagonal()
+            inv_sqrt_diag = np.zeros(len(diag_A), dtype=np.float32)
+            inv_sqrt_diag[diag_A > 0] = 1 / np.sqrt(diag_A[diag_A > 0])
+            A = normalize_adjacency(A, inv_sqrt_diag).astype(np.float32)
 
         A.setdiag(0)
         A.prune()
@@ -535,38 +1198,12 @@ def IRMM(H, A=None,
             gc.collect() 
 
         raw_A = A.copy()
-        if P_allelic_idx or P_weak_idx:
-            A = A.tolil()
-            if P_allelic_idx:
-        
-                if allelic_factor == 0: 
-                    A[P_allelic_idx[0], P_allelic_idx[1]] = 0
-                else:
-                    A[P_allelic_idx[0], P_allelic_idx[1]] *= allelic_factor
-            if P_weak_idx:
-                if cross_allelic_factor == 0:
-                    A[P_weak_idx[0], P_weak_idx[1]] = 0
-                else:
-                    A[P_weak_idx[0], P_weak_idx[1]] *= cross_allelic_factor
-                
-            A = A.tocsr()
+        A = prune_adjacency(A, P_allelic_idx, P_weak_idx, 
+                            allelic_factor, cross_allelic_factor)
     else:
         raw_A = A.copy()
-        if P_allelic_idx or P_weak_idx:
-            A = A.tolil()
-            if P_allelic_idx:
-        
-                if allelic_factor == 0: 
-                    A[P_allelic_idx[0], P_allelic_idx[1]] = 0
-                else:
-                    A[P_allelic_idx[0], P_allelic_idx[1]] *= allelic_factor
-            if P_weak_idx:
-                if cross_allelic_factor == 0:
-                    A[P_weak_idx[0], P_weak_idx[1]] = 0
-                else:
-                    A[P_weak_idx[0], P_weak_idx[1]] *= cross_allelic_factor
-                
-            A = A.tocsr()
+        A = prune_adjacency(A, P_allelic_idx, P_weak_idx, 
+                            allelic_factor, cross_allelic_factor)
 
 
     try:
@@ -623,24 +1260,8 @@ def IRMM(H, A=None,
         # A = csr_matrix((values, (row, col)), shape=A.shape)
         # A.setdiag(0)
         # A.prune()
-        if P_allelic_idx or P_weak_idx:
-            # P = np.ones((H.shape[0], H.shape[0]), dtype=np.int8)
-            # P[np.diag_indices_from(P)] = 0
-            # P[P_idx[0], P_idx[1]] = 0
-            # A = A * P 
-            A = A.tolil()
-            if P_allelic_idx:
-                if allelic_factor == 0: 
-                    A[P_allelic_idx[0], P_allelic_idx[1]] = 0
-                else:
-                    A[P_allelic_idx[0], P_allelic_idx[1]] *= allelic_factor
-            if P_weak_idx:
-                if cross_allelic_factor == 0:
-                    A[P_weak_idx[0], P_weak_idx[1]] = 0
-                else:
-                    A[P_weak_idx[0], P_weak_idx[1]] *= cross_allelic_factor
-
-            A = A.tocsr()
+        A = prune_adjacency(A, P_allelic_idx, P_weak_idx, 
+                            allelic_factor, cross_allelic_factor)
 
         try:
             G = ig.Graph.Weighted_Adjacency(A, mode='undirected', loops=False)
@@ -667,3 +1288,106 @@ def IRMM(H, A=None,
         iter_round += 1
     
     return raw_A, A, cluster_assignments, cluster_results
+
+
+def _sweep_community(G, resolution):
+    """
+    single function for louvain community detection on the cached graph.
+    """
+    cluster_assignments = G.community_multilevel(weights='weight', 
+                                                 resolution=resolution)
+    return cluster_assignments.membership
+
+
+def resolution_sweep(H, A, k, 
+                        P_allelic_idx=None,
+                        P_weak_idx=None,
+                        allelic_factor=-1,
+                        cross_allelic_factor=0.3,
+                        init_resolution=0.8,
+                        step=0.2,
+                        max_resolution=10.0,
+                        max_steps=50,
+                        group_filter=None,
+                        threads=1,
+                        verbose=False):
+    """
+    Search the resolution that the number of groups reach `k`.
+        The weighted graph is built only once, and the resolutions of the grid
+        `init_resolution + step * i` are evaluated in contiguous batches of
+        `threads` concurrently. The first resolution that generate >= k groups 
+        is returned, the same one as a linear scan, because the number of groups 
+        is not always increasing with resolution (louvain is random and 
+        `group_filter` may drop groups). 
+        If no resolution reach `k`, the last resolution of the grid is used.
+    
+    Params:
+    --------
+    H: csr_matrix
+        incident matrix of hypergraph
+    A: csr_matrix
+        adjacency matrix of clique expansion
+    k: int
+        expected number of groups
+    group_filter: callable, default None
+        function to filter the groups before counting, e.g. remove short groups
+    max_resolution: float, default 10.0
+        maximum resolution of the grid
+    max_steps: int, default 50
+        maximum number of resolutions in the grid
+    threads: int, default 1
+        number of resolutions evaluated at the same time
+    
+    Returns:
+    --------
+    raw_A, A, cluster_assignments, cluster_results, resolution
+
+    Examples:
+    --------
+    >>> raw_A, A, _, K, resolution = resolution_sweep(H, A, 8, init_resolution=0.8, threads=4)
+    """
+    resolutions = []
+    tmp_resolution = init_resolution
+    while tmp_resolution <= max_resolution and len(resolutions) < max_steps:
+        resolutions.append(tmp_resolution)
+        tmp_resolution += step
+    
+    if not resolutions:
+        resolutions = [init_resolution]
+
+    raw_A = A.copy()
+    A = prune_adjacency(A, P_allelic_idx, P_weak_idx, 
+                        allelic_factor, cross_allelic_factor)
+    try:
+        G = ig.Graph.Weighted_Adjacency(A, mode='undirected', loops=False)
+    except ValueError:
+        return raw_A, A, None, [], resolutions[0]
+    
+    threads = max(1, min(threads, len(resolutions)))
+    best, membership = None, None
+    for lo in range(0, len(resolutions), threads):
+        indices = list(range(lo, min(lo + threads, len(resolutions))))
+        if len(indices) > 1:
+            ## processes, the nested Parallel in loky workers defaults to threads
+            memberships = Parallel(n_jobs=len(indices), backend='loky')(
+                            delayed(_sweep_community)(G, resolutions[i]) for i in indices)
+        else:
+            memberships = [_sweep_community(G, resolutions[i]) for i in indices]
+        
+        ## the first resolution of batch reach `k`, otherwise the last one
+        for best, membership in zip(indices, memberships):
+            cluster_results = list(map(set, ig.VertexClustering(G, membership)))
+            if group_filter is not None:
+                cluster_results = group_filter(cluster_results)
+            if verbose:
+                logger.info(f"Generated `{len(cluster_results)}` groups at resolution `{resolutions[best]:.1f}`.")
+            if len(cluster_results) >= k:
+                break
+        
+        if len(cluster_results) >= k:
+            break
+    
+    cluster_assignments = ig.VertexClustering(G, membership)
+    cluster_results = list(map(set, cluster_assignments))
+    
+    return raw_A, A, cluster_assignments, cluster_results, resolutions[best]
@@ -12,6 +12,7 @@ import os
 import os.path as op
 import sys
 import tempfile
+import time
 import warnings
 warnings.simplefilter('ignore')
 
@@ -32,7 +33,7 @@ import shutil
 
 from collections import defaultdict, OrderedDict, Counter
 from joblib import Parallel, delayed, cpu_count
-from itertools import combinations, permutations, product
+from itertools import combinations, product
 from pathlib import Path
 from pytools import natsorted
 from string import ascii_uppercase, ascii_lowercase
@@ -46,7 +47,11 @@ from ..core import (
                     AlleleTable, 
                     CountRE, 
                     ClusterTable, 
-                    Tour
+                    Tour,
+                    clm_contigs,
+                    clm_text_frame,
+                    is_binary_clm,
+                    split_clm
                     )
 from ..utilities import (
     decompress_cmd,
@@ -68,6 +73,8 @@ class HaplotypeAlign:
     --------
     at: AlleleTable
         AlleleTable with `allele2` format
+    tour_list: list
+        list of tour files or `Tour` objects
     hap_tour_db: dict
         haplotype tour dict 
         {"Chr01": [Tour, Tour, Tour ...],
@@ -85,15 +92,17 @@ class HaplotypeAlign:
     def get_hap_tour_db(self, tour_list):
         db = defaultdict(list)
         for tour in tour_list:
+            if not isinstance(tour, Tour):
+                tour = Tour(tour)
             try:
-                hap, idx = tour.rsplit("g", 1)
+                hap, idx = str(tour.filename).rsplit("g", 1)
             except:
                 if "single" not in db:
                     db['single'] = []    
-                db['single'].append(Tour(tour))
+                db['single'].append(tour)
                 continue
 
-            db[hap].append(Tour(tour))
+            db[hap].append(tour)
 
         return db 
 
@@ -457,6 +466,9 @@ class AllhicOptimize:
     def clm(self):
         # df = pd.read_csv(self.clm_file, sep='\t', header=None, index_col=0)
         
+        if is_binary_clm(self.clm_file):
+            return clm_text_frame(pl.scan_parquet(self.clm_file))
+
         df = pl.scan_csv(self.clm_file, separator='\t', 
                          has_header=False, low_memory=True,
                          dtypes={"column_2": pl.datatypes.UInt32})       
@@ -495,31 +507,18 @@ class AllhicOptimize:
 
     @staticmethod
     def extract_clm(group, contigs, clm):
-        if len(contigs) > 1:
-            contig_pairs = list(permutations(contigs, 2))
-            contig_with_orientation_pairs = set(
-                f"{pair[0]}{strand1} {pair[1]}{strand2}"
-                for pair in contig_pairs
-                for strand1, strand2 in [('+', '+'), ('+', '-'), ('-', '+'), ('-', '-')]
-            )
-            # clm = (pl.scan_csv(clm_file, separator='\t', 
-            #                             has_header=False, low_memory=True,
-            #                             dtypes={"column_2": pl.datatypes.UInt32})
-            #                     .filter(pl.col("column_1")
-            #                     .is_in(contig_with_orientation_pairs)).collect()
-            #                     .write_csv(f"{group}.clm", separator='\t', include_header=False)   
-            #                 )
-
-            # tmp_df = clm.reindex(contig_with_orientation_pairs).dropna().astype({1: int})
-            # tmp_df.to_csv(f"{group}.clm", sep='\t', header=None)
-            # left_df = pl.DataFrame(pl.Series("column_1", contig_with_orientation_pairs))
-            # tmp_df = left_df.join(clm, on=["column_1"], how='left').drop_nulls()
-
-            tmp_df = clm.filter(pl.col("column_1").is_in(contig_with_orientation_pairs)).collect()
-            tmp_df.write_csv(f"{group}.clm", separator='\t', include_header=False)
-        else:
-            with open(f"{group}.clm", 'w') as out:
-                pass 
+        """
+        extract the clm lines of a group from the text clm frame, 
+            see `split_clm` to split all groups in one pass.
+        """
+        contigs = pl.Series(list(map(str, contigs)), dtype=pl.Utf8)
+        tmp_df = (clm.with_columns(clm_contigs())
+                    .filter(pl.col("contig1").is_in(contigs) 
+                            & pl.col("contig2").is_in(contigs)
+                            & (pl.col("contig1") != pl.col("contig2")))
+                    .select("column_1", "column_2", "column_3")
+                    .collect())
+        tmp_df.write_csv(f"{group}.clm", separator='\t', include_header=False)
 
         return f"{group}.clm"
 
@@ -531,18 +530,37 @@ class AllhicOptimize:
 
     @staticmethod
     def _run(allhic_path, count_re, clm, workdir):
+        """
+        run allhic optimize of a group in worker
+
+        Returns:
+        --------
+        tour: Tour or None
+            None if allhic failed to generate the tour
+        elapsed: float
+            wall time of the group
+        """
         os.chdir(workdir)
+        start_time = time.time()
         tmp_res = AllhicOptimize.run_allhic_optimize(allhic_path, count_re, clm)
+        elapsed = time.time() - start_time
+        
+        tour = Tour(tmp_res) if Path(tmp_res).exists() else None 
 
-        return tmp_res
-    
+        return tour, elapsed
+
+    def schedule(self, groups):
+        """
+        order the groups largest-first by the size of their clm, so that the 
+            largest groups are not left to the tail of the parallel run.
+        """
+        def size(group):
+            clm = Path(f"{group}.clm")
+            return (clm.stat().st_size if clm.exists() else 0, 
+                    len(self.clustertable.data[group]))
+        
+        return sorted(groups, key=size, reverse=True)
 
-    @staticmethod
-    def _process_group(args):
-        group, contigs, count_re, allhic_path, workdir = args
-        tmp_count_re = AllhicOptimize.extract_count_re(group, contigs, count_re)
-        tmp_clm = f"{group}.clm"
-        return (allhic_path, tmp_count_re, tmp_clm, workdir)
 
     def run(self):
         from ..cli import build
@@ -554,7 +572,6 @@ class AllhicOptimize:
         args = []
 
         groups = list(self.clustertable.data.keys())
-        args = []
         # for group in groups:
         #     contigs = self.clustertable.data[group]
         #     args.append((group, contigs, clm))
@@ -562,15 +579,15 @@ class AllhicOptimize:
         # clms = Parallel(n_jobs=min(len(args), self.threads))(delayed(
         #     AllhicOptimize.extract_clm)(i, j, k) for i, j, k in args
         # )
-        args = []
         for group in groups:
             contigs = self.clustertable.data[group]
-            args.append((group, contigs, self.count_re, self.allhic_path, workdir))
-        
-        with multiprocessing.Pool(processes=min(10, self.threads)) as pool:
-            args = pool.map(AllhicOptimize._process_group, args)
+            AllhicOptimize.extract_count_re(group, contigs, self.count_re)
  
-        AllhicOptimize.extract_clm_rust(self.clm_file, self.clusterfile, self.log_dir)
+        if is_binary_clm(self.clm_file) or not cmd_exists("cphasing-rs"):
+            logger.info("Splitting clm file ...")
+            split_clm(self.clm_file, self.clustertable.data)
+        else:
+            AllhicOptimize.extract_clm_rust(self.clm_file, self.clusterfile, self.log_dir)
         
         total_cpu_of_machine = cpu_count()
         if self.threads * 2 > total_cpu_of_machine:
@@ -580,9 +597,26 @@ class AllhicOptimize:
             threads = self.threads
 
         logger.info("Running scaffolding in each group ...")
-        tour_res = Parallel(n_jobs=min(len(args), threads))(delayed(
+        args = [(self.allhic_path, f"{group}.txt", f"{group}.clm", workdir) 
+                    for group in self.schedule(groups)]
+        res = Parallel(n_jobs=max(1, min(len(args), threads)), 
+                       return_as="generator_unordered")(delayed(
                         self._run)(i, j, k, l) for i, j, k, l in args)
         
+        tour_db = {}
+        start_time = time.time()
+        for tour, elapsed in res:
+            if tour is None:
+                continue 
+            tour_db[tour.group] = tour
+            logger.info(f"Optimized group `{tour.group}` ({len(tour)} contigs) in {elapsed:.2f}s.")
+        logger.info(f"Optimized {len(tour_db)} groups in {time.time() - start_time:.2f}s.")
+        if len(tour_db) < len(groups):
+            logger.warning(f"Failed to optimize {len(groups) - len(tour_db)} groups, "
+                                f"please check allhic.")
+        
+        tour_res = [tour_db[group] for group in groups if group in tour_db]
+        
         os.chdir(workdir)
         if self.allele_table and len(tour_res) > 1:
             hap_align = HaplotypeAlign(self.allele_table, tour_res, workdir, self.threads)
@@ -677,6 +711,9 @@ class HapHiCSort:
     @property
     def clm(self):
         # df = pd.read_csv(self.clm_file, sep='\t', header=None, index_col=0)
+        if is_binary_clm(self.clm_file):
+            return clm_text_frame(pl.scan_parquet(self.clm_file))
+        
         df = pl.scan_csv(self.clm_file, separator='\t', 
                          has_header=False, low_memory=True,
                          dtypes={"column_2": pl.datatypes.UInt32})   
@@ -713,20 +750,18 @@ class HapHiCSort:
 
     @staticmethod
     def extract_clm(group, contigs, clm):
-        if len(contigs) > 1:
-            contig_pairs = list(permutations(contigs, 2))
-            contig_with_orientation_pairs = set(
-                    f"{pair[0]}{strand1} {pair[1]}{strand2}"
-                    for pair in contig_pairs
-                    for strand1, strand2 in [('+', '+'), ('+', '-'), ('-', '+'), ('-', '-')]
-                )
-            tmp_df = clm.filter(pl.col("column_1").is_in(contig_with_orientation_pairs)).collect()
-
-
-            tmp_df.write_csv(f"{group}.clm", separator='\t', include_header=False)
-        else:
-            with open(f"{group}.clm", 'w') as out:
-                pass 
+        """
+        extract the clm lines of a group from the text clm frame, 
+            see `split_clm` to split all groups in one pass.
+        """
+        contigs = pl.Series(list(map(str, contigs)), dtype=pl.Utf8)
+        tmp_df = (clm.with_columns(clm_contigs())
+                    .filter(pl.col("contig1").is_in(contigs) 
+                            & pl.col("contig2").is_in(contigs)
+                            & (pl.col("contig1") != pl.col("contig2")))
+                    .select("column_1", "column_2", "column_3")
+                    .collect())
+        tmp_df.write_csv(f"{group}.clm", separator='\t', include_header=False)
 
         return f"{group}.clm"
 
@@ -787,7 +822,11 @@ class HapHiCSort:
         with multiprocessing.Pool(processes=min(4, self.threads)) as pool:
             pool.map(HapHiCSort._process_group, args)
         
-        HapHiCSort.extract_clm_rust(self.clm_file, self.clusterfile, self.log_dir)
+        if is_binary_clm(self.clm_file) or not cmd_exists("cphasing-rs"):
+            logger.info("Splitting clm file ...")
+            split_clm(self.clm_file, self.clustertable.data)
+        else:
+            HapHiCSort.extract_clm_rust(self.clm_file, self.clusterfile, self.log_dir)
 
         total_cpu_of_machine = cpu_count()
         if self.threads * 2 > total_cpu_of_machine:
@@ -2083,13 +2122,11 @@ def test_hyperscaffold(args):
     
     args = p.parse_args(args)
 
-    import msgspec 
-    from cphasing.algorithms.hypergraph import HyperEdges, HyperGraph
+    from cphasing.algorithms.hypergraph import HyperGraph, load_hyperedges
 
     contigs = [i.strip() for i in open(args.contig_list)]
     
-    he = msgspec.msgpack.decode(open(args.hg, 'rb').read(), type=HyperEdges)
-    he.to_numpy()
+    he = load_hyperedges(args.hg)
     hg = HyperGraph(he)
 
     hs = HyperScaffolding(hg, contigs)
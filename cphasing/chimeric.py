@@ -29,43 +29,132 @@ from sklearn.metrics import mean_squared_error
 
 try: 
     from .core import PairHeader
-    from .pqs import PQS
+    from .pqs import PQS, contig_lookup, process_chunk_cis_depth
     from .utilities import read_fasta, xopen, run_cmd
 except ImportError:
     pass
 
 logger = logging.getLogger(__name__)
 
+def span_depth(starts, ends, n_bins, dtype=np.int32):
+    """
+    Coverage of closed bin spans over a contig, equal to 
+        `data[start: end + 1] += 1` for each span, but computed by 
+        a difference array and a cumulative sum.
+
+    Params:
+    --------
+    starts: np.ndarray
+        start bin of each span
+    ends: np.ndarray
+        end bin (inclusive) of each span
+    n_bins: int
+        number of bins of the contig
+    dtype: np.dtype
+        dtype of the returned depth
+
+    Returns:
+    --------
+    np.ndarray with length of `n_bins`
+
+    Examples:
+    --------
+    >>> span_depth(np.array([0, 1]), np.array([2, 1]), 4)
+    array([1, 2, 1, 0], dtype=int32)
+    """
+    starts = np.clip(np.asarray(starts, dtype=np.int64), 0, n_bins)
+    ends = np.clip(np.asarray(ends, dtype=np.int64) + 1, 0, n_bins)
+    mask = starts < ends
+    diff = (np.bincount(starts[mask], minlength=n_bins + 1) 
+                - np.bincount(ends[mask], minlength=n_bins + 1))
+    
+    return np.cumsum(diff[:n_bins]).astype(dtype)
+
+
+def contigs_span_depth(contig_idx, starts, ends, n_bins, dtype=np.int64):
+    """
+    Span coverage of many contigs at once, the bins of all contigs are 
+        laid end to end by their offsets, so that a single pair of 
+        bincount is enough for a whole chunk.
+
+    Params:
+    --------
+    contig_idx: np.ndarray
+        contig index of each span
+    starts: np.ndarray
+        start bin of each span
+    ends: np.ndarray
+        end bin (inclusive) of each span
+    n_bins: np.ndarray
+        number of bins of each contig
+    
+    Returns:
+    --------
+    depth: np.ndarray
+        concatenated depth of all contigs, split it by `np.cumsum(n_bins)`
+    observed: np.ndarray
+        bool array of the contigs that have at least one span
+    """
+    n_bins = np.asarray(n_bins, dtype=np.int64)
+    offsets = np.r_[0, np.cumsum(n_bins)]
+    contig_idx = np.asarray(contig_idx, dtype=np.int64)
+    size = n_bins[contig_idx]
+    starts = np.clip(np.asarray(starts, dtype=np.int64), 0, size)
+    ends = np.clip(np.asarray(ends, dtype=np.int64) + 1, 0, size)
+    mask = starts < ends
+    starts = starts[mask] + offsets[contig_idx[mask]]
+    ends = ends[mask] + offsets[contig_idx[mask]]
+    
+    total = int(offsets[-1])
+    diff = (np.bincount(starts, minlength=total + 1) 
+                - np.bincount(ends, minlength=total + 1))
+    depth = np.cumsum(diff[:total]).astype(dtype)
+    observed = np.bincount(contig_idx, minlength=len(n_bins)) > 0
+
+    return depth, observed 
+
+
 def process_chunk(args):
     df, min_mapq, window_size, contigsizes = args
     df = df[df['chrom1'] == df['chrom2']]
-    df.drop('chrom2', axis=1, inplace=True)
+    df = df.drop('chrom2', axis=1)
     if min_mapq > 0:
-        df = df.query('mapq > @min_mapq').drop('mapq')
+        df = df.query('mapq > @min_mapq').drop('mapq', axis=1)
     
-    df['chrom1'] = df['chrom1'].astype('category')
-    mask = df['pos1'] > df['pos2']
-    df['pos1'].mask(mask, df['pos2'], inplace=True)
-    df['pos2'].mask(mask, df['pos1'], inplace=True)
-    df['pos1'] = (df['pos1'] - 1) // window_size
-    df['pos2'] = (df['pos2'] - 1) // window_size
+    pos1 = np.minimum(df['pos1'].values, df['pos2'].values).astype(np.int64)
+    pos2 = np.maximum(df['pos1'].values, df['pos2'].values).astype(np.int64)
+    df = df.assign(pos1=(pos1 - 1) // window_size, 
+                   pos2=(pos2 - 1) // window_size)
 
     depth_dict = {}
-    for contig, tmp_df in df.groupby('chrom1', as_index=True):
-        contig_length = contigsizes[contig]
-        if contig not in depth_dict:
-            depth_dict[contig] = np.zeros(contig_length//window_size, dtype=np.uint32)
-        
-        for pos1, pos2 in tmp_df[['pos1', 'pos2']].values:
-            depth_dict[contig][pos1: pos2+1] +=1
+    for contig, tmp_df in df.groupby('chrom1', sort=False):
+        depth_dict[contig] = span_depth(tmp_df['pos1'].values, tmp_df['pos2'].values,
+                                        contigsizes[contig] // window_size, 
+                                        dtype=np.uint32)
     
     return depth_dict
 
-def _calculate_depth(contig, contig_length, window_size, position_data):
+def process_chunk_pqs_depth(chunk, contigs, n_bins, window_size, 
+                            min_mapq, is_with_mapq):
+    """
+    Cis span coverage of one chunk of .pqs, the result is the 
+        concatenated depth of all contigs, see `contigs_span_depth`.
+    """
+    contig_idx = dict(zip(contigs, range(len(contigs))))
+    df = process_chunk_cis_depth(chunk, window_size, min_mapq, is_with_mapq)
+    df = (df.select(contig_lookup("chrom1", contig_idx, pl.Int64).alias("idx"),
+                    pl.col("pos1").cast(pl.Int64), 
+                    pl.col("pos2").cast(pl.Int64))
+            .drop_nulls("idx")
+            .collect())
+    
+    return contigs_span_depth(df["idx"].to_numpy(), df["pos1"].to_numpy(),
+                              df["pos2"].to_numpy(), n_bins)
 
-    data = np.zeros(contig_length // window_size, dtype=np.int32)
-    for pos1, pos2 in position_data:
-        data[pos1: pos2 + 1] += 1
+def _calculate_depth(contig, contig_length, window_size, position_data):
+    position_data = np.asarray(position_data)
+    data = span_depth(position_data[:, 0], position_data[:, 1], 
+                      contig_length // window_size, dtype=np.int32)
 
     return contig, data 
 
@@ -222,6 +311,58 @@ def calculate_depth(p, contigsizes, window_size=500, output_depth=False, threads
     return res_db
     
 
+def calculate_depth_pqs(pairs, window_size=500, min_mapq=0, threads=4):
+    """
+    Calculate the cis depth of contigs from .pqs chunk by chunk,
+        without collecting the pairs into memory.
+
+    Params:
+    --------
+    pairs: str
+        path of .pqs 
+    window_size: int
+        size of window
+    min_mapq: int
+        minimum mapping quality of pairs
+    threads: int
+        number of workers
+
+    Returns:
+    --------
+    depth_dict: dict
+        contig -> depth array
+    contigsizes: dict
+        contig -> length
+    """
+    p = PQS(pairs, threads=threads)
+    p.init_read()
+    chunks = p.read(return_as="files")
+    contigsizes = p.contigsizes_db
+    is_with_mapq = p._metadata["is_with_mapq"]
+
+    contigs = list(map(str, contigsizes.keys()))
+    n_bins = np.array([contigsizes[contig] // window_size 
+                            for contig in contigsizes], dtype=np.int64)
+    
+    res = Parallel(n_jobs=threads, return_as="generator")(
+        delayed(process_chunk_pqs_depth)(
+            chunk, contigs, n_bins, window_size, min_mapq, is_with_mapq)
+                for chunk in chunks
+    )
+
+    depth = np.zeros(n_bins.sum(), dtype=np.int64)
+    observed = np.zeros(len(contigs), dtype=bool)
+    for chunk_depth, chunk_observed in res:
+        depth += chunk_depth
+        observed |= chunk_observed
+
+    depth = np.split(depth.astype(np.int32), np.cumsum(n_bins)[:-1])
+    depth_dict = {contig: data for contig, data, flag 
+                    in zip(contigsizes.keys(), depth, observed) if flag}
+    
+    return depth_dict, contigsizes
+    
+
 def correct(depth_dict, window_size=500, min_windows=50, threads=4):
     args = []
     for contig in depth_dict:
@@ -492,10 +633,13 @@ def run(fasta, pairs, window_size=500, min_mapq=0,
         p.init_read()
         assert p.is_pairs(pairs) and p.is_pqs(pairs), "The input directory is not a pairs.pqs directory."
         
-        pairs_df, contigsizes = import_pairs_pqs(pairs, window_size=window_size, min_mapq=min_mapq, threads=threads)
-        
-        depth_dict = calculate_depth(pairs_df, contigsizes, window_size=window_size, 
-                                    output_depth=output_depth, threads=threads)
+        depth_dict, contigsizes = calculate_depth_pqs(pairs, window_size=window_size, 
+                                                     min_mapq=min_mapq, threads=threads)
+        if correct_round > 1:
+            pairs_df, _ = import_pairs_pqs(pairs, window_size=window_size, 
+                                           min_mapq=min_mapq, threads=threads)
+        else:
+            pairs_df = None
 
     else:
         if low_memory:
@@ -523,7 +667,7 @@ def run(fasta, pairs, window_size=500, min_mapq=0,
     i = 1
     split_contigsizes = contigsizes.copy()
     new_break_point_res_df_list = []
-    while correct_round - i and pairs_df:
+    while correct_round - i and pairs_df is not None:
         split_contigsizes, split_pairs_df = split_contigs(
                         break_point_res, split_contigsizes, pairs_df, split_num=2)
         split_depth_dict = calculate_depth(
@@ -6,13 +6,8 @@ import logging
 import sys 
 import os
 import os.path as op
-import psutil 
 import re
 
-import numpy as np
-import pandas as pd
-import polars as pl
-
 import rich_click as click
 from rich_click import RichCommand
 from click_didyoumean import DYMGroup, DYMCommandCollection
@@ -20,25 +15,10 @@ from click_didyoumean import DYMGroup, DYMCommandCollection
 from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
-from pytools import natsorted
 from shutil import which
 
 from . import __version__, __epilog__
 from ._config import *
-from .core import (
-    ClusterTable, 
-    CountRE, 
-)
-from .utilities import (
-    compress_cmd,
-    decompress_cmd,
-    export_log,
-    run_cmd,
-    humanized2numeric,
-    to_humanized2,
-    to_humanized3,
-    is_compressed_table_empty,
-    )
 
 logger = logging.getLogger("cphasing")
 
@@ -1042,6 +1022,7 @@ def pipeline(fasta,
 
         
     """
+    from .utilities import export_log
     from .pipeline.pipeline import run 
     
     assert any([(porec_data is not None), (porectable is not None), 
@@ -1577,6 +1558,7 @@ def porec_chrom2contig(
 
     Output : Path of output.
     """
+    import pandas as pd
     from .core import PoreCTable
     # df = pd.read_parquet(pore_c_table)
 
@@ -1643,6 +1625,7 @@ def pairs_chrom2contig(pairs, contig_bed, output):
 
 
     """
+    import pandas as pd
     from .core import Pairs
     
     contig_df = pd.read_csv(contig_bed, 
@@ -1707,6 +1690,7 @@ def pairs2mnd(pairs, output, min_mapq):
 
         Output : Path of output mnd file.
     """
+    from .utilities import run_cmd
     # from .core import Pairs 
     # p = Pairs(pairs)
     # p.to_mnd(output, threads) 
@@ -1740,6 +1724,7 @@ def pairs_intersect(pairs, bed, output):
     
     Output : Path of output.
     """
+    from .utilities import run_cmd
     # from .core import Pairs
     # p = Pairs(pairs)
     # p.intersection(bed, output)
@@ -1785,6 +1770,7 @@ def porec_intersect(table, bed, output, threads):
 
     Output : Path to output pore-c table.
     """
+    from .utilities import run_cmd
     # from .core import PoreCTable
     # pct = PoreCTable(threads)
     # pct.read_table(table)
@@ -1940,6 +1926,8 @@ def chimeric(fasta, pairs, depth, window_size,
     """
     Correct chimeric contigs by contacts.
     """
+    import numpy as np
+    import pandas as pd
     from .chimeric import run, correct
     assert any([pairs, depth]), "Pairs or Depth file must be input."
 
@@ -2111,8 +2099,14 @@ def hcr(fasta, porectable, pairs, depth,
         High confidence regions are identified from contacts.
 
     """
+    import pandas as pd
     from .hitig.hcr.hcr_by_contacts import hcr_by_contacts
-    from .utilities import is_file_changed
+    from .utilities import (
+        decompress_cmd, 
+        is_compressed_table_empty,
+        is_file_changed,
+        run_cmd
+    )
 
     assert porectable or pairs or depth, "The Pore-C table or 4DN pairs or depth file should be provided at least one."
 
@@ -2517,6 +2511,7 @@ def alleles(fasta, output,
     Build allele table by kmer similarity.
 
     """
+    import pandas as pd
     
     from .alleles import PartigAllele
     from .core import AlleleTable, ClusterTable
@@ -3106,7 +3101,7 @@ def hypergraph(contacts,
         Extractor,
         ExtractorSplit
         )
-    from .utilities import read_chrom_sizes
+    from .utilities import humanized2numeric, read_chrom_sizes
 
     contigsizes = read_chrom_sizes(contigsize)
     contigs = contigsizes.index.values.tolist()
@@ -3652,6 +3647,15 @@ def hypergraph(contacts,
     default=1,
     show_default=True
 )
+@click.option(
+    "--expansion-cache",
+    "expansion_cache",
+    metavar="PATH",
+    help="Directory to cache the clique expansions of hypergraph, "
+    "rerun on the same hypergraph (e.g. different resolutions) will skip the expansion.",
+    default=None,
+    show_default=True
+)
 @click.option(
     '-t',
     '--threads',
@@ -3721,6 +3725,7 @@ def hyperpartition(hypergraph,
                     is_recluster_contigs,
                     threshold, 
                     max_round, 
+                    expansion_cache,
                     threads,
                     # chunksize
                     ):
@@ -3734,12 +3739,18 @@ def hyperpartition(hypergraph,
         Output : Path of output clusters.
 
     """
-    import msgspec 
     import re
+    import pandas as pd
+    from .core import ClusterTable
     from .hypergraph import HyperExtractor, Extractor
     from .hyperpartition import HyperPartition
-    from .algorithms.hypergraph import HyperEdges, merge_hyperedges
-    from .utilities import read_chrom_sizes, is_file_changed
+    from .algorithms.hypergraph import load_hyperedges, merge_hyperedges
+    from .utilities import (
+        humanized2numeric, 
+        is_file_changed,
+        read_chrom_sizes, 
+        to_humanized2
+    )
     
     assert not all([porec, pairs]), "confilct parameters, only support one type data"
 
@@ -3878,7 +3889,7 @@ def hyperpartition(hypergraph,
                 logger.warning(f"Load raw hypergraph from existed file of `{hypergraph_path}`, if the {hcr_bed} changed, you should remove this existing hg.")
             else:
                 logger.warning(f"Load raw hypergraph from existed file of `{hypergraph_path}`.")
-            hypergraph = msgspec.msgpack.decode(open(hypergraph_path, 'rb').read(), type=HyperEdges)
+            hypergraph = load_hyperedges(hypergraph_path)
 
     elif pairs:
         contigs = contigsizes.index.values.tolist()
@@ -3898,22 +3909,16 @@ def hyperpartition(hypergraph,
             hypergraph = he.edges
         else:
             logger.warning(f"Load raw hypergraph from exists file of `{hypergraph_path}`, if the input pairs changed, you should remove this existing hg.")
-            hypergraph = msgspec.msgpack.decode(open(hypergraph_path, 'rb').read(), type=HyperEdges)
+            hypergraph = load_hyperedges(hypergraph_path)
         
         
     else:
         logger.info(f"Load raw hypergraph from `{hypergraph}")
-        try:
-            hypergraph = msgspec.msgpack.decode(open(hypergraph, 'rb').read(), type=HyperEdges)
-        except msgspec.ValidationError:
-            raise msgspec.ValidationError(f"`{hypergraph}` is not the hypergraph. Please input correct hypergraph format")
+        hypergraph = load_hyperedges(hypergraph)
             
     if ultra_long and ul_weight:
         logger.info("Load raw hypergraph from ultra-long hypergraph: `{ultra_long}`")
-        try:
-            ultra_long_hypergraph = msgspec.msgpack.decode(open(ultra_long, 'rb').read(), type=HyperEdges)
-        except msgspec.ValidationError:
-            raise msgspec.ValidationError(f"`{ultra_long}` is not the hypergraph. Please input correct hypergraph format")
+        ultra_long_hypergraph = load_hyperedges(ultra_long)
         
         HE_list = [hypergraph]
         for i in range(ul_weight):
@@ -4018,6 +4023,7 @@ def hyperpartition(hypergraph,
                             max_round, 
                             threads, 
                             # chunksize
+                            expansion_cache=expansion_cache
                             )
     
   
@@ -4115,13 +4121,12 @@ def collapsed_rescue(hypergraph, contigsizes, clustertable,
     """
 
     """
-    import msgspec
+    import pandas as pd
     from .collapse import CollapsedRescue
     from .core import AlleleTable, ClusterTable 
-    from .algorithms.hypergraph import HyperEdges, HyperGraph
+    from .algorithms.hypergraph import HyperGraph, load_hyperedges
     
-    hyperedge = msgspec.msgpack.decode(open(hypergraph, 'rb').read(), type=HyperEdges)
-    hyperedge.to_numpy()
+    hyperedge = load_hyperedges(hypergraph)
     hypergraph = HyperGraph(hyperedge, min_quality=2)
     
     at = AlleleTable(alleletable, sort=False, fmt="allele2")
@@ -4208,14 +4213,13 @@ def collapsed_rescue(hypergraph, contigsizes, clustertable,
 def collapsed_rescue2(hypergraph, fasta, agp_file, 
                     collapsed_contigs, ploidy,
                     alleletable, split_contacts, allelic_similarity):
-    import msgspec
+    import pandas as pd
     from .agp import import_agp
     from .collapse import CollapsedRescue2
     from .core import AlleleTable, ClusterTable 
-    from .algorithms.hypergraph import HyperEdges, HyperGraph
+    from .algorithms.hypergraph import HyperGraph, load_hyperedges
     from .utilities import read_chrom_sizes
-    hyperedge = msgspec.msgpack.decode(open(hypergraph, 'rb').read(), type=HyperEdges)
-    hyperedge.to_numpy()
+    hyperedge = load_hyperedges(hypergraph)
     hypergraph = HyperGraph(hyperedge, min_quality=2)
     
     at = AlleleTable(alleletable, sort=False, fmt="allele2")
@@ -4360,6 +4364,8 @@ def scaffolding(clustertable, count_re, clm,
         CLM: Path of clm file.
 
     """
+    import pandas as pd
+    from .utilities import to_humanized3
 
     from .algorithms.scaffolding import AllhicOptimize, HapHiCSort
     
@@ -4427,10 +4433,10 @@ def scaffolding(clustertable, count_re, clm,
     type=click.Path(exists=True)
 )
 def hyperoptimize(hypergraph):
-    import msgspec
-    from cphasing.algorithms.hypergraph import HyperEdges, HyperGraph
+    import numpy as np
+    from cphasing.algorithms.hypergraph import HyperGraph, load_hyperedges
     from cphasing.algorithms.scaffolding import HyperOptimize
-    he = msgspec.msgpack.decode(open(hypergraph,  'rb').read(), type=HyperEdges)
+    he = load_hyperedges(hypergraph)
     HG = HyperGraph(he)
     ho = HyperOptimize(HG, 2)
     order = np.arange(len(HG.nodes))
@@ -4595,6 +4601,7 @@ def rename(ref, fasta, agp, suffix_style,
     show_default=True
 )
 def chromsizes(fasta, output):
+    from .utilities import run_cmd
     cmd = ["cphasing-rs", "chromsizes", f"{fasta}", "-o", f"{output}"]
     flag = run_cmd(cmd)
     assert flag == 0, "Failed to execute command, please check log."
@@ -4689,6 +4696,7 @@ def paf2pairs(paf, contigsizes,
               min_identity, min_length, 
               max_edge,
               min_order, max_order, output):
+    from .utilities import run_cmd
     if not bed:
         cmd = ["cphasing-rs", "paf2pairs", paf, 
              "-q", str(min_mapq), "-p", str(min_identity), 
@@ -4782,6 +4790,7 @@ def paf2porec(paf, bed, min_quality,
               min_identity, min_length, 
               max_edge,
               max_order, output):
+    from .utilities import run_cmd
     if not bed:
         cmd = ["cphasing-rs", "paf2porec",  "-p", str(min_identity), "-M", str(max_order),
                 "-q", str(min_quality), "-l", str(min_length),  paf, 
@@ -4818,6 +4827,7 @@ def porec_merge(porec, output):
         INPUT_POREC_PATH: The porec table generated from `cphasing-rs paf2porec`.
 
     """
+    from .utilities import run_cmd
     import shutil
     if len(porec) == 1:
         logger.warning("Only one porec table, skip merge.")
@@ -4878,6 +4888,7 @@ def porec_merge(porec, output):
 def porec2pairs(porec, min_mapq, 
                 min_order, max_order,
                 contigsizes, output):
+    from .utilities import run_cmd
     cmd = ["cphasing-rs", "porec2pairs", porec, contigsizes, "-q", str(min_mapq),
            "--min-order", str(min_order), "--max-order", str(max_order), "-o", output]
 
@@ -4905,6 +4916,7 @@ def porec2pairs(porec, min_mapq,
     show_default=True
 )
 def bam2paf(bam, secondary, output):
+    from .utilities import run_cmd
     cmd = ["cphasing-rs", "bam2paf", f"{bam}",  
            
             "-o", f"{output}"]
@@ -4941,6 +4953,7 @@ def bam2pairs(bam, min_quality, output):
     Convert bam to pairs file.
         Don't sort the bam file by coordinate; paired read should be lined up.
     """
+    from .utilities import run_cmd
     cmd = ["cphasing-rs", "bam2pairs", f"{bam}",  
            
             "-q", f"{min_quality}", "-o", f"{output}"]
@@ -4996,6 +5009,7 @@ def pairs_filter(pairs, min_quality, whitelist, threads, output):
 
             INPUT_PAIRS_PATH: 4DN pairs files (pairs or pairs.gz).
     """
+    from .utilities import run_cmd
     cmd = ["cphasing-rs", "pairs-filter", f"{pairs}", "-t", f"{threads}",
             "-q", f"{min_quality}", "-o", f"{output}"]
     
@@ -5029,6 +5043,20 @@ def pairs_filter(pairs, min_quality, whitelist, threads, output):
     metavar='Float',
     show_default=True
 )
+@click.option(
+    '--index',
+    help='Build the contig-pair index (`_index`) of output pqs for `PQS.query`.',
+    is_flag=True,
+    default=False,
+    show_default=True
+)
+@click.option(
+    '--sort/--no-sort',
+    'sort_chunks',
+    help='Sort the chunks by (chrom1, chrom2, pos1) and rewrite them with row group statistics.',
+    default=True,
+    show_default=True
+)
 @click.option(
     '-t',
     '--threads',
@@ -5038,7 +5066,8 @@ def pairs_filter(pairs, min_quality, whitelist, threads, output):
     metavar='INT',
     show_default=True,
 )
-def pairs2pqs(pairs, output, chunksize, threads):
+def pairs2pqs(pairs, output, chunksize, index, sort_chunks, threads):
+    from .utilities import decompress_cmd, run_cmd
     from .pqs import PQS
     
     prefix = Path(pairs).stem
@@ -5062,6 +5091,13 @@ def pairs2pqs(pairs, output, chunksize, threads):
     
     assert flag == 0, "Failed to execute command, please check log."
 
+    p = PQS(output, threads=threads)
+    if sort_chunks:
+        p.sort_chunks()
+
+    if index:
+        p.build_index()
+
     # p = PQS(threads=threads)
     # p.from_pairs(pairs=pairs, path=output, chunksize=chunksize)
 
@@ -5100,6 +5136,7 @@ def pairs2pqs(pairs, output, chunksize, threads):
     show_default=True
 )
 def pqs2depth(pqs, binsize, threads, output):
+    from .utilities import to_humanized2
     from .pqs import PQS
     p = PQS(threads=threads)
     p.init_read(pqs)
@@ -5139,6 +5176,8 @@ def pqs2depth(pqs, binsize, threads, output):
 @click.option(
     "-o",
     "--output",
+    help="Output path, binary clm will be written if it ends with `.parquet`, "
+    "default is input_prefix.q{min_mapq}.clm.gz",
     metavar="OUTPUT",
     default=None,
     show_default=True
@@ -5221,7 +5260,7 @@ def pqs2clm(pqs, min_mapq, output, threads):
 def pqs2cool(pqs, binsize, min_mapq, output, 
              threads, low_memory):
     from .pqs import PQS
-    from .utilities import humanized2numeric
+    from .utilities import humanized2numeric, to_humanized2
 
     logger.info(f"Matrix's bin size: {binsize}")
     binsize = humanized2numeric(binsize)
@@ -5313,6 +5352,39 @@ def pqs_intersect(pqs, bed, min_mapq, output, threads):
     p.intersect(chunks, bed, min_mapq=min_mapq, output=output)
 
 
+@cli.command(cls=RichCommand, hidden=HIDDEN, short_help="Build the contig-pair index of pqs file.")
+@click.argument(
+    "pqs",
+    metavar="INPUT_PQS_PATH",
+    type=click.Path(exists=True)
+)
+@click.option(
+    '-t',
+    '--threads',
+    help='Number of threads.',
+    type=int,
+    default=10,
+    metavar='INT',
+    show_default=True,
+)
+def pairs_index(pqs, threads):
+    """
+    Build the `_index` of pqs, which maps each contig pair to the row ranges 
+    of chunks, and enables the fast random access of `PQS.query`.
+
+        Pqs : Path of pairs in `.pqs` format.
+    """
+    from .pqs import PQS 
+
+    p = PQS(pqs, threads=threads)
+    p.init_read()
+    if not p.is_pairs():
+        logger.error("The input file is not a pairs.pqs file.")
+        sys.exit(1)
+
+    p.build_index()
+
+
 
 @cli.command(cls=RichCommand, hidden=HIDDEN, short_help="Convert pairs to clm. (hidden)")
 @click.argument(
@@ -5354,6 +5426,7 @@ def pqs_intersect(pqs, bed, min_mapq, output, threads):
     show_default=True
 )
 def pairs2clm(pairs, min_contacts, min_quality, threads, output):
+    from .utilities import decompress_cmd, run_cmd
     if pairs.endswith(".gz"):
         cmd0 = decompress_cmd(pairs, threads=threads)
         cmd = ["cphasing-rs", "pairs2clm", "-", "-c", f"{min_contacts}", 
@@ -5407,6 +5480,7 @@ def pairs2clm(pairs, min_contacts, min_quality, threads, output):
     show_default=True,
 )
 def pairs2depth(pairs, binsize, min_quality, output, threads):
+    from .utilities import decompress_cmd, run_cmd
     if pairs.endswith(".gz"):
         cmd0 = decompress_cmd(pairs, threads=threads)
         cmd = ["cphasing-rs", "pairs2depth", "-", "-b", f"{binsize}",
@@ -5464,6 +5538,7 @@ def pairs2depth(pairs, binsize, min_quality, output, threads):
 )
 def pairs2contacts(pairs, min_contacts, split_num, 
                    min_quality, output):
+    from .utilities import run_cmd
     cmd = ["cphasing-rs", "pairs2contacts", f"{pairs}", 
            "-c", f"{min_contacts}", "-q", f"{min_quality}",
             "-n", f"{split_num}", "-o", f"{output}"]
@@ -5496,6 +5571,7 @@ def pairs2contacts(pairs, min_contacts, split_num,
 )
 def pairs2mnd(pairs, output, min_mapq):
 
+    from .utilities import run_cmd
     cmd = ["cphasing-rs", "pairs2mnd", pairs, "-o", output, "-q", str(min_mapq)]
     flag = run_cmd(cmd)
     assert flag == 0, "Failed to execute command, please check log."
@@ -5524,6 +5600,7 @@ def pairs_merge(pairs, output):
 
 
     """
+    from .utilities import run_cmd
     if len(pairs) == 0:
         logger.error("At least one pairs file must be specified.")
         return 1
@@ -5616,6 +5693,8 @@ def pairs2cool(pairs, chromsize, outcool,
 
         OUT_COOL_PATH : Output path of cool file.
     """
+    import psutil
+    from .utilities import humanized2numeric, to_humanized2
     from subprocess import PIPE, Popen
     from cooler.cli.cload import pairs as cload_pairs
     from .core import Pairs2
@@ -5769,6 +5848,7 @@ def pairs2cool2(pairs, outcool,
 
         OUT_COOL_PATH : Output path of cool file.
     """
+    from .utilities import humanized2numeric
     from .core import Pairs2 
 
     logger.info(f"Load pairs: `{pairs}`.")
@@ -6139,6 +6219,9 @@ def plot(matrix,
     cphasing plot -m sample.100k.cool -c Chr01,Chr02 -o Chr01_Chr02.100k.png
     ```
     """
+    import numpy as np
+    from pytools import natsorted
+    from .utilities import humanized2numeric, to_humanized2
     import cooler
     from .plot import (
         adjust_matrix,
@@ -7104,6 +7187,7 @@ def countRE2cluster(count_re, output, fofn):
     """
     Convert serveral count RE table to cluster file.
     """
+    from .core import CountRE
     if fofn:
         countREs = [i.strip() for i in open(count_re) if i.strip()]
     else:
@@ -7183,13 +7267,12 @@ def hg2contacts(hypergraph, min_mapq, min_contacts, prunetable, output):
     """
     Convert hypergraph to contacts.
     """
-    import msgspec
-    from .algorithms.hypergraph import HyperEdges, HyperGraph
+    import numpy as np
+    from .algorithms.hypergraph import HyperGraph, load_hyperedges
     from .core import PruneTable
 
    
-    he = msgspec.msgpack.decode(open(hypergraph, 'rb').read(), type=HyperEdges)
-    he.to_numpy()
+    he = load_hyperedges(hypergraph)
     hg = HyperGraph(he, min_quality=min_mapq)
     H = hg.incidence_matrix(min_contacts=min_contacts)
     logger.info(f"Number of edges: {H.shape[1]}")
@@ -22,7 +22,7 @@ import tempfile
 from collections import Counter, OrderedDict, defaultdict
 from joblib import Parallel, delayed
 from itertools import combinations
-from multiprocessing import Process, Pool
+from multiprocessing import Process
 from pathlib import Path
 from pandarallel import pandarallel
 from subprocess import check_call, Popen, PIPE
@@ -32,6 +32,7 @@ from .expection import *
 from .utilities import (
     binnify,
     decompress_cmd,
+    is_file_changed,
     list_flatten, 
     tail, 
     xopen, 
@@ -1227,6 +1228,177 @@ class ClusterTable:
         return self.data[key]
 
 
+CLM_ORIENTATIONS = ["++", "+-", "-+", "--"]
+CLM_SCHEMA = {"contig1": pl.Utf8, "contig2": pl.Utf8, "orientation": pl.Utf8, 
+              "count": pl.UInt32, "distances": pl.List(pl.Int64)}
+
+
+def is_binary_clm(path):
+    """
+    binary clm is a parquet file with columns of 
+    contig1, contig2, orientation, count and distances (list)
+    """
+    return str(path).endswith(".parquet")
+
+
+def clm_text_frame(clm):
+    """
+    Format the binary clm into the three columns of text clm, 
+    e.g. "ctg1+ ctg2-", 3, "1000 2000 3000".
+
+    Params:
+    --------
+    clm: pl.LazyFrame or pl.DataFrame
+        binary clm
+
+    Returns:
+    --------
+    frame with columns of column_1, column_2 and column_3
+    """
+    return clm.select(
+        pl.concat_str([
+            pl.col("contig1"), pl.col("orientation").str.slice(0, 1),
+            pl.lit(" "),
+            pl.col("contig2"), pl.col("orientation").str.slice(1, 1)
+        ]).alias("column_1"),
+        pl.col("count").cast(pl.UInt32).alias("column_2"),
+        pl.col("distances").list.eval(pl.element().cast(pl.Utf8)).list.join(" ").alias("column_3")
+    )
+
+
+def write_clm(clm, output):
+    """
+    Write the binary clm frame into `output`, which is binary if it ends with 
+    `.parquet`, otherwise text (gzip compressed if ends with `.gz`).
+    `clm` can also be an iterable of frames, e.g. the buckets of 
+    `merge_clm_chunks`, which are written one by one.
+    """
+    import gzip 
+
+    if isinstance(clm, (pl.DataFrame, pl.LazyFrame)):
+        if is_binary_clm(output):
+            clm.lazy().collect().write_parquet(output)
+            return 
+        frames = [clm]
+    else:
+        frames = clm
+
+    if is_binary_clm(output):
+        import pyarrow.parquet as pq
+
+        writer = None
+        for df in frames:
+            table = df.lazy().collect().to_arrow()
+            if writer is None:
+                writer = pq.ParquetWriter(output, table.schema)
+            writer.write_table(table)
+        
+        if writer is not None:
+            writer.close()
+        else:
+            pl.DataFrame(schema=CLM_SCHEMA).write_parquet(output)
+        return
+    
+    open_func = gzip.open if str(output).endswith(".gz") else open
+    kwargs = {"compresslevel": 6} if str(output).endswith(".gz") else {}
+    with open_func(output, "wb", **kwargs) as out:
+        for df in frames:
+            clm_text_frame(df).lazy().collect().write_csv(out, separator="\t", 
+                                                          include_header=False)
+
+
+def clm_contigs(column="column_1"):
+    """
+    Expressions of contig1 and contig2 parsed from the first column 
+    of text clm, e.g. "ctg1+ ctg2-" -> "ctg1", "ctg2".
+    """
+    pair = pl.col(column).str.split_exact(" ", 1)
+    return [pair.struct.field("field_0").str.head(-1).alias("contig1"),
+            pair.struct.field("field_1").str.head(-1).alias("contig2")]
+
+
+def iter_clm_text(clm, chunksize=2**24):
+    """
+    Read the text clm (plain or gzip compressed) in chunks of about 
+    `chunksize` bytes, all the three columns are kept as string.
+
+    Params:
+    --------
+    clm: str
+        path of text clm
+    chunksize: int
+        bytes of text in each chunk
+
+    Returns:
+    --------
+    generator of pl.DataFrame with columns of column_1, column_2 and column_3
+    """
+    with xopen(clm, 'r') as fp:
+        while True:
+            lines = fp.readlines(chunksize)
+            if not lines:
+                break 
+            yield pl.read_csv("".join(lines).encode(), separator="\t", has_header=False,
+                              new_columns=["column_1", "column_2", "column_3"],
+                              schema_overrides=[pl.Utf8, pl.Utf8, pl.Utf8])
+
+
+def split_clm(clm, groups, outdir=".", chunksize=2**24):
+    """
+    Split the clm into `{group}.clm` text files of each group in one pass, 
+    the alternative of `cphasing-rs splitclm`. 
+    Each contig is mapped to its group, and the lines whose two contigs are 
+    in the same group are appended to the output of that group.
+
+    Params:
+    --------
+    clm: str
+        path of clm, text (plain or gzip compressed) or binary
+    groups: dict
+        group -> contigs, e.g. `ClusterTable.data`
+    outdir: str
+        output directory
+    chunksize: int
+        bytes of text clm that read in each chunk
+    
+    Examples:
+    --------
+    >>> ct = ClusterTable("groups.clusters.txt")
+    >>> split_clm("sample.clm.gz", ct.data)
+    """
+    contig_group = pl.DataFrame({
+        "contig": [contig for contigs in groups.values() for contig in contigs],
+        "group": [str(group) for group, contigs in groups.items() for _ in contigs]
+    }, schema={"contig": pl.Utf8, "group": pl.Utf8})
+
+    if is_binary_clm(clm):
+        frames = [pl.read_parquet(clm).select(pl.col("contig1").cast(pl.Utf8), 
+                                              pl.col("contig2").cast(pl.Utf8), 
+                                              pl.all().exclude("contig1", "contig2"))]
+        to_text = clm_text_frame
+    else:
+        frames = (df.with_columns(clm_contigs()) for df in iter_clm_text(clm, chunksize))
+        to_text = lambda df: df.select("column_1", "column_2", "column_3")
+
+    outputs = {str(group): open(f"{outdir}/{group}.clm", "w") for group in groups}
+    try:
+        for df in frames:
+            df = (
+                df.join(contig_group.rename({"contig": "contig1", "group": "group1"}), 
+                        on="contig1", how="inner")
+                  .join(contig_group.rename({"contig": "contig2", "group": "group2"}), 
+                        on="contig2", how="inner")
+                  .filter((pl.col("group1") == pl.col("group2")) 
+                          & (pl.col("contig1") != pl.col("contig2")))
+            )
+            for (group, ), tmp_df in df.partition_by("group1", as_dict=True).items():
+                to_text(tmp_df).write_csv(outputs[group], separator="\t", 
+                                          include_header=False)
+    finally:
+        for output in outputs.values():
+            output.close()
+
+
 class ClmLine():
     def __init__(self, line):
         self.line = line.strip()
@@ -1249,6 +1421,33 @@ class ClmLine():
         return self.line
  
 class Clm(object):
+    """
+    Object of clm file, both text (`.clm`, `.clm.gz`) and binary clm are supported.
+
+    The clm is converted once into a columnar cache `.{clm}.cache` beside it, 
+        which contains the records hashed into buckets by contig1 and sorted 
+        by contig pair within each bucket, so the records of a contig pair 
+        are contiguous (`data.parquet`), 
+        the row offsets of each contig pair (`_index.parquet`), 
+        and the md5 of clm (`md5.txt`), the cache will be rebuilt 
+        once the md5 changed, see `is_file_changed`.
+
+    Params:
+    --------
+    clmfile: str
+        path of clm
+    
+    Examples:
+    --------
+    >>> clm = Clm("sample.clm.gz")
+    >>> clm.count_db()
+    >>> clm[("utg001", "utg002")]
+    >>> clm.extract(["utg001", "utg002", "utg003"])
+    """
+    CACHE_ROW_GROUP_SIZE = 2**16
+    CACHE_TEXT_CHUNKSIZE = 2**24
+    CACHE_BUCKET_SIZE = 2**26
+
     def __init__(self, clmfile, mem_cache='.'):
         
         self.file = clmfile
@@ -1257,6 +1456,11 @@ class Clm(object):
         # self.memory = Memory(mem_cache, verbose=0)
         # self.dk_df = self.memory.cache(self._dk_df)
 
+    @property
+    def cache_dir(self):
+        path = Path(self.file).absolute()
+        return path.parent / f".{path.name}.cache"
+
     def count_db(self, count_re=None):
         """
         generate a dictionary containing the contacts of contig pairs
@@ -1276,46 +1480,256 @@ class Clm(object):
         >>> clm.count_db(cr) ## normalized by the distance between contigs
         {"ctg1": 0.5, "ctg2": 0.8}
         """
-        db = {}
-        with open(self.file, 'r') as fp:
-            for line in fp:
-                cl = ClmLine(line)
-                if (cl.ctg1, cl.ctg2) in db:
-                    continue
-                if count_re:
-                    try:
-                        l1 = count_re.data.loc[cl.ctg1]['Length']
-                        l2 = count_re.data.loc[cl.ctg2]['Length']
-                    except KeyError:
-                        continue
-                    value = cl.count / ((l1 + l2) / 2)
-                else:
-                    value = cl.count
-                db[(cl.ctg1, cl.ctg2)] = value
+        df = self.index.select("contig1", "contig2", 
+                               pl.col("count").cast(pl.Float64).alias("value"))
+        if count_re:
+            lengths = pl.DataFrame({
+                "contig": count_re.data.index.astype(str).tolist(),
+                "length": count_re.data['Length'].tolist()
+            }, schema={"contig": pl.Utf8, "length": pl.Float64})
+            df = (
+                df.join(lengths.rename({"contig": "contig1", "length": "l1"}), 
+                        on="contig1", how="inner")
+                  .join(lengths.rename({"contig": "contig2", "length": "l2"}), 
+                        on="contig2", how="inner")
+                  .select("contig1", "contig2", 
+                          pl.col("value") / ((pl.col("l1") + pl.col("l2")) / 2))
+            )
+        else:
+            df = df.with_columns(pl.col("value").cast(pl.Int64))
             
-        return db
+        return dict(zip(zip(df["contig1"], df["contig2"]), df["value"]))
 
+    def iter_lines(self):
+        """
+        iterate the lines of clm, both text and binary clm are supported
+        """
+        if is_binary_clm(self.file):
+            for line in clm_text_frame(pl.scan_parquet(self.file)).collect().iter_rows():
+                yield ClmLine("\t".join(map(str, line)))
+        else:
+            with xopen(self.file, 'r') as fp:
+                for line in fp:
+                    yield ClmLine(line)
+
+    def _iter_text_frames(self):
+        """
+        read the text clm in chunks, and parse into the frame of binary clm
+        """
+        for df in iter_clm_text(self.file, self.CACHE_TEXT_CHUNKSIZE):
+            pair = pl.col("column_1").str.split_exact(" ", 1)
+            yield df.select(
+                *clm_contigs(),
+                pl.concat_str([pair.struct.field("field_0").str.tail(1),
+                               pair.struct.field("field_1").str.tail(1)]).alias("orientation"),
+                pl.col("column_2").cast(pl.UInt32).alias("count"),
+                pl.col("column_3").str.split(" ").cast(pl.List(pl.Int64)).alias("distances")
+            )
+    
+    def build_cache(self):
+        """
+        convert the clm into the columnar cache, the records are hashed into 
+            buckets of about `CACHE_BUCKET_SIZE` bytes of text by contig1, 
+            and sorted bucket by bucket, so that only a bucket is kept in memory.
+        """
+        import pyarrow.parquet as pq
+
+        cache_dir = self.cache_dir
+        cache_dir.mkdir(exist_ok=True)
+        logger.info(f"Building the cache of `{self.file}` into `{cache_dir}`.")
+
+        size = Path(self.file).stat().st_size 
+        if is_binary_clm(self.file) or str(self.file).endswith(".gz"):
+            size *= 4
+        n_buckets = int(size // self.CACHE_BUCKET_SIZE) + 1
+
+        with tempfile.TemporaryDirectory(dir=cache_dir) as tmpdir:
+            if is_binary_clm(self.file):
+                frames = [pl.read_parquet(self.file)]
+            else:
+                frames = self._iter_text_frames()
+
+            bucket_writers = {}
+            for df in frames:
+                df = df.select(
+                    "contig1", "contig2", "orientation", 
+                    pl.col("count").cast(pl.UInt32), 
+                    pl.col("distances").cast(pl.List(pl.Int64)),
+                    pl.col("distances").list.eval(1 / (pl.element() + 1))
+                        .list.sum().alias("dk"),
+                    (pl.col("contig1").hash(seed=0) % n_buckets).alias("bucket")
+                )
+                for (bucket, ), tmp_df in df.partition_by("bucket", as_dict=True).items():
+                    table = tmp_df.drop("bucket").to_arrow()
+                    if bucket not in bucket_writers:
+                        bucket_writers[bucket] = pq.ParquetWriter(f"{tmpdir}/{bucket}.parquet", 
+                                                                  table.schema, compression="lz4")
+                    bucket_writers[bucket].write_table(table)
+            
+            for bucket_writer in bucket_writers.values():
+                bucket_writer.close()
+
+            tmp_data = f"{tmpdir}/data.parquet"
+            writer = None
+            for bucket in sorted(bucket_writers):
+                table = (pl.read_parquet(f"{tmpdir}/{bucket}.parquet")
+                            .sort(["contig1", "contig2", "orientation"], maintain_order=True)
+                            .to_arrow())
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_data, table.schema)
+                writer.write_table(table, row_group_size=self.CACHE_ROW_GROUP_SIZE)
+                Path(f"{tmpdir}/{bucket}.parquet").unlink()
+            
+            if writer is not None:
+                writer.close()
+            else:
+                pl.DataFrame(schema={"contig1": pl.Utf8, "contig2": pl.Utf8,
+                                     "orientation": pl.Utf8, "count": pl.UInt32, 
+                                     "distances": pl.List(pl.Int64), "dk": pl.Float64}
+                            ).write_parquet(tmp_data)
+            
+            index = (
+                pl.scan_parquet(tmp_data)
+                .select("contig1", "contig2", "count")
+                .with_row_index("row")
+                .group_by(["contig1", "contig2"], maintain_order=True)
+                .agg(pl.col("row").min().alias("start"),
+                     (pl.col("row").max() + 1).alias("end"),
+                     pl.col("count").first())
+                .collect()
+            )
+            shutil.move(tmp_data, cache_dir / "data.parquet")
+            index.write_parquet(cache_dir / "_index.parquet")
+    
     def parse(self):
-        self.data = {}
-        with open(self.file, 'r') as fp:
-            for line in fp:
-                cl = ClmLine(line)
-                if (cl.ctg1, cl.ctg2) not in self.data:
-                    self.data[(cl.ctg1, cl.ctg2)] = []
-                
-                self.data[(cl.ctg1, cl.ctg2)].append(cl.dk)
+        """
+        load the index of cache, the cache will be (re)built if 
+            it not exists or the clm is changed.
+        """
+        cache_dir = self.cache_dir
+        cache_dir.mkdir(exist_ok=True)
+        is_changed = is_file_changed(self.file, md5_file=str(cache_dir / "md5.txt"))
+        if (is_changed or not (cache_dir / "data.parquet").exists() 
+                or not (cache_dir / "_index.parquet").exists()):
+            if (cache_dir / "_index.parquet").exists():
+                (cache_dir / "_index.parquet").unlink()
+            self.build_cache()
+        
+        self.index = pl.read_parquet(cache_dir / "_index.parquet")
+    
+    def scan(self):
+        """
+        lazy frame of the cache
+        """
+        return pl.scan_parquet(self.cache_dir / "data.parquet")
+    
+    def read_rows(self, ranges, columns=None):
+        """
+        read the row ranges of cache, only the related row groups are decoded.
+
+        Params:
+        --------
+        ranges: list
+            list of half-open row ranges (start, end)
+        columns: list or None
+            columns to read
+
+        Returns:
+        --------
+        pl.DataFrame
+        """
+        import pyarrow as pa 
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(self.cache_dir / "data.parquet")
+        metadata = pf.metadata
+        offsets = np.cumsum([0] + [metadata.row_group(i).num_rows 
+                                    for i in range(metadata.num_row_groups)])
+        
+        tables = []
+        cached = {}
+        for start, end in sorted(ranges):
+            first = np.searchsorted(offsets, start, side="right") - 1
+            last = np.searchsorted(offsets, end, side="left") - 1
+            for row_group in range(first, last + 1):
+                if row_group not in cached:
+                    cached.clear()
+                    cached[row_group] = pf.read_row_group(row_group, columns=columns)
+                table = cached[row_group]
+                _start = max(start, offsets[row_group]) - offsets[row_group]
+                _end = min(end, offsets[row_group + 1]) - offsets[row_group]
+                tables.append(table.slice(_start, _end - _start))
+        
+        if not tables:
+            return self.scan().select(columns or pl.all()).head(0).collect()
+        
+        return pl.from_arrow(pa.concat_tables(tables))
+
+    def __getitem__(self, pair):
+        """
+        records of a contig pair in binary clm frame
+
+        Examples:
+        --------
+        >>> clm[("utg001", "utg002")]
+        """
+        ctg1, ctg2 = pair
+        hits = self.index.filter((pl.col("contig1") == ctg1) & (pl.col("contig2") == ctg2))
+        
+        return self.read_rows(hits.select("start", "end").rows())
+
+    def extract(self, contigs):
+        """
+        extract the records between contigs, e.g. the contigs of a group
+
+        Params:
+        --------
+        contigs: list
+            list of contigs
+        
+        Returns:
+        --------
+        pl.DataFrame of binary clm
+
+        Examples:
+        --------
+        >>> df = clm.extract(["utg001", "utg002", "utg003"])
+        >>> write_clm(df.drop("dk"), "group1.clm")
+        """
+        contigs = pl.Series(list(map(str, contigs)), dtype=pl.Utf8)
+        hits = self.index.filter(pl.col("contig1").is_in(contigs) 
+                                 & pl.col("contig2").is_in(contigs))
+        
+        return self.read_rows(hits.select("start", "end").rows())
     
+    @property
+    def data(self):
+        """
+        dict of contig pair -> dk of four orientations
+        """
+        df = self.dk_df
+        return dict(zip(df.index, df.values.tolist()))
+
     @property
     def dk_df(self):
-        res_dk_df = pd.DataFrame(self.data)
-        res_dk_df = res_dk_df.T 
+        res_dk_df = (
+            self.scan()
+            .select("contig1", "contig2", "orientation", "dk")
+            .collect()
+            .pivot(on="orientation", index=["contig1", "contig2"], values="dk")
+        )
+        for orientation in CLM_ORIENTATIONS:
+            if orientation not in res_dk_df.columns:
+                res_dk_df = res_dk_df.with_columns(pl.lit(None, pl.Float64).alias(orientation))
+        res_dk_df = res_dk_df.to_pandas().set_index(["contig1", "contig2"])[CLM_ORIENTATIONS]
+        res_dk_df.index.names = [None, None]
         res_dk_df.columns = self.strands
         
         return res_dk_df
 
     @property
     def contigs(self):
-        return list_flatten(list(self.data.keys()))
+        return list_flatten(self.index.select("contig1", "contig2").rows())
                             
     @property
     def strands(self):
@@ -2757,33 +3171,6 @@ class PAFLine:
     def __str__(self):
         return self.line
 
-def _process(args):
-    n, df, low_mq_condition, output, tmpdir = args
-    df = (df
-        .assign(identity=lambda x: 
-                (x.matches/x.aln_length).round(2).astype(np.float32))
-        .assign(fragment_length=lambda x: (x.end - x.start))
-        .assign(pass_filter=True)
-        .assign(filter_reason="pass")
-    )
-
-    
-    df = PAFTable._filter(n, df, low_mq_condition, tmpdir)
-    df.to_parquet(f"{output}/part.{n}.parquet")
-
-def _get_chunk(scans, read_idx, chunks, low_mq_condition, output, tmpdir):
-
-    idx = 0
-    for i, scan in enumerate(scans):
-        try:
-            df = chunks.get_chunk(scan)
-        except StopIteration:
-            return
-        df['read_idx'] = read_idx[idx: idx + scan]
-        idx += scan
-
-        yield (i, df, low_mq_condition, output, tmpdir)
-
 class PAFRecords:
     
     def __init__(self, paf_file):
@@ -2806,6 +3193,8 @@ class PAFTable:
         Minimum of mapping quality.
     min_length: int, default 50
         Minumum of fragment length.
+    chunksize: int, default 100000
+        Number of alignments in each chunk.
     threads: int, default 4
         Number of threads.
 
@@ -2843,7 +3232,23 @@ class PAFTable:
         "filter_reason": "category",
         "identity": PERCENTAGE_DTYPE
     }
-    def __init__(self, paf: str, 
+
+    SCHEMA = {
+        "read_name": pl.Utf8,
+        "read_length": pl.UInt32,
+        "read_start": pl.UInt32,
+        "read_end": pl.UInt32,
+        "strand": pl.Utf8,
+        "chrom": pl.Utf8,
+        "chrom_length": pl.UInt32,
+        "start": pl.UInt32,
+        "end": pl.UInt32,
+        "matches": pl.UInt32,
+        "align_length": pl.UInt32,
+        "mapping_quality": pl.UInt32,
+    }
+
+    def __init__(self, paf: str,
                     output: str = "out.pq",
                     min_quality: int = 1,
                     min_identity: float = 0.75,
@@ -2878,28 +3283,103 @@ class PAFTable:
             self.read_table()
     
     
-    def read_split_info(self):
+    def iter_chunks(self):
         """
-        import read_name to get the split information
+        read the paf in chunks of about `chunksize` alignments, the alignments
+            of a read are kept in the same chunk, and `read_idx` is the index
+            of the read in the whole paf.
+
+        Returns:
+        --------
+        generator of pl.DataFrame
         """
-        read_names = pd.read_csv(self.file, sep='\t', usecols=[0],
-                                 header=None)
-        read_names = pd.Categorical(read_names[0], pd.unique(read_names[0]), ordered=True)
-        
-        read_idx = read_names.codes 
-        del read_names
-        gc.collect() 
+        import gzip
 
-        _, counts = np.unique(read_idx, return_counts=True)
+        def _parse(data, offset):
+            df = pl.read_csv(data, separator='\t',
+                                has_header=False, columns=list(range(12)),
+                                new_columns=self.PAF_HEADER[:12],
+                                schema_overrides=self.SCHEMA,
+                                truncate_ragged_lines=True)
+            return df.with_columns(read_idx=df['read_name'].rle_id() + offset)
 
-        scan = list(range(0, len(read_idx), self.chunksize)) + [len(read_idx)]  
+        offset = 0
+        tail = b""
+        blocksize = None
+        with (gzip.open if self.is_gz else open)(self.file, 'rb') as fp:
+            while True:
+                if blocksize is None:
+                    data = fp.read(2**20)
+                    blocksize = max(2**20, len(data) * self.chunksize
+                                                // max(data.count(b"\n"), 1))
+                else:
+                    data = fp.read(blocksize)
+                if not data:
+                    break
+                data = tail + data
+
+                ## the last read may continue in the next chunk
+                last = data.rfind(b"\n", 0, data.rfind(b"\n")) + 1
+                name = data[last: data.find(b"\t", last) + 1]
+                while last > 0:
+                    prev = data.rfind(b"\n", 0, last - 1) + 1
+                    if not data.startswith(name, prev):
+                        break
+                    last = prev
+
+                tail = data[last:]
+                if last == 0:
+                    continue
 
-        a = np.searchsorted(np.cumsum(counts), scan[1:], side='right')
-        b = np.searchsorted(read_idx, a, side='right')
+                df = _parse(data[:last], offset)
+                offset = df['read_idx'][-1] + 1
+                yield df
 
-        c = b - np.r_[0, b[:-1]]
-      
-        return read_idx, c
+        if tail.strip():
+            yield _parse(tail, offset)
+
+    @staticmethod
+    def filter_exprs(min_quality: int=1,
+                        min_identity: float=0.75,
+                        min_length: int=50):
+        """
+        expressions of identity, fragment length, and the filters of low
+            mapping quality and singleton, which are applied in order.
+            All alignments of a read must be in the same chunk.
+        """
+        ## round half to even as numpy
+        identity = pl.col('matches') / pl.col('align_length') * 100
+        floor = identity.floor()
+        identity = (pl.when(identity - floor > 0.5).then(floor + 1)
+                      .when(identity - floor < 0.5).then(floor)
+                      .otherwise(floor + floor % 2))
+        identity = (identity / 100).cast(pl.Float32)
+        fragment_length = pl.col('end') - pl.col('start')
+        low_mq = ((pl.col('mapping_quality') < min_quality)
+                    | (pl.col('identity') < min_identity)
+                    | (pl.col('fragment_length') < min_length))
+        singleton = ~low_mq & ((~low_mq).sum().over('read_idx') == 1)
+
+        return [
+            [identity.alias('identity'),
+                fragment_length.alias('fragment_length')],
+            [pl.when(low_mq).then(pl.lit('low_mq'))
+                .when(singleton).then(pl.lit('singleton'))
+                .otherwise(pl.lit('pass')).alias('filter_reason')],
+            [(pl.col('filter_reason') == 'pass').alias('pass_filter')]
+        ]
+
+    @staticmethod
+    def _process_chunk(n, df, exprs, output):
+        for expr in exprs:
+            df = df.with_columns(expr)
+
+        (df.select(PAFTable.PAF_HEADER[:12] + ['read_idx', 'identity',
+                    'fragment_length', 'pass_filter', 'filter_reason'])
+            .with_columns(pl.col('read_name', 'strand', 'chrom').cast(pl.Categorical))
+            .write_parquet(f"{output}/part.{n}.parquet"))
+
+        return df.height
 
     def read_table(self):
         logger.info(f'Load paf file of `{self.filename}`.')
@@ -2921,32 +3401,22 @@ class PAFTable:
         else:
             
             Path(self.output).mkdir(exist_ok=True)
-            
-            read_idx, scans = self.read_split_info()
-           
-            chunks = pd.read_csv(self.file, sep='\t', usecols=range(12), 
-                            header=None, names=self.PAF_HEADER[:12], 
-                            dtype=self.META, iterator=True)
-            
 
-            low_mq_condition = (self.min_quality, self.min_identity, self.min_length)
-            filter_condition = (f'map_quality < {self.min_quality}'
+            filter_condition = (f'mapping_quality < {self.min_quality}'
                                      f' | identity < {self.min_identity}'
                                      f' | fragment_length < {self.min_length}')
             logger.info(f"Filter low mapping quality by: {filter_condition}")
-            
 
-            new_chunk_iter = _get_chunk(scans, read_idx, chunks, low_mq_condition, self.output, self.tmpdir)
-            
-            pool = Pool(self.threads)
-            pool.map(_process, new_chunk_iter)
-            
-            # for args in new_chunk_iter:
-            #     _process(args)
+            exprs = PAFTable.filter_exprs(self.min_quality, self.min_identity, self.min_length)
+            ## polars releases the GIL, so the chunks are processed by threads
+            res = Parallel(n_jobs=self.threads, backend="threading")(
+                    delayed(PAFTable._process_chunk)(n, df, exprs, self.output)
+                        for n, df in enumerate(self.iter_chunks()))
+
+            logger.info(f"Successfully output pore_c_table ({sum(res)} alignments) "
+                        f"to `{self.output}`")
 
-            logger.info(f"Successfully output pore_c_table to `{self.output}`")
 
-    
     @staticmethod
     def _filter_low_mq(df,
                     min_quality: int=1, 
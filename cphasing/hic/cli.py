@@ -15,14 +15,6 @@ import sys
 
 
 from ..cli import cli 
-from ..core import (
-    AlleleTable, 
-    ClusterTable, 
-    CountRE, 
-    PairTable
-)
-
-from ..utilities import run_cmd
 from .. import __epilog__
 
 logger = logging.getLogger(__name__)
@@ -420,7 +412,7 @@ def extract(infile, fastafile, enzyme, minLinks):
 
     FastaFile : Path of fasta file.
     """
-    from ..utilities import restriction_site
+    from ..utilities import restriction_site, run_cmd
     cmd = ['allhic', 'extract', infile, fastafile, 
             '--RE', ",".join(restriction_site(enzyme)), 
             '--minLinks', str(minLinks)]
@@ -482,6 +474,7 @@ def pregroup(alleletable, count_re, pairtable, fasta, outdir, threads):
 
         PairTable : Path to pair table.
     """
+    from ..core import AlleleTable, CountRE, PairTable
     from .pregroup import pregroup
     at = AlleleTable(alleletable, sort=False)
     cr = CountRE(count_re)
@@ -529,6 +522,7 @@ def prune(
         PairTable : Path to allhic pairs table.
 
     """
+    from ..core import AlleleTable, CountRE, PairTable
     from .prune import Prune
 
     at = AlleleTable(alleletable, sort=True)
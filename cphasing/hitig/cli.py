@@ -15,7 +15,6 @@ from rich.logging import Console, RichHandler
 
 # from ..cli import CommandGroup
 from ..cli import cli 
-from ..utilities import read_chrom_sizes
 from .. import __epilog__
 
 logging.basicConfig(
@@ -677,6 +676,7 @@ def hcr(fasta, lis, split_align, paf,
     """
     from .hcr import hcr, bed2depth
     from .hcr.clean import clean
+    from ..utilities import read_chrom_sizes
     from .find_chimeric import paf2depth 
 
     contigsizes, depth = paf2depth.workflow(paf, fasta, window, step_size, output, min_mapq=min_mapq)
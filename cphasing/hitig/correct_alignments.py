@@ -9,6 +9,7 @@ from joblib import Parallel, delayed
 import argparse
 from copy import deepcopy
 import collections
+import numpy as np
 import pandas as pd
 import polars as pl 
 
@@ -87,68 +88,84 @@ def minimap_mapping(fasta, reads, window, min_windows, threads, outPre, is_hifi=
 
     return outPre + ".paf"
 
-### return pafDic
+PAF_COLUMNS = ['qn', 'ql', 'qs', 'qe', 's', 'tn', 'tl', 'ts', 'te', 
+               'al1', 'al2', 'mapq', 'NM', 'ms', 'AS']
+## columns of an alignment in pafDic
+ALIGN_COLUMNS = ['qs', 'qe', 's', 'tn', 'ts', 'te', 'ql', 'tl', 'al1', 'al2', 'mapq', 'AS']
+
+### return pafDf
 def read_paf(paf, minAS, nhap):
-    pafDic = {}
+    """
+    load the window alignments into a table, in the same order as the nested pafDic:
+        reads and their windows in the order of first appearance, 
+        the alignments of a window sorted by AS descendingly (at most `nhap` + 1).
+    
+    Returns:
+    --------
+    pl.DataFrame:
+        columns of qn_idx (row of the first alignment of read), qn, qi and `ALIGN_COLUMNS`
+    """
     minAS = int(minAS)
     maxAlign = int(nhap)
     logger.info(f"Loading `{paf}` ...")
-
-    with xopen(paf,'r') as fin:
-        for line in fin:
-            tmpLst = line.split("\t")
-            if len(tmpLst) < 15:
-                continue
-            qn, ql, qs, qe, s, tn, tl, ts, te, al1, al2, mapq, NM, ms, AS = tmpLst[:15]
-            if not qn:
-                continue
-            qi = int(qn.split("_")[-1])
-      
-            originQn = "_".join(qn.split("_")[:-1])
-            NM, AS = list(map(lambda x: int(x.split(":")[-1]), [NM, AS]))
-            if AS < minAS:
-                continue
-            if originQn not in pafDic:
-                pafDic[originQn] = {}
-            if qi not in pafDic[originQn]:
-                pafDic[originQn][qi] = []
-            pafDic[originQn][qi].append([int(qs),int(qe),s,tn,int(ts),int(te),int(ql),int(tl),int(al1),int(al2), int(mapq), int(AS)])
-    # os.environ['POLARS_MAX_THREADS'] = '4'
-    # df = pl.read_csv(paf, has_header=False, 
-    #                  separator='\t', columns=range(15))
-
-    # df = df.filter(df['column_1'].is_not_null())
-    # df = (df.with_columns(pl.col("column_1")
-    #                 .str.extract_groups(r"(.+)_(\d+)$")
-    #                 .struct.rename_fields(['originQn', 'qi'])
-    #                 .alias('fields')
-    #                 ).unnest('fields')).drop("column_1")
-    # df = df.with_columns([
-    #     df['originQn'].cast(pl.Categorical),
-    #     df['qi'].cast(pl.UInt32)
-    # ])
-
-    # df = df.with_columns(pl.col("column_15").str.splitn(":", 3).struct[2].cast(pl.Int32).alias('AS')).drop("column_15")
-    # df = df.with_columns(pl.col("column_13").str.splitn(":", 3).struct[2].cast(pl.Int32).alias('NM')).drop("column_13")
-    # df = df.filter(df['AS'] >= minAS)
-
-    # print(df)
-    
-    # print(df.group_by(['originQn', 'qi']).apply(lambda x: x.head(maxAlign)))
-    ## sort pafDic
     
-    for qn in pafDic:
-        qnDic = pafDic[qn]
-        for qi in qnDic:
-            totalReadsLst = qnDic[qi]
-            totalReadsLst.sort(key=lambda x:x[-1], reverse=True)
-            totalReadsLst = totalReadsLst[:maxAlign+1] if len(totalReadsLst) >= maxAlign else totalReadsLst
-            qnDic[qi] = totalReadsLst
-        pafDic[qn] = qnDic
+    df = pl.read_csv(paf, has_header=False, separator='\t', quote_char=None,
+                     schema=dict.fromkeys(PAF_COLUMNS, pl.Utf8), 
+                     truncate_ragged_lines=True)
+    ## `{read}_{window}`, the name of read is empty if there is no '_'
+    window_name = r"^(?:(.*)_)?([^_]*)$"
+    df = (df.filter(pl.col('qn').is_not_null() & pl.col('AS').is_not_null())
+            .with_columns(pl.col('qn').str.extract_groups(window_name)
+                            .struct.rename_fields(['qn', 'qi']))
+            .unnest('qn')
+            .with_columns(
+                pl.col('qn').fill_null(""),
+                pl.col('qi').cast(pl.Int64),
+                pl.col('AS').str.split(":").list.last().cast(pl.Int64),
+                pl.col('ql', 'qs', 'qe', 'tl', 'ts', 'te', 'al1', 'al2', 'mapq').cast(pl.Int64))
+            .filter(pl.col('AS') >= minAS)
+            .with_row_index('idx')
+            .with_columns(pl.col('idx').min().over('qn').alias('qn_idx'),
+                          pl.col('idx').min().over('qn', 'qi').alias('qi_idx'))
+            .sort(['qn_idx', 'qi_idx', 'AS', 'idx'], descending=[False, False, True, False]))
+    ## index of alignments in each window, by the starts of windows in the sorted table
+    row = pl.int_range(pl.len())
+    window_start = pl.when(pl.col('qi_idx').ne_missing(pl.col('qi_idx').shift(1))).then(row)
+    df = (df.filter(row - window_start.forward_fill() <= maxAlign)
+            .select('qn_idx', 'qn', 'qi', *ALIGN_COLUMNS))
+
+    return df
+
+
+def table_to_pafDic(pafDf):
+    """
+    pafDic[qn][qi] = [[qs,qe,s,tn,ts,te,ql,tl,al1,al2,mapq,AS], ...] from the table of `read_paf`
+    """
+    pafDic = {}
+    qnDic = None
+    lastQn, lastQi = None, None
+    for qn, qi, *align in pafDf.select('qn', 'qi', *ALIGN_COLUMNS).iter_rows():
+        if qn != lastQn:
+            qnDic = pafDic[qn] = {}
+            lastQn, lastQi = qn, None
+        if qi != lastQi:
+            totalReadsLst = qnDic[qi] = []
+            lastQi = qi
+        totalReadsLst.append(align)
 
     return pafDic
 
 
+def split_paf_table(pafDf, num):
+    """
+    split the table of `read_paf` into about `num` blocks of contiguous reads
+    """
+    read_starts = np.r_[0, np.flatnonzero(np.diff(pafDf['qn_idx'].to_numpy())) + 1]
+    block_starts = np.r_[read_starts[::max(1, math.ceil(len(read_starts) / num))], len(pafDf)]
+    for start, end in zip(block_starts[:-1], block_starts[1:]):
+        yield pafDf.slice(start, end - start)
+
+
 def select_mapq(pafDic, minMapq):
     """
     bestASPafDic = {"reads1":{reads_pos:[reads_index1,reads_index2]}}
@@ -229,6 +246,28 @@ def calculate_LMP_pipeline(bestReadsDic, allreadsDic, mapqPafDic, win, qn):
     mergedlLIS = merge_LIS(LISBAK)
     return (qn, mergedlLIS)
         
+### return lines of outputs
+def calculate_LMP_block(pafDf, win, minMapq):
+    """
+    LIS of a block of reads in the table of `read_paf`, 
+        the reads are processed one by one as `calculate_LMP_pipeline`.
+
+    Returns:
+    --------
+    tuple:
+        lines of LIS gtf, corrected paf, mapq LIS gtf and mapq corrected paf
+    """
+    pafDic = table_to_pafDic(pafDf)
+    bestASpafDic, mapqPafDic = select_mapq(pafDic, minMapq)
+    allLISDic = {}
+    for qn in pafDic:
+        _, allLISDic[qn] = calculate_LMP_pipeline(bestASpafDic[qn], pafDic[qn], 
+                                                  mapqPafDic.get(qn, {}), win, qn)
+    ## check LIS
+    corLISDic = checkLIS(allLISDic, pafDic)
+
+    return format_LIS(corLISDic, pafDic)
+
 def explainLIS(allreadsDic, LISBAK):
     """
     allreadsDic[qiPre][riPre] : [qs,qe,s,tn,ts,te,al1,al2,AS]
@@ -701,11 +740,7 @@ def checkLIS(lisBak, pafDic):
                 preS, preE = -1, -1
             for i in range(1, len(align)):
                 qi, ri, tp = align[i]
-                itemInPaf = pafDic[qn][qi][ri]
-                itemInPaf = list(map(str,itemInPaf))
-                curS, curE = itemInPaf[4:6]
-                curS = int(curS)
-                curE = int(curE)
+                curS, curE = pafDic[qn][qi][ri][4:6]
                 if preS < curS and preE < curE and string == '+':
                     tmpLst.append((qi, ri, tp))
                     preS, preE = curS, curE
@@ -718,72 +753,91 @@ def checkLIS(lisBak, pafDic):
     return corLis
 
 
-## return LISFIle, newPAF 
-def outputLIS(lisBak, pafDic, outpre):
+### return lines of outputs
+def format_LIS(lisBak, pafDic):
     """
     LIS_list : [([(qi, ri, 'P'), (qi, ri, 'P')], '+'), ]
     pafDic[originQn][qi].append([qs,qe,s,tn,ts,te,ql,tl,al1,al2,mapq, AS])
     qn, ql, qs, qe, s, tn, tl, ts, te, al1, al2, mapq, NM, ms, AS = tmpLst[:15]
     """
+    LISLines = []
+    pafLines = []
     mapqLIS = []
     mapqPaf = []
 
-    with open(outpre + '.LIS.gtf', 'w') as fout1, \
-        open(outpre + ".corrected.paf", 'w') as fout2:
-        for qn in lisBak:
-            for align, string in lisBak[qn]:
-                fq, fr = align[0][:2]
-                lq, lr = align[-1][:2]
-                fInfo = pafDic[qn][fq][fr]
-                lInfo = pafDic[qn][lq][lr]
-                if string == '-':
-                    tl, tn, alignS, alignE = lInfo[7], lInfo[3], lInfo[4], fInfo[5]
-                else:
-                    tl, tn, alignS, alignE = lInfo[7], fInfo[3], fInfo[4], lInfo[5]
+    for qn in lisBak:
+        for align, string in lisBak[qn]:
+            fq, fr = align[0][:2]
+            lq, lr = align[-1][:2]
+            fInfo = pafDic[qn][fq][fr]
+            lInfo = pafDic[qn][lq][lr]
+            if string == '-':
+                tl, tn, alignS, alignE = lInfo[7], lInfo[3], lInfo[4], fInfo[5]
+            else:
+                tl, tn, alignS, alignE = lInfo[7], fInfo[3], fInfo[4], lInfo[5]
+            """
+            seq_id	seq_length	type	start	end	Alignment-score	strand	alignment-type	attributes
+            ctg12	400000	LIS/alignment	25132483	25132543	8000	+	P/S/E/M	reads_id "reads1"; window_id "reads1_1"; 
+            """
+            atrriInfoLIS = "reads_id:" + qn
+            tmpLIS = "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(tn, tl, "LIS", alignS, alignE, ".", string, ".", atrriInfoLIS)
+            LISLines.append(tmpLIS)
+            alignLisLst = [tmpLIS]
+            alignPafLst = []
+            addFlag = False
+            for qi, ri ,tp in align: 
+                if tp == 'M':
+                    addFlag = True
+                itemInPaf = pafDic[qn][qi][ri]
+                itemInPaf = list(map(str,itemInPaf))
                 """
-                seq_id	seq_length	type	start	end	Alignment-score	strand	alignment-type	attributes
-                ctg12	400000	LIS/alignment	25132483	25132543	8000	+	P/S/E/M	reads_id "reads1"; window_id "reads1_1"; 
+                [qs,qe,s,tn,ts,te,ql,tl,al1,al2,mapq, AS]
+                qn, ql, qs, qe, s, tn, tl, ts, te, al1, al2, mapq, AS
                 """
-                atrriInfoLIS = "reads_id:" + qn
-                tmpLIS = "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(tn, tl, "LIS", alignS, alignE, ".", string, ".", atrriInfoLIS)
-                fout1.write(tmpLIS)
-                alignLisLst = [tmpLIS]
-                alignPafLst = []
-                addFlag = False
-                for qi, ri ,tp in align: 
-                    if tp == 'M':
-                        addFlag = True
-                    itemInPaf = pafDic[qn][qi][ri]
-                    itemInPaf = list(map(str,itemInPaf))
-                    """
-                    [qs,qe,s,tn,ts,te,ql,tl,al1,al2,mapq, AS]
-                    qn, ql, qs, qe, s, tn, tl, ts, te, al1, al2, mapq, AS
-                    """
-                    _qn, ql, [qs, qe, s, tn], tl, [ts, te], [al1, al2, mapq, AS] = "{}_{}".format(qn, qi), itemInPaf[6], itemInPaf[:4], itemInPaf[7], itemInPaf[4:6], itemInPaf[8:]
-                    
-                    mapq = "2" if mapq == "0" else mapq
-                    # _qn2 = _qn.rsplit("_", 1)[0]
-                    tmpAliPaf = "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\tAS:{}\n".format(_qn, ql, qs, qe, s, tn, tl, ts, te, al1, al2, mapq, AS)
-                    fout2.write(tmpAliPaf)
-                    tl, tn, ts, te, AS = itemInPaf[7], itemInPaf[3], itemInPaf[4], itemInPaf[5], itemInPaf[-1]
-                    atrriInfo = "reads_id:{0};window_id:{0}_{1};".format(qn, qi)
-                    tmpAliLis = "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(tn, tl, "alignment", ts, te, AS, string, tp, atrriInfo)
-                    fout1.write(tmpAliLis)
-                    alignLisLst.append(tmpAliLis)
-                    alignPafLst.append(tmpAliPaf)
-                if addFlag == True:
-                    mapqPaf.extend(alignPafLst)
-                    mapqLIS.extend(alignLisLst)
-
-    with open(outpre + '.mapq.LIS.gtf', 'w') as fout3:
-        #for i in mapqLIS:
-        fout3.write("".join(mapqLIS))
-        logger.info(f"Successfull output {fout3.name}")
-    with open(outpre + '.mapq.corrected.paf', 'w') as fout4:
-        #for i in mapqLIS:
-        fout4.write("".join(mapqPaf))
-        logger.info(f"Successful output {fout4.name}")
-                        
+                _qn, ql, [qs, qe, s, tn], tl, [ts, te], [al1, al2, mapq, AS] = "{}_{}".format(qn, qi), itemInPaf[6], itemInPaf[:4], itemInPaf[7], itemInPaf[4:6], itemInPaf[8:]
+                
+                mapq = "2" if mapq == "0" else mapq
+                # _qn2 = _qn.rsplit("_", 1)[0]
+                tmpAliPaf = "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\tAS:{}\n".format(_qn, ql, qs, qe, s, tn, tl, ts, te, al1, al2, mapq, AS)
+                pafLines.append(tmpAliPaf)
+                tl, tn, ts, te, AS = itemInPaf[7], itemInPaf[3], itemInPaf[4], itemInPaf[5], itemInPaf[-1]
+                atrriInfo = "reads_id:{0};window_id:{0}_{1};".format(qn, qi)
+                tmpAliLis = "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(tn, tl, "alignment", ts, te, AS, string, tp, atrriInfo)
+                LISLines.append(tmpAliLis)
+                alignLisLst.append(tmpAliLis)
+                alignPafLst.append(tmpAliPaf)
+            if addFlag == True:
+                mapqPaf.extend(alignPafLst)
+                mapqLIS.extend(alignLisLst)
+
+    return LISLines, pafLines, mapqLIS, mapqPaf
+
+
+### write LISFIle, newPAF 
+def write_LIS(blockLines, outpre):
+    """
+    write the lines of `format_LIS` from the blocks of reads in order
+    """
+    with open(outpre + '.LIS.gtf', 'w') as fout1, \
+        open(outpre + ".corrected.paf", 'w') as fout2, \
+        open(outpre + '.mapq.LIS.gtf', 'w') as fout3, \
+        open(outpre + '.mapq.corrected.paf', 'w') as fout4:
+        for LISLines, pafLines, mapqLIS, mapqPaf in blockLines:
+            fout1.write("".join(LISLines))
+            fout2.write("".join(pafLines))
+            fout3.write("".join(mapqLIS))
+            fout4.write("".join(mapqPaf))
+
+    logger.info(f"Successfull output {fout3.name}")
+    logger.info(f"Successful output {fout4.name}")
+
+
+## return LISFIle, newPAF 
+def outputLIS(lisBak, pafDic, outpre):
+    """
+    LIS_list : [([(qi, ri, 'P'), (qi, ri, 'P')], '+'), ]
+    """
+    write_LIS([format_LIS(lisBak, pafDic)], outpre)
 
 
 def workflow(fasta, reads, threads, outPre, win, min_windows, nhap, minAS, minMapq, hifi=False):
@@ -801,36 +855,14 @@ def workflow(fasta, reads, threads, outPre, win, min_windows, nhap, minAS, minMa
 
     threads, win = int(threads), int(win)
     #pafFile = minimap_mapping(fasta, reads, threads, outPre)
-    pafDic = read_paf(pafFile, minAS, nhap)
-    bestASpafDic, mapqPafDic = select_mapq(pafDic, minMapq)
-
-    allLISDIc = {}
-    ## get LIS for every single reads
-    qnLst = []
-    allAlignLst = []
-    bestAlignLst = []
-    mapqAlignLst = []
+    pafDf = read_paf(pafFile, minAS, nhap)
 
-    for qn in pafDic:
-        qnLst.append(qn)
-        allAlignLst.append(pafDic[qn])
-        if qn in mapqPafDic:
-            mapqAlignLst.append(mapqPafDic[qn])
-        else:
-            mapqAlignLst.append({})
-        bestAlignLst.append(bestASpafDic[qn])
-    AllmergedLIS = Parallel(n_jobs=min(threads, 12))(
-                    delayed(calculate_LMP_pipeline)(c, b, d, int(win), a) 
-                        for a,b,c,d in zip(qnLst, allAlignLst, bestAlignLst, mapqAlignLst))
-    
-    for qn, mergedLIS in AllmergedLIS:
-        allLISDIc[qn] = mergedLIS
-       
-    ## check LIS
-    corLISDic = checkLIS(allLISDIc, pafDic)
+    ## get LIS for every single reads, in blocks of contiguous reads 
+    blockLines = Parallel(n_jobs=threads, return_as="generator")(
+                    delayed(calculate_LMP_block)(block, win, int(minMapq))
+                        for block in split_paf_table(pafDf, threads * 4))
     ## output
-    
-    outputLIS(corLISDic, pafDic, outPre)
+    write_LIS(blockLines, outPre)
 
     return pafFile
 
@@ -2,147 +2,174 @@
 
 import argparse
 import logging
-import os
-import os.path as op
-import sys
 
 import math
-import collections
+
+import numpy as np
+import pandas as pd
+import polars as pl
 
 from pathlib import Path
-from cphasing.utilities import run_cmd
+from cphasing.utilities import (
+    iter_fasta_bytes,
+    read_chrom_sizes,
+    xopen
+)
 
 logger = logging.getLogger(__name__)
 
-def read_paf(paf):
-    pafDic = {}
-    with open(paf, 'r') as fin:
-        for line in fin:
-            tmpLst = line.rstrip().split('\t')
-            qn = tmpLst[0]
-            pafDic[qn] = tmpLst[1:]
-    return pafDic
-
-def read_fasta(faFile):
-    logger.info("Reading genome...")
-    fastaDic = {}
-    with open(faFile,'r') as IN:
-        fastaName = IN.readline().strip()[1:]
-        fa = ''
-        for line in IN:
-            if line.startswith('>'):
-                fastaDic[fastaName] = len(fa)
-                fastaName = line.strip()[1:]
-                fa = ''
-            else:
-                fa += line.rstrip()
-        fastaDic[fastaName] = len(fa)
-    return fastaDic
-
-def build_windic(genomeSize, win):
-    step = int(win/5)
-    binDic = collections.OrderedDict()
-    windic = collections.OrderedDict()
-    for ctg in genomeSize:
-        binDic[ctg] = {}
-        windic[ctg] = {}
-        ctgSize = genomeSize[ctg]
-        binLst = list(range(0, ctgSize - win, step))
-        binLst = [(i, i+win) for i in binLst]
-        if ctgSize <= win:
-            continue
-        if binLst[-1][0] != (ctgSize - win):
-            binLst.append((binLst[-1][0] + 1000, ctgSize))
-        for bin in binLst:
-            binDic[ctg][bin] = []
-            windic[ctg][bin] = 0
-    return binDic, windic
-
-def bin_reads(pafDic, winDic, win):
+def make_windows(contigsizes, win, step):
     """
-    winDic: (0, 5000) : [(reads1, 0, 1000) , (reads2, 1, 1001)]
-    pafDic[qn] : ([qs,qe,s,tn,ts,te,ql,tl,al1,al2,AS]) # ql, qs, qe, s, tn, tl, ts, te, al1, al2, mapq, AS
+    sliding windows of contigs as `bedtools makewindows -w win -s step`, 
+        the windows start at 0 with step, and stop at the first window 
+        that reaches the end of contig, which is truncated.
+
+    Params:
+    --------
+    contigsizes: pd.DataFrame
+        contig sizes from `read_chrom_sizes`
+    win: int
+        window size
+    step: int
+        step size
+
+    Returns:
+    --------
+    pd.DataFrame:
+        index of contigs, columns of length, n_full (number of full windows), 
+        tail (start of the truncated window, -1 if not exists) and 
+        offset (index of the first window of contig)
     """
-    for qn in pafDic:
-        qInfo = pafDic[qn]
-        tn, tl, ts, te = qInfo[4:8]
-        ts, te = int(ts), int(te)
-        if tn not in winDic:
-            continue
-        blst = list(winDic[tn].keys())
-        maxBIn = len(blst)
-        stratIdx = math.ceil(float(ts - 5000)/float(1000)) # 向上取整
-        endIdx = math.floor(float(te)/float(1000)) + 1  # 向下取整
-        stratIdx = stratIdx if stratIdx >= 0 else 0
-        endIdx = endIdx if endIdx <= maxBIn else maxBIn
-        #idx = math.floor(int(ts)/win)
-        #blst = list(winDic[tn].keys())
-        for bini in blst[stratIdx: endIdx]:
-            overlap = min(int(bini[1]), te) - max(int(bini[0]), ts)
-            winDic[tn][bini] += overlap
-    return winDic
-
-def cal_depth(winDic):
+    windows = contigsizes[['length']].copy()
+    length = windows['length'].to_numpy()
+    n_full = np.where(length >= win, (length - win) // step + 1, 0)
+    tail = n_full * step
+    has_tail = (tail < length) & ((n_full == 0) | ((n_full - 1) * step + win < length))
+    windows['n_full'] = n_full
+    windows['tail'] = np.where(has_tail, tail, -1)
+    windows['offset'] = np.r_[0, np.cumsum(n_full + has_tail)[:-1]]
+
+    return windows
+
+
+def iter_alignment_intervals(paf, min_mapq=2, chunksize=2**24):
     """
-    winDic: tn: (0, 5000) : [(reads1, 0, 1000) , (reads2, 1, 1001)]
-    pafDic[qn] : ([qs,qe,s,tn,ts,te,ql,tl,al1,al2,AS])
+    Read the intervals of alignments in chunks of about `chunksize` bytes, 
+        secondary alignments (`tp:A:S`) and alignments with mapping quality 
+        lower than `min_mapq` are removed.
+
+    Returns:
+    --------
+    generator of pl.DataFrame with columns of tn, ts and te
     """
-    depthDic = {}
-    for ctg in winDic:
-        depthDic[ctg] = {}
-        for bin in winDic[ctg]:
-            #readsLst = winDic[bin]
-            winSize = bin[1] - bin[0]
-            overlapValue = winDic[ctg][bin]
-            #overlapLst = list(map(lambda x :get_overlap(x, bin, pafDic), readsLst))
-            #depth = sum(overlapLst)/winSize
-            depth = overlapValue/winSize
-            depthDic[ctg][bin] = depth
-    return depthDic
-            
-def get_overlap(readsItem, bin, pafDic):
-    s,e = bin
-    rn, rs, re = readsItem
-    if rn in pafDic:
-        overlap = min(re, e) - max(rs, s)
-        return overlap
-    else:
-        return 0
-
-def output(ouPre, depthDIc):
-    with open(ouPre + ".depth", 'w') as fout:
-        for ctg in depthDIc:
-            for bini in depthDIc[ctg]:
-                fout.write("{}\t{}\t{}\t{:.3f}\n".format(ctg, bini[0], bini[1], depthDIc[ctg][bini]))
-    return ouPre + ".depth"
-
-def calculate_depth_by_bedtools(paf, fastaFile, output, winsize=5000, step=1000, min_mapq=2):
+    schema = {f"column_{i}": pl.Utf8 for i in range(1, 13)}
+    with xopen(paf, 'r') as fp:
+        while True:
+            lines = fp.readlines(chunksize)
+            if not lines:
+                break
+            lines = [line for line in lines if 'tp:A:S' not in line]
+            if not lines:
+                continue
+            df = pl.read_csv("".join(lines).encode(), separator='\t', has_header=False,
+                             quote_char=None, schema=schema, truncate_ragged_lines=True)
+            yield (df.select(pl.col('column_6').alias('tn'),
+                             pl.col('column_8', 'column_9', 'column_12').cast(pl.Int64))
+                     .filter(pl.col('column_12') >= min_mapq)
+                     .select('tn', pl.col('column_8').alias('ts'), pl.col('column_9').alias('te')))
+
+
+def window_depth(paf, contigsizes, win=5000, step=1000, min_mapq=2, min_fraction=0.5):
+    """
+    count the alignments covering at least `min_fraction` of each sliding window, 
+        same as `bedtools intersect -f 0.5 -c` of windows and alignments.
+
+        An alignment [s, e) covers at least h bases of a window [ws, ws + L) 
+        if e - s >= h, s + h - L <= ws <= e - h and L >= h, so the full windows 
+        (L = win) it counts are a range of window index, which are accumulated 
+        by a difference array over windows and its prefix sums. 
+        The truncated window at the end of each contig is counted directly.
+
+    Params:
+    --------
+    paf: str
+        alignments
+    contigsizes: pd.DataFrame
+        contig sizes from `read_chrom_sizes`
+    win, step: int
+        window and step size
+    min_mapq: int
+        minimum mapping quality of alignments
+    min_fraction: float
+        minimum overlap as a fraction of window
+
+    Returns:
+    --------
+    pd.DataFrame:
+        columns of chrom, start, end and count
+    """
+    windows = make_windows(contigsizes, win, step)
+    contig_idx = dict(zip(windows.index, range(len(windows))))
+    total = int(windows['offset'].iloc[-1] + windows['n_full'].iloc[-1] + 2) if len(windows) else 1
+    h = math.ceil(win * min_fraction)
+    diff = np.zeros(total, dtype=np.int64)
+    tail_counts = np.zeros(len(windows), dtype=np.int64)
+    
+    length, n_full, tail, offset = (windows[col].to_numpy() 
+                                    for col in ['length', 'n_full', 'tail', 'offset'])
+    tail_length = length - tail
+    tail_h = np.ceil(tail_length * min_fraction).astype(np.int64)
+    for df in iter_alignment_intervals(paf, min_mapq):
+        idx = df['tn'].replace_strict(contig_idx, default=-1, return_dtype=pl.Int64).to_numpy()
+        ts, te = df['ts'].to_numpy(), df['te'].to_numpy()
+        retain = idx >= 0
+        idx, ts, te = idx[retain], ts[retain], te[retain]
+        
+        ## full windows from k_lo to k_hi
+        k_lo = np.maximum(-((win - h - ts) // step), 0)
+        k_hi = np.minimum((te - h) // step, n_full[idx] - 1)
+        valid = (te - ts >= h) & (k_lo <= k_hi)
+        diff += np.bincount(offset[idx[valid]] + k_lo[valid], minlength=total)
+        diff -= np.bincount(offset[idx[valid]] + k_hi[valid] + 1, minlength=total)
+
+        ## truncated windows
+        _tail, _h = tail[idx], tail_h[idx]
+        valid = ((_tail >= 0) & (te - ts >= _h) & (te - _tail >= _h) 
+                    & (length[idx] - ts >= _h))
+        tail_counts += np.bincount(idx[valid], minlength=len(windows))
+    
+    counts = np.cumsum(diff)
+    res = []
+    for i, chrom in enumerate(windows.index):
+        starts = np.arange(n_full[i]) * step
+        ends = starts + win
+        _counts = counts[offset[i]: offset[i] + n_full[i]]
+        if tail[i] >= 0:
+            starts = np.r_[starts, tail[i]]
+            ends = np.r_[ends, length[i]]
+            _counts = np.r_[_counts, tail_counts[i]]
+        res.append(pd.DataFrame({'chrom': chrom, 'start': starts, 
+                                 'end': ends, 'count': _counts}))
     
+    return pd.concat(res, ignore_index=True) if res else pd.DataFrame(
+                columns=['chrom', 'start', 'end', 'count'])
+
+
+def calculate_depth(paf, fastaFile, output, winsize=5000, step=1000, min_mapq=2):
+    """
+    calculate the depth of sliding windows natively, the same output 
+        `{output}.q{min_mapq}.depth` as `bedtools intersect -f 0.5 -c`.
+    """
     fasta_prefix = Path(fastaFile).stem
     contigsizes = f"{fasta_prefix}.contigsizes"
     if not Path(contigsizes).exists():
-        cmd = ["cphasing-rs", "chromsizes", fastaFile, 
-                    "-o", str(contigsizes)]
-        flag = run_cmd(cmd)
-        assert flag == 0, "Failed to execute command, please check log."
+        with open(contigsizes, 'w') as out:
+            for contig, seq in iter_fasta_bytes(fastaFile):
+                out.write(f"{contig}\t{len(seq)}\n")
     
-
-    cmd = f"bedtools makewindows -g {contigsizes} -w {winsize} -s {step} 2>/dev/null > temp.{fasta_prefix}.w{winsize}.s{step}.bed"
-    os.system(cmd)
-
-    if paf[-2:] == "gz":
-        cmd = "LC_ALL=C zgrep -F -v 'tp:A:S' {}".format(paf)
-    else:
-        cmd = "LC_ALL=C fgrep -v 'tp:A:S' {}".format(paf)
-    cmd += " | awk '$12>=%d {print $6,$8,$9}' OFS='\t' " % (min_mapq)
-    cmd += " > temp.{}.paf.bed".format(output)
-    os.system(cmd)
-
-    cmd = f"bedtools intersect -f 0.5 -a temp.{fasta_prefix}.w{winsize}.s{step}.bed -b temp.{output}.paf.bed -c 2>/dev/null > {output}.q{min_mapq}.depth"
-    os.system(cmd)
-
-    # os.remove(f"temp.{fasta_prefix}.w{winsize}.s{step}.bed")
-    # os.remove(f"temp.{output}.paf.bed")
+    depth_df = window_depth(paf, read_chrom_sizes(contigsizes), 
+                            int(winsize), int(step), min_mapq)
+    depth_df.to_csv(f"{output}.q{min_mapq}.depth", sep='\t', header=False, index=False)
 
     return contigsizes
 
@@ -150,19 +177,7 @@ def calculate_depth_by_bedtools(paf, fastaFile, output, winsize=5000, step=1000,
 def workflow(paf, fastaFile, win, step, outPre, min_mapq=2):
     ## 
     win = int(win)
-    # pafDic = read_paf(paf)
-    # genomeSize = read_fasta(fastaFile)
-    # binDic, winDic = build_windic(genomeSize, win)
-
-    # winDic = bin_reads(pafDic, winDic, win)
-    # depthDic = cal_depth(winDic)
-    # with Pool(processes=4) as p:
-    #     winDic = p.starmap(bin_reads, [(pafDic, winDic, win) for _ in range(p._processes)])
-
-    # with Pool(processes=4) as p:
-    #     depthDic = p.starmap(cal_depth, [(winDic,) for _ in range(p._processes)])
-    # output(outPre, depthDic)
-    contigsizes = calculate_depth_by_bedtools(paf, fastaFile, outPre, win, step, min_mapq=min_mapq)
+    contigsizes = calculate_depth(paf, fastaFile, outPre, win, step, min_mapq=min_mapq)
 
     return contigsizes, f'{outPre}.q{min_mapq}.depth'
 
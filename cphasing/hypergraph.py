@@ -7,7 +7,6 @@ extract the hyperedges from pore-c table
 
 import logging
 import gc
-import msgspec
 import os
 import os.path as op
 import sys
@@ -23,8 +22,8 @@ from pandarallel import pandarallel
 from pytools import natsorted
 from subprocess import Popen, PIPE
 
-from .pqs import PQS
-from .algorithms.hypergraph import HyperEdges
+from .pqs import PQS, contig_lookup, contig_lookup_table
+from .algorithms.hypergraph import HyperEdges, HyperEdgesBuilder, save_hyperedges
 from .utilities import (listify, 
                         list_flatten, 
                         is_compressed_table_empty, 
@@ -94,13 +93,14 @@ class Extractor:
         self.edges = self.generate_edges()
 
     @staticmethod
-    def _process_df(df, contig_idx, threads=1):
-        pandarallel.initialize(nb_workers=min(10, threads), verbose=0)
-        df['chrom1'] = df['chrom1'].parallel_map(contig_idx.get)
-        df['chrom2'] = df['chrom2'].parallel_map(contig_idx.get)
-        df = df.dropna(subset=['chrom1', 'chrom2'], axis=0, how="any")
+    def _process_df(df, contig_idx):
+        idx_table = contig_lookup_table(contig_idx, pl.UInt32)
+        df = df.with_columns(
+            contig_lookup('chrom1', idx_table).alias('chrom1'),
+            contig_lookup('chrom2', idx_table).alias('chrom2'),
+        ).drop_nulls(subset=['chrom1', 'chrom2'])
 
-        return df
+        return df.to_pandas()
 
     def generate_edges(self):
         """
@@ -155,26 +155,23 @@ class Extractor:
                 
                 chunks = p.read(min_mapq=self.min_mapq, return_as='files')
 
-                res = p.to_hg_df(chunks, self.contig_idx, self.min_mapq, 
-                                 edge_length=self.edge_length)
+                builder = HyperEdgesBuilder()
+                for df in p.iter_hg_df(chunks, self.contig_idx, self.min_mapq, 
+                                       edge_length=self.edge_length):
+                    builder.add_pairs(df['chrom1'].to_numpy(), 
+                                      df['chrom2'].to_numpy(), 
+                                      df['mapq'].to_numpy())
+                    del df 
                 
                 if Path(f"{pairs_prefix}.intersect.pqs").exists():
                     shutil.rmtree(f"{pairs_prefix}.intersect.pqs")  
-                
-                res = res.with_row_count("col")
-                df1 = res.select([
-                    pl.col("chrom1").alias("row"),
-                    pl.col("col"),
-                    pl.col("mapq")
-                ])
-            
-                df2 = res.select([
-                    pl.col("chrom2").alias("row"),
-                    pl.col("col"),
-                    pl.col("mapq")
-                ])
 
-                res = pl.concat([df1, df2]).to_pandas()
+                logger.info(f"Result of {builder.number_of_edges:,} raw "
+                            f"edges of {len(self.contig_idx):,} contigs. "
+                            "Note: it's not the final statistics for hypergraph.")
+                
+                logger.debug("Generating hyperedges ...")
+                return builder.to_hyperedges(self.contig_idx, self.contigsizes)
 
             else:
                 if is_compressed_table_empty(self.pairs_pathes[0]):
@@ -221,19 +218,12 @@ class Extractor:
                     
                     if self.edge_length:
                         edge_length = self.edge_length
+                        sizes_table = contig_lookup_table(self.contigsizes, pl.Int64)
                         p = (
                             p.with_columns(
                                 [
-                                    pl.col("chrom1")
-                                    .map_elements(
-                                        self.contigsizes.get, skip_nulls=False
-                                    )
-                                    .alias("length1"),
-                                    pl.col("chrom2")
-                                    .map_elements(
-                                        self.contigsizes.get, skip_nulls=False
-                                    )
-                                    .alias("length2"),
+                                    contig_lookup("chrom1", sizes_table).alias("length1"),
+                                    contig_lookup("chrom2", sizes_table).alias("length2"),
                                 ]
                             )
                             .filter(
@@ -245,9 +235,7 @@ class Extractor:
                             .select(["chrom1", "chrom2", "mapq"])
                         )
 
-                    p = p.to_pandas()
-
-                    res = Extractor._process_df(p, self.contig_idx, self.threads)   
+                    res = Extractor._process_df(p, self.contig_idx)   
                     
                     res = res.reset_index(drop=True).reset_index()
             
@@ -268,10 +256,7 @@ class Extractor:
                         if Path(f"temp.{pairs_prefix}.hcr.pairs").exists():
                             os.remove(f"temp.{pairs_prefix}.hcr.pairs")
                     
-
-                    p = p.to_pandas()
-
-                    res = Extractor._process_df(p, self.contig_idx, self.threads)   
+                    res = Extractor._process_df(p, self.contig_idx)   
                     res = res.reset_index(drop=True).reset_index()
                     res = pd.concat([res[['chrom1', 'index']].rename(
                                                 columns={'chrom1': 'row', 'index': 'col'}),
@@ -325,7 +310,7 @@ class Extractor:
                     if self.min_mapq > 0:
                         df = df.filter(pl.col('mapq') >= self.min_mapq)
 
-                    return df.to_pandas()
+                    return df
                 with Parallel(backend="loky", n_jobs=min(self.threads, len(p_list))) as parallel:   
                     res = parallel(n_jobs=min(self.threads, len(p_list)))(delayed(
                                 lambda x: read_csv(get_file(x)))(i) for i in p_list)
@@ -337,17 +322,17 @@ class Extractor:
                                     new_columns=['chrom1', 'chrom2'],
                                     dtypes=dtype)
     
-                    return df.to_pandas()
+                    return df
                 
                 res = Parallel(n_jobs=min(self.threads, len(p_list)))(delayed(
                                 lambda x: read_csv(get_file(x)))(i) for i in p_list)
                 
-            args = [ (i, self.contig_idx, threads_2) for i in res ]
+            args = [ (i, self.contig_idx) for i in res ]
         
 
             with Parallel(backend="loky", n_jobs=threads_1) as parallel:
                 res = parallel(n_jobs=threads_1)(delayed(
-                                Extractor._process_df)(i, j, k) for i, j, k in args)
+                                Extractor._process_df)(i, j) for i, j in args)
             
             if len(p.columns) >= 8  and isinstance(p[7].values[0], np.int64) and p[7].values[0] <= 60:
                 res = pd.concat(res, axis=0).reset_index(drop=True).reset_index()
@@ -374,23 +359,22 @@ class Extractor:
         logger.debug("Generating hyperedges ...")
         if 'mapq' in res.columns:
             return HyperEdges(idx=self.contig_idx, 
-                            row=res['row'].values.tolist(), 
-                            col=res['col'].values.tolist(),
+                            row=res['row'].values, 
+                            col=res['col'].values,
                             # count=np.ones(len(res['col']), dtype=np.uint32).tolist(),
                             contigsizes=self.contigsizes,
-                            mapq=res['mapq'].values.tolist())
+                            mapq=res['mapq'].values)
 
         else:
             return HyperEdges(idx=self.contig_idx, 
-                            row=res['row'].values.tolist(), 
-                            col=res['col'].values.tolist(),
+                            row=res['row'].values, 
+                            col=res['col'].values,
                             # count=np.ones(len(res['col']), dtype=np.uint32).tolist(),
                             contigsizes=self.contigsizes,
-                            mapq=[])
+                            mapq=np.array([], dtype=np.int8))
 
     def save(self, output):
-        with open(output, 'wb') as out:
-            out.write(msgspec.msgpack.encode(self.edges))
+        save_hyperedges(self.edges, output)
         
         logger.info(f"Successful output graph into `{output}`")
     
@@ -535,14 +519,13 @@ class ExtractorSplit:
                     f"hyperedges of {number_of_contigs:,} contigs. "
                     "Note: it's not the final statistics for hypergraph.")
         return HyperEdges(idx=self.split_contig_idx, 
-                            row=res['row'].values.flatten().tolist(), 
-                            col=res['col'].values.flatten().tolist(),
+                            row=res['row'].values.flatten(), 
+                            col=res['col'].values.flatten(),
                             contigsizes=self.split_contigsizes,
-                            mapq=[])
+                            mapq=np.array([], dtype=np.int8))
 
     def save(self, output):
-        with open(output, 'wb') as out:
-            out.write(msgspec.msgpack.encode(self.edges))
+        save_hyperedges(self.edges, output)
         
         logger.info(f"Successful output graph into `{output}`")
 
@@ -553,10 +536,9 @@ def process_pore_c_table(df, contig_idx, contigsizes, threads=1,
                             edge_length=2e6 
                           ):
     
-    df = df.with_columns(pl.col('chrom').map_elements(contig_idx.get).alias('chrom_idx')).drop_nulls()
-    df = df.with_columns(pl.col('chrom_idx').cast(pl.UInt32))
+    df = df.with_columns(contig_lookup('chrom', contig_idx, pl.UInt32).alias('chrom_idx')).drop_nulls()
     if edge_length:
-        df = df.with_columns(pl.col('chrom').map_elements(contigsizes.get, skip_nulls=False).alias('length')).drop_nulls()
+        df = df.with_columns(contig_lookup('chrom', contigsizes, pl.Int64).alias('length')).drop_nulls()
         df = df.with_columns(pl.col('length').cast(pl.UInt32),
                              (pl.col('start') + (pl.col('end') - pl.col('start'))//2).alias('pos')
                              )
@@ -803,7 +785,7 @@ class HyperExtractor:
                 if self.edge_length:
                     df_list = Parallel(n_jobs=self.threads)(delayed(
                         lambda x: x.with_columns([
-                            pl.col('chrom').map_elements(self.contigsizes.get).alias('length'),
+                            contig_lookup('chrom', self.contigsizes, pl.Int64).alias('length'),
                         ]).filter(
                             (pl.col('start') < self.edge_length) | (pl.col('end') > pl.col('length') - self.edge_length)
                         ).select(['read_idx', 'chrom', 'mapping_quality'])
@@ -880,10 +862,10 @@ class HyperExtractor:
 
         
         edges = HyperEdges(idx=self.contig_idx, 
-                       row=res_df['chrom_idx'].values.flatten().tolist(),
-                       col=res_df['read_idx'].values.flatten().tolist(),
-                    #    count=res_df['chrom_idx_count'].values.flatten().tolist(),
-                       mapq=mapping_quality_res.to_numpy().flatten().tolist(),
+                       row=res_df['chrom_idx'].values.flatten(),
+                       col=res_df['read_idx'].values.flatten(),
+                    #    count=res_df['chrom_idx_count'].values.flatten(),
+                       mapq=mapping_quality_res.to_numpy().flatten(),
                        contigsizes=self.contigsizes)
         
         
@@ -896,8 +878,7 @@ class HyperExtractor:
         return edges
     
     def save(self, output):
-        with open(output, 'wb') as out:
-            out.write(msgspec.msgpack.encode(self.edges))
+        save_hyperedges(self.edges, output)
 
         logger.info(f"Successful output hypergraph into `{output}`")
 
@@ -1049,16 +1030,15 @@ class HyperExtractorSplit:
 
 
         edges = HyperEdges(idx=self.split_contig_idx, 
-                       row=res_df['chrom_idx'].values.flatten().tolist(),
-                       col=res_df['read_idx'].values.flatten().tolist(),
-                       mapq=mapping_quality_res.values.flatten().tolist(),
+                       row=res_df['chrom_idx'].values.flatten(),
+                       col=res_df['read_idx'].values.flatten(),
+                       mapq=mapping_quality_res.values.flatten(),
                        contigsizes=self.split_contigsizes)
         
 
         return edges 
 
     def save(self, output):
-        with open(output, 'wb') as out:
-            out.write(msgspec.msgpack.encode(self.edges))
+        save_hyperedges(self.edges, output)
 
         logger.info(f"Successful output hypergraph into `{output}`")        
\ No newline at end of file
@@ -11,7 +11,7 @@ import igraph as ig
 import pandas as pd
 
 
-from collections import defaultdict, OrderedDict 
+from collections import Counter, defaultdict, OrderedDict 
 from itertools import (
     permutations, 
     combinations, 
@@ -23,6 +23,7 @@ from joblib import Parallel, delayed, parallel_backend
 from scipy.sparse import hstack, csr_matrix
 from pathlib import Path
 from pprint import pformat
+from tempfile import TemporaryDirectory
 from rich.console import Console
 from rich.table import Table
 
@@ -30,7 +31,9 @@ from . import console_html
 from .algorithms.hypergraph import (
     HyperGraph,
     IRMM,
-    extract_incidence_matrix2, 
+    CliqueExpansionCache,
+    SharedIncidenceMatrix,
+    resolution_sweep,
     )
 from .algorithms.scaffolding import (
     raw_sort
@@ -84,6 +87,9 @@ class HyperPartition:
         number of threads
     chunksize: None (default) or int
         not use
+    expansion_cache: None (default) or str
+        directory to store the clique expansions, rerun on the same 
+        hypergraph will skip the expansion
 
     """
     def __init__(self, edges, 
@@ -129,7 +135,8 @@ class HyperPartition:
                     threshold=0.01,
                     max_round=1, 
                     threads=4,
-                    chunksize=None
+                    chunksize=None,
+                    expansion_cache=None
                     ):
         
         self.edges = edges
@@ -186,6 +193,7 @@ class HyperPartition:
         self.max_round = max_round
         self.threads = threads
         self.chunksize = int(chunksize) if chunksize else None
+        self.expansion_cache = CliqueExpansionCache(expansion_cache)
         
         self.log_dir = "logs"
         Path(self.log_dir).mkdir(exist_ok=True)
@@ -276,6 +284,12 @@ class HyperPartition:
         return vertices_idx_sizes
 
     
+    def get_expansion(self):
+        """
+        raw clique expansion of current hypergraph from the cache
+        """
+        return self.expansion_cache.get(self.H, self.vertices, self.HG.min_quality)
+
     def get_hypergraph(self):
         if self.chunksize:
             from .algorithms.hypergraph import generate_hypergraph
@@ -352,7 +366,7 @@ class HyperPartition:
         else:
             NW = None
 
-        A = HyperGraph.clique_expansion_init(self.H, NW=NW)
+        A = HyperGraph.clique_expansion_init(self.H, NW=NW, A=self.get_expansion())
         kph = KPruneHyperGraph(self.alleletable, A, vertices_idx)
         kph.run() 
         kph.prunetable = kph.get_prune_table() 
@@ -433,16 +447,18 @@ class HyperPartition:
         return P_allelic_idx, P_weak_idx, pair_df
 
     def get_normalize_weight(self):
+        """
+        per-vertex normalize weight (1 / length), the pairwise weight 
+            1 / (length_i * length_j) is applied as sparse diagonal products.
+        """
         contig_sizes = self.contigsizes
        
         vertices_length = contig_sizes.loc[self.vertices]
 
-        a = vertices_length['length'].astype('float32')
+        a = vertices_length['length'].values.astype('float32')
+        
+        NW = 1 / a
         
-        # NW = np.log10((a.max() ** 2 ) / np.outer(a, a))
-        NW = 1 / np.outer(a, a)
-        # NW = np.ones(NW.shape)
-        # print(NW)
         return NW
 
     @staticmethod
@@ -504,7 +520,8 @@ class HyperPartition:
         A = self.HG.clique_expansion_init(self.H, self.P_allelic_idx, self.P_weak_idx, 
                                           NW=self.NW,
                                           allelic_factor=self.allelic_factor, 
-                                          min_weight=self.min_weight)
+                                          min_weight=self.min_weight,
+                                          A=self.get_expansion())
         
         dia = A.diagonal()
         raw_contig_counts = A.shape[0]
@@ -513,7 +530,8 @@ class HyperPartition:
 
         if len(retain_idx) < raw_contig_counts:
             A = A[retain_idx, :][:, retain_idx]
-            self.H, _, _ = extract_incidence_matrix2(self.H, retain_idx)
+            self.H = self.expansion_cache.subset(self.H, retain_idx, self.vertices, 
+                                                 self.HG.min_quality)
             self.vertices = self.vertices[retain_idx]
 
             logger.info(f"Removed {raw_contig_counts - contig_counts:,} contigs that self edge weight < {self.min_cis_weight} (--min-cis-weight).")
@@ -637,7 +655,7 @@ class HyperPartition:
     def _incremental_partition(
                                 # raw_K, raw_A, raw_idx_to_vertices, 
                                 K, 
-                                idx_to_vertices, 
+                                vertices, 
                                 k, alleletable, prune_pair_df,
                                 H, vertices_idx_sizes, NW, resolution, 
                                 output_dir="./", init_resolution=0.8, min_weight=1, 
@@ -645,9 +663,16 @@ class HyperPartition:
                                 min_allelic_overlap=0.1, allelic_factor=-1, cross_allelic_factor=0.0,
                                 is_remove_misassembly=False, is_recluster_contigs=False,
                                 min_scaffold_length=10000, threshold=0.01, max_round=1, num=None,
-                                kprune_norm_method='cis', threads=1):
+                                kprune_norm_method='cis', threads=1, 
+                                min_quality=1, shared_A=None, expansion_cache=None,
+                                parent_key=None):
         """
         single function for incremental_partition.
+            The clique expansions of sub-group are taken from `expansion_cache`,
+            and sliced from the shared expansion of `H` when possible,
+            `parent_key` is the key of `H` in `expansion_cache`.
+            `vertices`, `NW` and `alleletable` only hold the contigs of `K`,
+            in the order of `K`.
         """
         if k == 1:
             return None, None, [K]
@@ -657,31 +682,47 @@ class HyperPartition:
         else:
             merge_method = "mean"
 
+        if isinstance(H, SharedIncidenceMatrix):
+            H = H.load()
+        
+        if isinstance(shared_A, SharedIncidenceMatrix):
+            shared_A = shared_A.load()
+
+        if expansion_cache is None:
+            expansion_cache = CliqueExpansionCache()
+
         K = np.array(list(K))
-        sub_H, _, sub_edge_idx = extract_incidence_matrix2(H, K)
+        vertices = np.asarray(vertices)
+        sub_H = expansion_cache.subset(H, K, None, min_quality, 
+                                       parent_A=shared_A, parent_key=parent_key,
+                                       sub_vertices=vertices)
         
         ## remove low weigth contigs
-        sub_A = HyperGraph.clique_expansion_init(sub_H, min_weight=min_weight)
+        sub_A = HyperGraph.clique_expansion_init(sub_H, min_weight=min_weight, 
+                                    A=expansion_cache.get(sub_H, vertices, min_quality))
         dia = sub_A.diagonal()
         raw_contig_counts = len(K)
-        K = K[np.where(dia > min_cis_weight)[0]]
-        contig_counts = len(K)
+        retain_idx = np.where(dia > min_cis_weight)[0]
+        contig_counts = len(retain_idx)
         if contig_counts == 0:
             return None, None, None
         if (raw_contig_counts - contig_counts) > 0:
             logger.info(f"Removed {raw_contig_counts - contig_counts:,} contigs that self edge weight < {min_cis_weight} (--min-cis-weight).")
-            sub_H, _, sub_edge_idx = extract_incidence_matrix2(H, K)
+            ## sub_H holds all hyperedges of H with at least two vertices in K
+            sub_H = expansion_cache.subset(sub_H, retain_idx, vertices, min_quality)
+            K = K[retain_idx]
+            vertices = vertices[retain_idx]
+            if NW is not None:
+                NW = NW[retain_idx]
 
 
         del H 
         gc.collect() 
 
-        if NW is not None:
-            sub_NW = NW[list(K)][:, list(K)]
-        else:
-            sub_NW = None
+        sub_NW = NW
 
-        sub_A = HyperGraph.clique_expansion_init(sub_H, NW=sub_NW, min_weight=min_weight)
+        sub_A = HyperGraph.clique_expansion_init(sub_H, NW=sub_NW, min_weight=min_weight,
+                                    A=expansion_cache.get(sub_H, vertices, min_quality))
 
         sub_old2new_idx = dict(zip(K, range(len(K))))
         
@@ -689,7 +730,7 @@ class HyperPartition:
         sub_vertices_new_idx_sizes = sub_vertices_idx_sizes
         sub_vertices_new_idx_sizes.index = sub_vertices_idx_sizes.index.map(sub_old2new_idx.get)
 
-        sub_vertices = np.array(list(idx_to_vertices[i] for i in K))
+        sub_vertices = vertices
         sub_vertives_idx = dict(zip(sub_vertices, range(len(sub_vertices))))
         
         if alleletable:
@@ -739,38 +780,31 @@ class HyperPartition:
         #                                   sub_NW,
         #                                   allelic_factor, min_weight)
         if resolution < 0.0 and k != 0:
-            tmp_resolution = init_resolution
-            result_K_length = 0
-            auto_round = 1
-
-            while result_K_length < k:
-                if tmp_resolution > 10.0 or auto_round > 50:
-                    break
-                # logger.info(f"Automaticly to search best resolution ... {tmp_resolution}")
-                raw_A, A, cluster_assignments, new_K = IRMM(sub_H, sub_A, sub_NW, 
+            def group_filter(new_K):
+                return list(filter(
+                                lambda x: sub_vertices_new_idx_sizes.reindex(list(x)).sum().values[0] \
+                                    >= min_scaffold_length, new_K))
+            
+            if max_round > 1:
+                raw_A, A, cluster_assignments, new_K, _ = HyperPartition.linear_resolution_search(
+                                                    sub_H, sub_A, sub_NW, k, 
+                                                    allelic_factor, cross_allelic_factor,
+                                                    init_resolution, min_weight, 
+                                                    threshold, max_round, 
+                                                    sub_P_allelic_idx, sub_P_weak_idx,
+                                                    group_filter=group_filter, 
+                                                    threads=1, outprefix=num)
+            else:
+                raw_A, A, cluster_assignments, new_K, _ = resolution_sweep(
+                                                    sub_H, sub_A, k, 
                                                     sub_P_allelic_idx, 
                                                     sub_P_weak_idx,
                                                     allelic_factor,
                                                     cross_allelic_factor,
-                                                    tmp_resolution,
-                                                    min_weight,
-                                                    threshold, 
-                                                    max_round, 
-                                                    threads=1, 
-                                                    outprefix=num)
-                new_K = list(filter(
-                                lambda x: sub_vertices_new_idx_sizes.reindex(x).sum().values[0] \
-                                    >= min_scaffold_length, new_K)
-                )
-                # filtered_K = list(filter(
-                #                 lambda x: sub_vertices_new_idx_sizes.reindex(x).sum().values[0] \
-                #                     < min_scaffold_length, new_K)
-                # )
-              
-                new_K = list(map(list, new_K))
-                tmp_resolution += 0.2  
-                result_K_length = len(new_K)
-                auto_round += 1
+                                                    init_resolution=init_resolution,
+                                                    group_filter=group_filter,
+                                                    threads=threads)
+            new_K = list(map(list, group_filter(new_K)))
              
         else:
             raw_A, A, cluster_assignments, new_K = IRMM(sub_H, sub_A, sub_NW, 
@@ -825,7 +859,9 @@ class HyperPartition:
 
         if sub_prune_pair_df is not None and is_remove_misassembly:
             new_K = HyperPartition._remove_misassembly(new_K, sub_H, sub_prune_pair_df, 
-                                                        allelic_similarity=allelic_similarity)
+                                                        allelic_similarity=allelic_similarity,
+                                                        A=expansion_cache.get(sub_H, vertices, 
+                                                                              min_quality))
         
         if is_recluster_contigs:
                 new_K = HyperPartition.recluster_contigs(new_K, k, A, raw_A,
@@ -880,10 +916,39 @@ class HyperPartition:
         return A, cluster_assignments, new_K
     
 
+    @staticmethod
+    def linear_resolution_search(H, A, NW, k, allelic_factor, cross_allelic_factor,
+                                 init_resolution=0.8, min_weight=1, threshold=0.01, 
+                                 max_round=1, P_allelic_idx=None, P_weak_idx=None,
+                                 group_filter=None, threads=1, outprefix="all"):
+        """
+        search resolution by +0.2 step until the number of groups reach `k`,
+            only used when IRMM reweight the hyperedges (max_round > 1), 
+            because the graph is changed in each resolution.
+        """
+        tmp_resolution = init_resolution
+        result_K_length = 0
+        auto_round = 1
+        res = None
+        while result_K_length < k:
+            if (tmp_resolution > 10.0 or auto_round > 50) and res is not None:
+                break
+            
+            res = IRMM(H, A, NW, P_allelic_idx, P_weak_idx, 
+                        allelic_factor, cross_allelic_factor,
+                        tmp_resolution, min_weight, threshold, max_round, 
+                        threads=threads, outprefix=outprefix) + (tmp_resolution, )
+            new_K = res[3] if group_filter is None else group_filter(res[3])
+            result_K_length = len(new_K)
+            tmp_resolution += 0.2
+            auto_round += 1
+        
+        return res
+
     def kprune(self, alleletable, first_cluster_file=None, contacts=None, is_run=True):
         if is_run:
             if not contacts or not Path(contacts).exists():
-                A = HyperGraph.clique_expansion_init(self.H)
+                A = HyperGraph.clique_expansion_init(self.H, A=self.get_expansion())
                 contacts = "hypergraph.expansion.contacts"
                 HyperGraph.to_contacts(A, self.vertices , NW=self.NW, min_weight=self.min_weight, output=contacts)
        
@@ -983,6 +1048,45 @@ class HyperPartition:
 
         return P_allelic_idx, P_weak_idx, prune_pair_df
 
+    @staticmethod
+    def split_alleletable(alleletable, groups):
+        """
+        split the allele table into the sub-tables of groups in one pass,
+            a row is written into the sub-table of a group when at least two 
+            of its contigs are in the group, other rows pair no contigs 
+            of the group. Comment lines of the contigs in other groups are dropped.
+
+        Params:
+        --------
+        alleletable: str
+            path of allele table
+        groups: dict
+            {output path: contigs of group}
+        """
+        contig_to_output = {contig: output for output, contigs in groups.items() 
+                                for contig in contigs}
+        handles = {output: open(output, 'w') for output in groups}
+        try:
+            with open(alleletable, 'r') as fp:
+                for line in fp:
+                    if not line.strip():
+                        continue
+                    
+                    if line[0] == "#":
+                        fields = line[1:].split()
+                        output = contig_to_output.get(fields[0]) if fields else None
+                        outputs = [output] if output else handles
+                    else:
+                        counts = Counter(map(contig_to_output.get, line.split()[2:]))
+                        outputs = [output for output, count in counts.items() 
+                                        if output and count >= 2]
+                    
+                    for output in outputs:
+                        handles[output].write(line)
+        finally:
+            for handle in handles.values():
+                handle.close()
+
     def incremental_partition(self, k, first_cluster=None):
         """
         incremental partition for autopolyploid.
@@ -994,7 +1098,8 @@ class HyperPartition:
         A = HyperGraph.clique_expansion_init(self.H, self.P_allelic_idx, self.P_weak_idx, 
                                           NW=self.NW,
                                           allelic_factor=self.allelic_factor, 
-                                          min_weight=self.min_weight)
+                                          min_weight=self.min_weight,
+                                          A=self.get_expansion())
         
      
         dia = A.diagonal()
@@ -1005,7 +1110,8 @@ class HyperPartition:
         
         if len(retain_idx) < raw_contig_counts:
             A = A[retain_idx, :][:, retain_idx]
-            self.H, _, _ = extract_incidence_matrix2(self.H, retain_idx)
+            self.H = self.expansion_cache.subset(self.H, retain_idx, self.vertices, 
+                                                 self.HG.min_quality)
             self.vertices = self.vertices[retain_idx]
             logger.info(f"Removed {raw_contig_counts - contig_counts:,} contigs that self edge weight < {self.min_cis_weight} (--min-cis-weight).")
 
@@ -1015,25 +1121,26 @@ class HyperPartition:
         if not first_cluster:
             
             if self.resolution1 < 0 :
-                result_K_length = 0
-                tmp_resolution = self.init_resolution1
-                auto_round = 1
-                while result_K_length < k[0] and k[0] != 0:
-                    if tmp_resolution > 10.0 or auto_round > 50:
-                        break
-                    logger.info(f"Automatic search for best resolution ... {tmp_resolution:.1f}")
-                    _, A, _, self.K = IRMM(self.H, A, self.NW, 
-                            None, None, self.allelic_factor, 
-                                self.cross_allelic_factor, tmp_resolution, 
-                                self.min_weight, self.threshold, 
-                                self.max_round, threads=self.threads)
-
-                    self.K = list(map(list, self.K))
-                    self.K = self.filter_cluster(verbose=0)
-                    result_K_length = len(self.K)
-                    logger.info(f"Generated `{result_K_length}` groups at resolution `{tmp_resolution:.1f}`.")
-                    tmp_resolution += 0.2
-                    auto_round += 1
+                if k[0] != 0:
+                    logger.info(f"Automatic search for best resolution from {self.init_resolution1:.1f} ...")
+                    def group_filter(K):
+                        return self.filter_cluster(list(map(list, K)), verbose=0)
+                    
+                    if self.max_round > 1:
+                        _, A, _, self.K, best_resolution = HyperPartition.linear_resolution_search(
+                                        self.H, A, self.NW, k[0], self.allelic_factor,
+                                        self.cross_allelic_factor, self.init_resolution1, 
+                                        self.min_weight, self.threshold, self.max_round, 
+                                        group_filter=group_filter, threads=self.threads)
+                    else:
+                        _, A, _, self.K, best_resolution = resolution_sweep(
+                                        self.H, A, k[0], 
+                                        allelic_factor=self.allelic_factor, 
+                                        cross_allelic_factor=self.cross_allelic_factor,
+                                        init_resolution=self.init_resolution1, 
+                                        group_filter=group_filter,
+                                        threads=self.threads, verbose=True)
+                    logger.info(f"Selected resolution `{best_resolution:.1f}`.")
             else:
                 _, A, _, self.K = IRMM(self.H, A, self.NW, 
                             None, None, self.allelic_factor, 
@@ -1165,7 +1272,7 @@ class HyperPartition:
         args = []
         results = []
         self.exclude_groups = []
-        idx_to_vertices = self.idx_to_vertices
+        sub_alleletables = {}
   
         if self.fasta is not None and self.alleletable is None and self.prunetable is None:
            
@@ -1182,42 +1289,88 @@ class HyperPartition:
         Path("kprune_workdir").mkdir(exist_ok=True)
         current_dir = Path.cwd()
 
-        for num, sub_k in enumerate(self.K, 1):
-            if isinstance(k[1], dict):
-                sub_group_number = int(k[1][num - 1])
-            else:
-                sub_group_number = int(k[1])
+        ## the expansion of H is only shared when it is already cached,
+        ## then the expansions of closed sub-groups are sliced from it
+        ## H is hashed once here, rather than in each worker
+        parent_key = self.expansion_cache.key(self.H, self.vertices, self.HG.min_quality)
+        parent_A = self.expansion_cache.lookup(parent_key)
+        ## publish H once, workers attach to it by memory-mapping instead of unpickling a copy
+        shared_tmpdir = TemporaryDirectory(suffix="_shared_H", 
+                                           dir=SharedIncidenceMatrix.shared_dir(
+                                               SharedIncidenceMatrix.nbytes(self.H, parent_A)))
+        shared_H, shared_A = None, None
+        try:
+            shared_H = SharedIncidenceMatrix(self.H, shared_tmpdir.name)
+            if parent_A is not None:
+                Path(f"{shared_tmpdir.name}/A").mkdir()
+                shared_A = SharedIncidenceMatrix(parent_A, f"{shared_tmpdir.name}/A")
+
+            if prune_pair_df is not None:
+                prune_pair_contig1 = prune_pair_df.index.get_level_values(0)
+                prune_pair_contig2 = prune_pair_df.index.get_level_values(1)
+
+            for num, sub_k in enumerate(self.K, 1):
+                if isinstance(k[1], dict):
+                    sub_group_number = int(k[1][num - 1])
+                else:
+                    sub_group_number = int(k[1])
 
-            if self.exclude_group_to_second:
-                if num in self.exclude_group_to_second:
-                    self.exclude_groups.append(sub_k)
-                    continue
+                if self.exclude_group_to_second:
+                    if num in self.exclude_group_to_second:
+                        self.exclude_groups.append(sub_k)
+                        continue
     
-            # sub_raw_k = raw_K[num - 1]
-            args.append((
-                        # sub_raw_k, raw_A, raw_idx_to_vertices, 
-                        sub_k, 
-                        idx_to_vertices, 
-                        sub_group_number, self.alleletable, prune_pair_df,
-                        self.H, vertices_idx_sizes, self.NW,
-                        self.resolution2, current_dir, self.init_resolution2, 
-                        self.min_weight, self.min_cis_weight,
-                        self.allelic_similarity,  self.min_allelic_overlap, 
-                        self.allelic_factor, self.cross_allelic_factor, self.is_remove_misassembly,
-                        self.is_recluster_contigs,
-                        self.min_scaffold_length, self.threshold, self.max_round, num,
-                        self.kprune_norm_method, sub_threads))
+                ## only send the rows of this group
+                sub_vertices = self.vertices[sub_k]
+                sub_vertices_idx_sizes = vertices_idx_sizes.reindex(sub_k)
+                sub_NW = self.NW[sub_k] if self.NW is not None else None
+                if self.alleletable:
+                    sub_alleletable = f"{current_dir}/kprune_workdir/{num}.allele.table"
+                    sub_alleletables[sub_alleletable] = sub_vertices
+                else:
+                    sub_alleletable = self.alleletable
+                if prune_pair_df is not None:
+                    sub_prune_pair_df = prune_pair_df[prune_pair_contig1.isin(sub_k) 
+                                                        & prune_pair_contig2.isin(sub_k)]
+                else:
+                    sub_prune_pair_df = None
+
+                # sub_raw_k = raw_K[num - 1]
+                args.append((
+                            # sub_raw_k, raw_A, raw_idx_to_vertices, 
+                            sub_k, 
+                            sub_vertices, 
+                            sub_group_number, sub_alleletable, sub_prune_pair_df,
+                            shared_H, sub_vertices_idx_sizes, sub_NW,
+                            self.resolution2, current_dir, self.init_resolution2, 
+                            self.min_weight, self.min_cis_weight,
+                            self.allelic_similarity,  self.min_allelic_overlap, 
+                            self.allelic_factor, self.cross_allelic_factor, self.is_remove_misassembly,
+                            self.is_recluster_contigs,
+                            self.min_scaffold_length, self.threshold, self.max_round, num,
+                            self.kprune_norm_method, sub_threads,
+                            self.HG.min_quality, shared_A, self.expansion_cache, parent_key))
             
-            # results.append(HyperPartition._incremental_partition(args[-1])
+                # results.append(HyperPartition._incremental_partition(args[-1])
+            
+            if sub_alleletables:
+                HyperPartition.split_alleletable(self.alleletable, sub_alleletables)
  
-        with parallel_backend('loky', n_jobs=min(self.threads, len(args))):
-            try:
-                results = Parallel(n_jobs=min(self.threads, len(args)), return_as="generator")(
-                            delayed(HyperPartition._incremental_partition)(*a) for a in args)
-            except TypeError:
-                results = Parallel(n_jobs=min(self.threads, len(args)))(
-                            delayed(HyperPartition._incremental_partition)(*a) for a in args)
-            results = list(filter(lambda x: x[2] is not None, results))
+            with parallel_backend('loky', n_jobs=min(self.threads, len(args))):
+                try:
+                    results = Parallel(n_jobs=min(self.threads, len(args)), return_as="generator")(
+                                delayed(HyperPartition._incremental_partition)(*a) for a in args)
+                except TypeError:
+                    results = Parallel(n_jobs=min(self.threads, len(args)))(
+                                delayed(HyperPartition._incremental_partition)(*a) for a in args)
+                results = list(filter(lambda x: x[2] is not None, results))
+        finally:
+            ## also remove the files in `/dev/shm` on errors
+            for shared in (shared_H, shared_A):
+                if shared is not None:
+                    shared.remove()
+            del shared_H, shared_A
+            shared_tmpdir.cleanup()
  
 
         self.sub_A_list, self.cluster_assignments, results = zip(*results)
@@ -1393,7 +1546,8 @@ class HyperPartition:
         A = self.HG.clique_expansion_init(self.H, self.P_allelic_idx, self.P_weak_idx, 
                                           NW=self.NW,
                                           allelic_factor=self.allelic_factor, 
-                                          min_weight=self.min_weight)
+                                          min_weight=self.min_weight,
+                                          A=self.get_expansion())
         
         _K = groups
         self.K = list(list(map(lambda x: vertices_idx[x], i)) for i in _K)
@@ -1435,7 +1589,8 @@ class HyperPartition:
         tmp_df = self.prune_pair_df[(self.prune_pair_df['type'] == 0) & 
                                     (self.prune_pair_df['similarity'] >= self.allelic_similarity)][['contig1', 'contig2']]
         P_allelic_idx = [tmp_df['contig1'], tmp_df['contig2']]
-        A = HyperGraph.clique_expansion_init(self.H, P_allelic_idx, allelic_factor=0)
+        A = HyperGraph.clique_expansion_init(self.H, P_allelic_idx, allelic_factor=0, 
+                                             A=self.get_expansion())
 
         allelic_idx_set = set(map(tuple, tmp_df.values))
         cadinate_missassembly_groups = []
@@ -1491,7 +1646,7 @@ class HyperPartition:
             self.K[corrected_idx[idx]].append(idx)
 
     @staticmethod
-    def _remove_misassembly(K, sub_H, prune_pair_df=None, allelic_similarity=0.85):
+    def _remove_misassembly(K, sub_H, prune_pair_df=None, allelic_similarity=0.85, A=None):
         
         if prune_pair_df is None:
             return K
@@ -1502,7 +1657,7 @@ class HyperPartition:
         # A = sub_raw_A.tolil()
         # A[P_allelic_idx[0], P_allelic_idx[1]] = 0
         # A = A.tocsr()
-        A = HyperGraph.clique_expansion_init(sub_H, P_allelic_idx, allelic_factor=0)
+        A = HyperGraph.clique_expansion_init(sub_H, P_allelic_idx, allelic_factor=0, A=A)
         cadinate_missassembly_groups = []
         removed_missassembly_groups = []
         raw_group_idx_db = {}
@@ -1863,34 +2018,36 @@ class HyperPartition:
         
         return contigsizes.loc[k].sum().values[0]
     
-    def filter_cluster(self, verbose=1):
+    def filter_cluster(self, K=None, verbose=1):
+        """
+        remove the groups shorter than `min_scaffold_length`.
+
+        Params:
+        --------
+        K: list, default None
+            groups to filter, `self.K` and `self.inc_chr_idx` are filtered if None,
+            otherwise no attribute is touched
+        """
         if verbose == 1: 
             logger.info(f"Removed groups less than {to_humanized2(self.min_scaffold_length)} in length. (--min-scaffold-length)")
 
-        try: 
-            self.inc_chr_idx 
-            pop_idx = []
-            _K = []
-            for i, group in enumerate(self.K):
-                _size = HyperPartition.get_k_size(
-                            group, self.contigsizes, self.idx_to_vertices)
-                if _size >= self.min_scaffold_length:
-                    _K.append(group)
-                else:
-                    pop_idx.append(i)
-            
-            _new_inc_chr_idx = []
-            for i, idx in enumerate(self.inc_chr_idx):
-                if i not in pop_idx:
-                    _new_inc_chr_idx.append(idx)
-            self.inc_chr_idx = _new_inc_chr_idx
-
-        except AttributeError:
-            _K = list(
-                filter(lambda x: HyperPartition.get_k_size(
-                        x, self.contigsizes, self.idx_to_vertices) \
-                            >= self.min_scaffold_length, 
-                        self.K))
+        is_self = K is None
+        if is_self:
+            K = self.K
+
+        _K = []
+        pop_idx = []
+        for i, group in enumerate(K):
+            _size = HyperPartition.get_k_size(
+                        group, self.contigsizes, self.idx_to_vertices)
+            if _size >= self.min_scaffold_length:
+                _K.append(group)
+            else:
+                pop_idx.append(i)
+
+        if is_self and hasattr(self, 'inc_chr_idx'):
+            self.inc_chr_idx = [idx for i, idx in enumerate(self.inc_chr_idx) 
+                                    if i not in pop_idx]
             
         return _K 
         
@@ -11,43 +11,29 @@ import gc
 import os
 import os.path as op
 import sys
-import tempfile
 
 import cooler
 import igraph as ig
 import numpy as np
-import msgspec
 import pandas as pd 
 
 from collections import defaultdict
 from copy import deepcopy
 # from deprecated.sphinx import deprecated
-from itertools import product
-from joblib import Parallel, delayed
-from multiprocessing import Manager
+from functools import lru_cache
+from itertools import product, permutations
+from math import perm
 from pathlib import Path
-from scipy.sparse import triu
+from scipy.sparse import csr_matrix, triu
 
 
 
 from .core import AlleleTable, CountRE
-from .utilities import list_flatten, run_cmd
+from .utilities import run_cmd
 
 logger = logging.getLogger(__name__)
 
 
-class ContigPairs(msgspec.Struct):
-    ctg1: int 
-    ctg2: int
-    l1: int
-    l2: int
-    scores: list
-
-    
-class CandidateContacts(msgspec.Struct):
-    data: list 
-
-
 class KPrunerRust:
     def __init__(self, alleletable, contacts,
                     #count_re,
@@ -87,14 +73,18 @@ class KPruner:
     generate a prune list by kmer similarity allele table
         rewrite of allhic prune to adapt the cool file.
 
+    The contacts are kept in a symmetric csr matrix and the allele groups 
+        in a padded index array, the contact pairs are then scored in batches, 
+        see `remove_weak_with_allelic`.
+
     Params:
     --------
     alleletable: str
         alleletable file
     coolfile: str
         path to whole contig contacts cool file
-    threads: int
-        number of threads
+    chunksize: int
+        number of contact pairs scored in one batch
 
     Examples:
     --------
@@ -105,11 +95,14 @@ class KPruner:
     >>> kp.save_prune_list('prune.contig.list')
     
     """
+    ## largest number of assignments that enumerated for an allele group pair,
+    ##   larger pairs (more than 7 alleles in both groups) fall back to igraph
+    MAX_ASSIGNMENTS = 5040
+
     def __init__(self, alleletable, coolfile, 
                 sort_by_similarity=True, count_re=None, 
                 whitelist=None,
-                chunksize=100000,
-                threads=4):
+                chunksize=100000):
         self.alleletable = AlleleTable(alleletable, sort=False, fmt='allele2')
         if sort_by_similarity:
             _alleletable = self.alleletable.data.sort_values(['similarity'], ascending=False)
@@ -127,79 +120,130 @@ class KPruner:
         self.coolfile = coolfile 
         
         self.chunksize = chunksize
-        self.threads = threads
 
         self.cool = cooler.Cooler(self.coolfile)
         self.contig2idx = dict(zip(self.cool.chromnames, range(len(self.cool.chromnames))))
         self.idx2contig = dict(zip(range(len(self.cool.chromnames)), self.cool.chromnames))
-        self.pixels1 = self.cool.matrix(balance=False, join=True, 
-                                       as_pixels=True)[:][['chrom1', 'chrom2', 'count']]
-        
-        
-        self.contig_pairs = self.pixels1[['chrom1', 'chrom2']].applymap(self.contig2idx.get).values.tolist()
-        self.contig_pairs = set(map(tuple, self.contig_pairs))
+        self.n_contigs = len(self.cool.chromnames)
+
+        bin2contig = self.cool.bins()[:]['chrom'].map(self.contig2idx.get).values
+        pixels = self.cool.pixels()[:]
+        row = bin2contig[pixels['bin1_id'].values].astype(np.int64)
+        col = bin2contig[pixels['bin2_id'].values].astype(np.int64)
+        count = pixels['count'].values.astype(np.float64)
+        del pixels 
+
+        self.contig_pairs = np.unique(row * self.n_contigs + col)
+        self.contig_pairs = np.c_[self.contig_pairs // self.n_contigs, 
+                                  self.contig_pairs % self.n_contigs]
 
         self.count_re = CountRE(count_re, minRE=1) if count_re else None
         if count_re:
             self.re_count_db = self.count_re.data.to_dict()['RECounts']
             self.re_count_db = defaultdict(lambda :0, self.re_count_db)
-            self.normalize_score(self.pixels1)
-
-        self.pixels2 = self.pixels1.copy()
-        self.pixels2.columns = ['chrom2', 'chrom1', 'count']
-     
-        self.pixels = pd.concat([self.pixels1, self.pixels2], axis=0)
-        self.pixels['chrom1'] = self.pixels['chrom1'].map(self.contig2idx.get)
-        self.pixels['chrom2'] = self.pixels['chrom2'].map(self.contig2idx.get)
-        self.pixels.set_index(['chrom1', 'chrom2'], inplace=True)
-        self.pixels.replace([np.inf, -np.inf], 0, inplace=True)
-        del self.pixels1, self.pixels2
+            count = self.normalize_score(row, col, count)
+
+        count[np.isinf(count)] = 0
+        self.score_matrix = self.get_score_matrix(row, col, count)
+        self._score_keys = self.score_keys(self.score_matrix)
+        del row, col, count 
         gc.collect()
 
-        self.allele_group_db = self.get_allele_group()
-        self.score_db = self.get_score_db()
+        self.allele_group, self.allele_group_length = self.get_allele_group()
 
         self.allelic_prune_list = []
         self.weak_prune_list = []
 
     def get_allele_group(self):
-        tmp_df = self.alleletable.data #.drop_duplicates(1)
-        tmp_df = tmp_df.applymap(self.contig2idx.get)
-        tmp_df = tmp_df.groupby(1, sort=False)[2].apply(lambda x: list(x))
-        
-        return tmp_df.to_dict()
-        # return tmp_df.set_index(1).to_dict()[2]
+        """
+        allele groups of contigs as padded index array, row i is 
+            [i, *alleles of i] padded by -1, and alleles that 
+            not in cool are set to -2, which always score zero.
+
+        Returns:
+        --------
+        allele_group: np.ndarray
+            (n_contigs, max_length) of contig idx
+        allele_group_length: np.ndarray
+            length of each group, 0 for contigs without allele
+        """
+        tmp_df = self.alleletable.data[[1, 2]]
+        ctg = tmp_df[1].map(self.contig2idx.get)
+        tmp_df = tmp_df[ctg.notnull().values]
+        ctg = ctg[ctg.notnull()].astype(np.int64).values
+        allele = tmp_df[2].map(self.contig2idx.get).fillna(-2).astype(np.int64).values
+
+        counts = np.bincount(ctg, minlength=self.n_contigs)
+        allele_group_length = np.where(counts > 0, counts + 1, 0)
+        allele_group = np.full((self.n_contigs, int(counts.max(initial=0)) + 1), 
+                                -1, dtype=np.int64)
+        allele_group[:, 0] = np.arange(self.n_contigs)
+
+        order = np.argsort(ctg, kind='stable')
+        ctg, allele = ctg[order], allele[order]
+        rank = np.arange(len(ctg)) - np.searchsorted(ctg, ctg)
+        allele_group[ctg, rank + 1] = allele
+
+        return allele_group, allele_group_length
     
-    def normalize_score(self, pixel):
+    def normalize_score(self, row, col, count):
+        idx2re = np.array([self.re_count_db.get(self.idx2contig[i], np.nan) 
+                            for i in range(self.n_contigs)], dtype=np.float64)
 
-        pixel['RE1'] = pixel['chrom1'].map(self.re_count_db.get)
-        pixel['RE2'] = pixel['chrom2'].map(self.re_count_db.get)
-        pixel['count'] = pixel['count'] / ( pixel['RE1'] *  pixel['RE2'])
-        pixel.drop(['RE1', 'RE2'], axis=1, inplace=True)
+        return count / (idx2re[row] * idx2re[col])
 
-    def get_score_db(self):
-        db = self.pixels.to_dict()['count']
-        db = defaultdict(lambda :0, db)
+    def get_score_matrix(self, row, col, count):
+        """
+        symmetric csr matrix of contacts, the diagonal is not doubled
+        """
+        upper = row != col 
+        A = csr_matrix((np.r_[count, count[upper]], 
+                        (np.r_[row, col[upper]], np.r_[col, row[upper]])),
+                        shape=(self.n_contigs, self.n_contigs))
+        A.sort_indices()
 
-        return db
+        return A 
+
+    @staticmethod
+    def score_keys(A):
+        """
+        flat keys (row * n + col) of the entries of a canonical csr matrix, 
+            which are sorted and used to gather the scores by searchsorted.
+        """
+        return (np.repeat(np.arange(A.shape[0], dtype=np.int64), np.diff(A.indptr)) 
+                    * A.shape[1] + A.indices)
+
+    def gather_scores(self, rows, cols):
+        """
+        gather the scores of (rows, cols) from the score matrix, 
+            negative index or missing entry scores zero.
+        """
+        A = self.score_matrix
+        if A.nnz == 0:
+            return np.zeros(np.shape(rows), dtype=np.float64)
+
+        valid = (rows >= 0) & (cols >= 0)
+        query = np.where(valid, rows * A.shape[1] + cols, -1)
+        pos = np.minimum(np.searchsorted(self._score_keys, query), A.nnz - 1)
+        found = valid & (self._score_keys[pos] == query)
+        
+        return np.where(found, A.data[pos], 0.0)
 
     def remove_allelic(self):
         _allelic = self.alleletable.data[
                         self.alleletable.data[1] < self.alleletable.data[2]
                         ][[1, 2]]
-        _allelic = _allelic.applymap(self.contig2idx.get).values.tolist()
+        _allelic = _allelic.map(self.contig2idx.get).dropna().astype(np.int64).values
+        _allelic = np.unique(_allelic.reshape(-1, 2), axis=0)
 
-        _allelic = list(map(tuple, _allelic))
-        _allelic = list(set(_allelic).intersection(self.contig_pairs))
+        n = self.n_contigs
+        contig_pair_keys = self.contig_pairs[:, 0] * n + self.contig_pairs[:, 1]
+        is_allelic = np.isin(contig_pair_keys, _allelic[:, 0] * n + _allelic[:, 1])
+        _allelic = self.contig_pairs[is_allelic]
         logger.info(f"Removed {len(_allelic)} allelic contacts.")
         
-        self.allelic_prune_list.extend(_allelic)
-
-        # self.pixels.loc[self.pixels.reindex(_allelic).dropna().index] = 0
-        # self.pixels = self.pixels.loc[self.pixels['count'] > 0]
-
-        self.pixels = self.pixels.drop(_allelic, axis=0)
-        self.contig_pairs = self.contig_pairs - set(_allelic)
+        self.allelic_prune_list.extend(map(tuple, _allelic.tolist()))
+        self.contig_pairs = self.contig_pairs[~is_allelic]
     
     @staticmethod
     def is_strong_contact(allele_pair1, allele_pair2, score_db):
@@ -220,16 +264,22 @@ class KPruner:
         else:
             return False
     
+    @staticmethod
+    def is_strong_contact2(l1, l2, edges, scores):
+        """
+        whether the first contig of two allele groups are matched in the 
+            maximum weighted bipartite matching of their contacts.
+        """
+        g = ig.Graph.Bipartite([0] * l1 + [1] * l2, edges)
+        g.es['weight'] = scores
+
+        matching = g.maximum_bipartite_matching(weights='weight')
+        
+        return matching.match_of(0) == l1
 
     @staticmethod
-    def _remove_weak_with_allelic(ctg1, ctg2, l1, l2, scores):#ctg1, ctg2, allele_group_db, score_db):
-        # try:
-        #     allele1 = allele_group_db[ctg1]
-        #     allele2 = allele_group_db[ctg2]
-        # except KeyError:
-        #     return None
+    def _remove_weak_with_allelic(ctg1, ctg2, l1, l2, scores):
         edges = list(product(range(l1), range(l1, l1 + l2)))
-        # flag = KPruner.is_strong_contact2((ctg1, allele1), (ctg2, allele2), score_db)
         flag = KPruner.is_strong_contact2(l1, l2, edges, scores)
         if not flag:
             return (ctg1, ctg2)
@@ -237,100 +287,99 @@ class KPruner:
             return None
 
     @staticmethod
-    def _remove_weak_with_allelic_chunk(candidate_contact_file):
-        with open(candidate_contact_file, 'rb') as fp:
-            cc = msgspec.msgpack.decode(fp.read(), type=CandidateContacts)
+    @lru_cache(maxsize=None)
+    def assignments(l1, l2):
+        """
+        all the maximum matchings of a complete l1 x l2 bipartite graph.
+
+        Returns:
+        --------
+        flat: np.ndarray
+            (n_assignments, min(l1, l2)) flat index of the matched edges 
+            in the l1 x l2 score block
+        with_first: np.ndarray
+            bool array, whether the first contigs of two groups are matched
+        """
+        if l1 <= l2:
+            perms = np.array(list(permutations(range(l2), l1)), dtype=np.int64)
+            flat = np.arange(l1) * l2 + perms
+        else:
+            perms = np.array(list(permutations(range(l1), l2)), dtype=np.int64)
+            flat = perms * l2 + np.arange(l2)
         
-        res = []
-        for cp in cc.data:
-            data = [cp["ctg1"], cp["ctg2"], cp["l1"], cp["l2"], cp["scores"]]
-            res.append(KPruner._remove_weak_with_allelic(*data))
-
-        return res 
+        return flat, perms[:, 0] == 0
+
+    def _score_pairs(self, pairs, l1, l2):
+        """
+        score the contact pairs with the same group length l1 and l2 
+            by enumerating all maximum matchings at once.
+
+        Returns:
+        --------
+        np.ndarray of int8, 1 strong, 0 weak and -1 for ties 
+            that should be resolved by igraph
+        """
+        group1 = self.allele_group[pairs[:, 0], :l1]
+        group2 = self.allele_group[pairs[:, 1], :l2]
+        scores = self.gather_scores(np.repeat(group1, l2, axis=1),
+                                    np.tile(group2, (1, l1)))
         
+        flat, with_first = self.assignments(l1, l2)
+        weights = scores[:, flat].sum(axis=2)
+        best_with = weights[:, with_first].max(axis=1)
+        best_without = weights[:, ~with_first].max(axis=1)
+
+        res = np.full(len(pairs), -1, dtype=np.int8)
+        tie = np.isclose(best_with, best_without, rtol=1e-9, atol=1e-12)
+        res[(best_with > best_without) & ~tie] = 1
+        res[(best_with < best_without) & ~tie] = 0
+
+        return res
 
     def remove_weak_with_allelic(self):
-        args = []
-        res = []
-        score_db = self.score_db 
-        allele_group_db = self.allele_group_db
+        """
+        remove the contacts between two contigs that are not matched in the 
+            maximum weighted bipartite matching of their allele groups.
+
+        The pairs are grouped by the length of the two allele groups, 
+            and the scores of all the matchings are gathered in batches of 
+            `chunksize` pairs, only the tied pairs and the very large groups 
+            are passed to the igraph matching.
+        """
+        pairs = self.contig_pairs
+        l1 = self.allele_group_length[pairs[:, 0]]
+        l2 = self.allele_group_length[pairs[:, 1]]
+        retain = (l1 > 0) & (l2 > 0)
+        pairs, l1, l2 = pairs[retain], l1[retain], l2[retain]
         
-        line_counts = 0
-        tmp_file_idx = 0
-        tmp_file_list = []
-
-        if len(self.contig_pairs) > self.chunksize:
-            with tempfile.TemporaryDirectory(prefix="kprune_tmp", dir="./") as tmpDir:
-                logger.info(f"Working on a temporary directory `{tmpDir}`.")
-                for ctg1, ctg2 in self.contig_pairs:
-                    line_counts += 1
-                    try:
-                        allele1 = allele_group_db[ctg1]
-                        allele2 = allele_group_db[ctg2]
-                    except KeyError:
-                        continue
-                    
-                    tmp_allele_pair1 = [ctg1, *allele1]
-                    tmp_allele_pair2 = [ctg2, *allele2]
-                    l1 = len(tmp_allele_pair1)
-                    l2 = len(tmp_allele_pair2)
+        res = np.full(len(pairs), -1, dtype=np.int8)
+        shapes = l1 * (l2.max(initial=0) + 1) + l2
+        order = np.argsort(shapes, kind='stable')
+        shapes, starts = np.unique(shapes[order], return_index=True)
+        for idx in np.split(order, starts[1:]):
+            if len(idx) == 0:
+                continue
+            _l1, _l2 = int(l1[idx[0]]), int(l2[idx[0]])
+            if perm(max(_l1, _l2), min(_l1, _l2)) > self.MAX_ASSIGNMENTS:
+                continue
             
-                    contig_edges = list(product(tmp_allele_pair1, tmp_allele_pair2))
-                    scores = [score_db.get(i, .0) for i in contig_edges]
-
-                    cp = ContigPairs(ctg1=ctg1, ctg2=ctg2, l1=l1, l2=l2, scores=scores)
-                    args.append(cp)
-
-                    if line_counts % self.chunksize == 0:
-                        tmp_file = f"{tmpDir}/{tmp_file_idx}.bin"
-                        with open(tmp_file, 'wb') as out:
-                            out.write(msgspec.msgpack.encode(CandidateContacts(data=args)))
-                        
-                        tmp_file_list.append(tmp_file)
-                        tmp_file_idx += 1
-                        args=[]
-                else:
-                    tmp_file = f"{tmpDir}/{tmp_file_idx}.bin"
-                    with open(tmp_file, 'wb') as out:
-                        out.write(msgspec.msgpack.encode(CandidateContacts(data=args)))
-                    
-                    tmp_file_list.append(tmp_file)
-                    args=[]
-
-
-                res = Parallel(n_jobs=self.threads)(
-                        delayed(KPruner._remove_weak_with_allelic_chunk)(i,)
-                            for i in tmp_file_list)
+            batch_size = max(1, self.chunksize // perm(max(_l1, _l2), min(_l1, _l2)))
+            for i in range(0, len(idx), batch_size):
+                batch = idx[i: i + batch_size]
+                res[batch] = self._score_pairs(pairs[batch], _l1, _l2)
+
+        unresolved = np.where(res == -1)[0]
+        for i in unresolved:
+            _l1, _l2 = int(l1[i]), int(l2[i])
+            group1 = self.allele_group[pairs[i, 0], :_l1]
+            group2 = self.allele_group[pairs[i, 1], :_l2]
+            scores = self.gather_scores(np.repeat(group1, _l2), np.tile(group2, _l1))
+            res[i] = self._remove_weak_with_allelic(0, 0, _l1, _l2, 
+                                                    scores.tolist()) is None
         
-                res = list_flatten(res)
-
-            logger.info(f"Removed temporary directory: `{tmpDir}`.")
-        else:
-            for ctg1, ctg2 in self.contig_pairs:
-                line_counts += 1
-                try:
-                    allele1 = allele_group_db[ctg1]
-                    allele2 = allele_group_db[ctg2]
-                except KeyError:
-                    continue
-                
-                tmp_allele_pair1 = [ctg1, *allele1]
-                tmp_allele_pair2 = [ctg2, *allele2]
-                l1 = len(tmp_allele_pair1)
-                l2 = len(tmp_allele_pair2)
+        logger.debug(f"Resolved {len(unresolved)} tied or large contact pairs by igraph.")
         
-                contig_edges = list(product(tmp_allele_pair1, tmp_allele_pair2))
-                
-
-                scores = [score_db.get(i, 0) for i in contig_edges]
-
-                args.append([ctg1, ctg2, l1, l2, scores])
-            
-            res = Parallel(n_jobs=self.threads)(
-                delayed(KPruner._remove_weak_with_allelic)(i, j, k, l, m)
-                        for i, j, k, l, m in args)
-    
-        res = list(filter(lambda x: x is not None, res))
+        res = list(map(tuple, pairs[res == 0].tolist()))
         weak_contacts = len(res)
         logger.info(f"Removed {weak_contacts} weak contacts with allelic.")
         self.weak_prune_list.extend(res)
@@ -348,7 +397,7 @@ class KPruner:
 
         if len(self.weak_prune_list) > 0:
             weak_res = pd.DataFrame(self.weak_prune_list)
-            weak_res = weak_res.applymap(self.idx2contig.get)
+            weak_res = weak_res.map(self.idx2contig.get)
             weak_res.columns = self.alleletable.AlleleHeader2[2:4]
             weak_res['type'] = 1 
             weak_res['mz1'] = 0
@@ -19,7 +19,6 @@ from click_didyoumean import DYMGroup
 from .. import __epilog__
 from ..cli import CommandGroup
 from ..cli import cli 
-from ..utilities import run_cmd
 
 logger = logging.getLogger(__name__)
 class CommandGroup(DYMGroup, RichCommand):
@@ -97,6 +96,23 @@ def methalign(ctx):
     show_default=True,
     default=False,
 )
+@click.option(
+    '-mf',
+    '--methylation-format',
+    type=click.Choice(['bedgraph', 'bed', 'modkit']),
+    default='bedgraph',
+    help="format of BEDGRAPH, `bed` for pb-CpG-tools and `modkit` for bedMethyl",
+    show_default=True
+)
+@click.option(
+    '--store',
+    type=click.Path(),
+    default=None,
+    help="Binary methylation-site store of the reference and 5mC sites, "
+    "built from FASTA and BEDGRAPH if not exists and memory-mapped by later runs. "
+    "It is rebuilt if FASTA or BEDGRAPH changed.",
+    show_default=True
+)
 @click.option(
     '-o',
     '--output',
@@ -117,67 +133,48 @@ def methalign(ctx):
     "--process",
     type=int,
     default=10,
-    help="Number of processes to process bam",
+    help="Number of processes to process bam, the bam is split into shards by read name",
     show_default=True
 )
 def refine(fasta, bedgraph, bam, penalty,
             prob_cutoff, designate_mapq, recalculate_all,
-            output, threads, process):
+            methylation_format, store, output, threads, process):
     """
     Refine the alignments by methylation information.
 
 
         FASTA: reference genome in fasta format
 
-        BEDGRAPH: bedgraph file containing the methylation information, four columns are required: chromosome, start, end, and methylation level(0-100)
+        BEDGRAPH: bedgraph file containing the methylation information, four columns are required: chromosome, start, end, and methylation level(0-100), or other formats by `--methylation-format`
 
         BAM: bam file containing the alignments and MM/ML tags on the primary alignments
     """
     from joblib import Parallel, delayed
     from .filter_bam_methyl import (
         parse_bam, 
-        parse_bedgraph, 
-        parse_fasta)
+        load_reference_methylation)
+    from ..utilities import run_cmd
 
-    fa_dict = parse_fasta(fasta)
-
-    hifi_methylation_dict = parse_bedgraph(bedgraph)
+    if store is not None and op.exists(store):
+        logger.info(f"Load the methylation-site store `{store}`, "
+                    "which is rebuilt if the inputs are changed.")
+    ref_methylation = load_reference_methylation(fasta, bedgraph, methylation_format, store)
 
     if len(bam) == 0:
         logging.error("No bam files are provided.")
         sys.exit(1)
     
-    if len(bam) > 1:
-        def generate_args(bam):
-            for bam in bam:
-                yield (
-                    bam,
-                    fa_dict,
-                    hifi_methylation_dict,
+    ## each bam is split into read-name-consistent shards, which are refined by `process` workers
+    out_bams = [parse_bam(
+                    _bam,
+                    ref_methylation,
                     penalty,
                     prob_cutoff,
                     designate_mapq,
                     recalculate_all,
-                    threads
-                )
-        
-        out_bams = Parallel(n_jobs=process)(
-            delayed(parse_bam)(*arg) for arg in generate_args(bam)
-        )
-
-    else:
-        out_bam = parse_bam(
-            bam[0],
-            fa_dict,
-            hifi_methylation_dict,
-            penalty,
-            prob_cutoff,
-            designate_mapq,
-            recalculate_all,
-            threads
-        )
-
-        out_bams = [out_bam]
+                    threads,
+                    process
+                ) for _bam in bam]
 
     def bam2paf(bam):
         cmd = ['cphasing-rs', 'bam2paf', bam, '-o', bam.replace('.bam', '.paf.gz')]
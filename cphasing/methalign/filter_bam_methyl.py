@@ -9,11 +9,16 @@
 import argparse
 import sys
 import os
-import pysam
 import re
-from array import array
+import shutil
+import multiprocessing
+import pysam
 import collections
+import struct
+import zlib
 import numpy as np
+
+from array import array
 from portion import closed
 
 
@@ -23,81 +28,362 @@ pysam.set_verbosity(0)
 comp_table = str.maketrans('ATCG', 'TAGC')
 
 
-def parse_fasta(fasta):
-    
-    fa_dict = dict()
+METHYLATION_COLUMNS = {'bed': 8, 'modkit': 10, 'bedgraph': 3}
+
+# gzip magic, deflate, FEXTRA and the `BC` subfield of BGZF block header
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+BGZF_EXTRA = b'\x06\x00BC\x02\x00'
+BAM_QNAME = re.compile(rb'[!-?A-~]+\x00\Z')
+
+
+def iter_fasta(fasta):
+    """
+    iterate the contigs of fasta as (ID, uppercase sequence).
+    """
+    ID, seq_list = None, []
     with open(fasta) as f:
         for line in f:
             if not line.strip():
                 continue
             if line.startswith('>'):
+                if ID is not None:
+                    yield ID, ''.join(seq_list)
                 ID = line.split()[0][1:]
-                fa_dict[ID] = []
+                seq_list = []
             else:
-                fa_dict[ID].append(line.strip().upper())
+                seq_list.append(line.strip().upper())
 
-    for ID, seq_list in fa_dict.items():
-        fa_dict[ID] = ''.join(seq_list)
+    if ID is not None:
+        yield ID, ''.join(seq_list)
+
+
+def parse_fasta(fasta):
+
+    fa_dict = dict()
+    for ID, seq in iter_fasta(fasta):
+        fa_dict[ID] = seq
 
     return fa_dict
 
 
-def parse_bed(bed, cov_cutoff=75):
-    
-    hifi_methylation_dict = collections.defaultdict(set)
-    with open(bed) as f:
+def iter_methylation_sites(methylation, column, cov_cutoff=75):
+    """
+    iterate the (contig, position) of methylated sites,
+        whose methylation level at `column` is not lower than `cov_cutoff`.
+    """
+    with open(methylation) as f:
         for line in f:
             if line.startswith('#') or not line.strip():
                 continue
             cols = line.split()
-            ctg, pos, cov = cols[0], int(cols[1]), float(cols[8])
-            if cov >= cov_cutoff:
-                hifi_methylation_dict[ctg].add(pos)
+            if float(cols[column]) >= cov_cutoff:
+                yield cols[0], int(cols[1])
 
-    return hifi_methylation_dict
 
-def parse_bed_modkit(bed, cov_cutoff=75):
-    
+def parse_methylation(methylation, column, cov_cutoff=75):
+
     hifi_methylation_dict = collections.defaultdict(set)
-    with open(bed) as f:
-        for line in f:
-            if line.startswith('#') or not line.strip():
-                continue
-            cols = line.split()
-            ctg, pos, cov = cols[0], int(cols[1]), float(cols[10])
-            if cov >= cov_cutoff:
-                hifi_methylation_dict[ctg].add(pos)
+    for ctg, pos in iter_methylation_sites(methylation, column, cov_cutoff):
+        hifi_methylation_dict[ctg].add(pos)
 
     return hifi_methylation_dict
 
 
-def parse_bedgraph(bedgraph, cov_cutoff=75):
-    
-    hifi_methylation_dict = collections.defaultdict(set)
-    with open(bedgraph) as f:
-        for line in f:
-            if line.startswith('#') or not line.strip():
-                continue
-            cols = line.split()
-            ctg, pos, cov = cols[0], int(cols[1]), float(cols[3])
-            if cov >= cov_cutoff:
-                hifi_methylation_dict[ctg].add(pos)
+def parse_bed(bed, cov_cutoff=75):
 
-    return hifi_methylation_dict
+    return parse_methylation(bed, METHYLATION_COLUMNS['bed'], cov_cutoff)
+
+
+def parse_bed_modkit(bed, cov_cutoff=75):
 
+    return parse_methylation(bed, METHYLATION_COLUMNS['modkit'], cov_cutoff)
 
-def get_5mc_sites_from_read(read_name, read_seq, MM_tag, ML_tag, prob_cutoff, pattern=r'C'):
-   
-    matches = re.finditer(pattern, read_seq)
-    ont_pos_index = {match.start(): index for index, match in enumerate(matches)}
-    ont_methylation_array = array('h', [0] * len(ont_pos_index))
-    index_sum = 0
-    for n, i in enumerate((int(shift) for shift in MM_tag.rstrip(';').split(',')[1:])):
-        index_sum += i
-        if ML_tag[n] >= prob_cutoff:
-            ont_methylation_array[n+index_sum] = 1
+
+def parse_bedgraph(bedgraph, cov_cutoff=75):
+
+    return parse_methylation(bedgraph, METHYLATION_COLUMNS['bedgraph'], cov_cutoff)
+
+
+def get_5mc_sites_from_read(read_name, read_seq, MM_tag, ML_tag, prob_cutoff, pattern='C'):
+    """
+    masks of C bases and 5mC sites along the read (in the original orientation),
+        the n-th MM skip counts from the (n + sum of skips)-th C of the read.
+    """
+    ont_c_mask = np.frombuffer(read_seq.encode(), dtype=np.uint8) == ord(pattern)
+    ont_methylation_mask = np.zeros(len(ont_c_mask), dtype=bool)
+    shifts = np.array(MM_tag.rstrip(';').split(',')[1:], dtype=np.int64)
+    if len(shifts):
+        c_index = np.cumsum(shifts) + np.arange(len(shifts))
+        methylated = np.frombuffer(bytes(ML_tag[:len(shifts)]), dtype=np.uint8) >= prob_cutoff
+        ont_methylation_mask[np.flatnonzero(ont_c_mask)[c_index[methylated]]] = True
             
-    return ont_pos_index, ont_methylation_array
+    return ont_c_mask, ont_methylation_mask
+
+
+def get_aligned_positions(cigartuples, reference_start):
+    """
+    query and reference positions of the aligned bases (M/=/X),
+        same as the pairs without None of `aln.get_aligned_pairs()`.
+    """
+    cigar = np.array(cigartuples, dtype=np.int64).reshape(-1, 2)
+    operation, length = cigar[:, 0], cigar[:, 1]
+    query_length = length * np.isin(operation, (0, 1, 4, 7, 8))
+    ref_length = length * np.isin(operation, (0, 2, 3, 7, 8))
+    query_start = np.cumsum(query_length) - query_length
+    ref_start = np.cumsum(ref_length) - ref_length + reference_start
+
+    is_match = np.isin(operation, (0, 7, 8))
+    length = length[is_match]
+    offset = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    query_pos = np.repeat(query_start[is_match], length) + offset
+    ref_pos = np.repeat(ref_start[is_match], length) + offset
+
+    return query_pos, ref_pos
+
+
+BASES = 'ACGT'
+## 2-bit codes of bases, the other bases are stored as A
+BASE_CODES = np.zeros(256, dtype=np.uint8)
+for code, base in enumerate(BASES):
+    BASE_CODES[ord(base)] = BASE_CODES[ord(base.lower())] = code
+
+
+def pack_bases(seq):
+    """
+    pack a sequence into 2 bits per base, four bases per byte from the high bits.
+    """
+    codes = BASE_CODES[np.frombuffer(seq.encode(), dtype=np.uint8)]
+    codes = np.r_[codes, np.zeros(-len(codes) % 4, dtype=np.uint8)].reshape(-1, 4)
+
+    return (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+
+
+def test_base(packed_seq, length, pos, base):
+    """
+    test whether the bases at positions of a sequence packed by `pack_bases`
+        are `base`, positions out of the sequence are False.
+    """
+    valid = (pos >= 0) & (pos < length)
+    res = np.zeros(len(pos), dtype=bool)
+    pos = pos[valid]
+    res[valid] = ((packed_seq[pos >> 2] >> (6 - ((pos & 3) << 1))) & 3) == BASES.index(base)
+
+    return res
+
+
+def test_sites(sites, pos):
+    """
+    test positions in the sorted uint32 sites.
+    """
+    valid = pos >= 0
+    res = np.zeros(len(pos), dtype=bool)
+    # same dtype as sites, otherwise searchsorted casts the whole (memory-mapped) sites
+    pos = pos[valid].astype(sites.dtype)
+    idx = np.searchsorted(sites, pos)
+    found = idx < len(sites)
+    found[found] = sites[idx[found]] == pos[found]
+    res[valid] = found
+
+    return res
+
+
+def contig_methylation(seq, sites):
+    """
+    2-bit packed sequence, length and sorted unique uint32 5mC sites of a contig.
+    """
+    sites = np.fromiter(sites, dtype=np.int64, count=len(sites))
+    sites = np.unique(sites[(sites >= 0) & (sites < len(seq))]).astype(np.uint32)
+
+    return pack_bases(seq), len(seq), sites
+
+
+def _memmap(path, dtype):
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class ReferenceMethylation:
+    """
+    per-contig 2-bit packed bases and sorted HiFi 5mC sites of reference,
+        built on first use from `fa_dict` and `hifi_methylation_dict`,
+        or memory-mapped from a store by `ReferenceMethylation.load`.
+
+    Examples:
+    --------
+    >>> build_methylation_store("ref.fa", "hifi.bedgraph", "ref.mstore")
+    >>> ref_methylation = ReferenceMethylation.load("ref.mstore")
+    >>> packed_seq, length, sites = ref_methylation["ctg1"]
+    """
+    def __init__(self, fa_dict=None, hifi_methylation_dict=None):
+        self.fa_dict = fa_dict if fa_dict is not None else {}
+        self.hifi_methylation_dict = hifi_methylation_dict if hifi_methylation_dict is not None else {}
+        self.db = {}
+
+    @classmethod
+    def load(cls, store, header=None):
+        """
+        memory-map a store written by `build_methylation_store`, 
+            raise ValueError if the header of store is not `header`.
+        """
+        if header is not None and read_store_header(store) != header:
+            raise ValueError(f"The methylation-site store `{store}` is not built from "
+                             "the current fasta and methylation, please rebuild it.")
+        
+        ref_methylation = cls()
+        packed_seq = _memmap(f"{store}/seq.bin", np.uint8)
+        sites = _memmap(f"{store}/sites.bin", '<u4')
+        with open(f"{store}/contigs.tsv") as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                ref_name, length, seq_start, site_start, site_end = line.split()
+                length, seq_start = int(length), int(seq_start)
+                ref_methylation.db[ref_name] = (
+                    packed_seq[seq_start: seq_start + (length + 3) // 4],
+                    length,
+                    sites[int(site_start): int(site_end)])
+
+        return ref_methylation
+
+    def __getitem__(self, ref_name):
+        if ref_name not in self.db:
+            self.db[ref_name] = contig_methylation(self.fa_dict[ref_name],
+                                    self.hifi_methylation_dict.get(ref_name, ()))
+
+        return self.db[ref_name]
+
+
+def store_header(fasta, methylation, fmt='bedgraph', cov_cutoff=75):
+    """
+    header of the methylation-site store, the inputs are identified by 
+        path, size and modification time.
+    """
+    fields = []
+    for key, path in (('fasta', fasta), ('methylation', methylation)):
+        stat = os.stat(path)
+        fields.append(f"{key}={os.path.realpath(path)} {key}_size={stat.st_size} "
+                      f"{key}_mtime={stat.st_mtime_ns}")
+    
+    return f"# {' '.join(fields)} format={fmt} cov_cutoff={cov_cutoff}\n"
+
+
+def read_store_header(store):
+    """
+    header of the methylation-site store, None if it is not a store.
+    """
+    try:
+        with open(f"{store}/contigs.tsv") as f:
+            header = f.readline()
+    except OSError:
+        return None
+    
+    return header if header.startswith('#') else None
+
+
+def build_methylation_store(fasta, methylation, store, fmt='bedgraph', cov_cutoff=75):
+    """
+    build a binary methylation-site store from a fasta and the methylation
+        sites in any format of `METHYLATION_COLUMNS`, which is
+        memory-mapped by `ReferenceMethylation.load` in the later runs.
+
+    Params:
+    --------
+    fasta: str
+        reference genome
+    methylation: str
+        bed (pb-CpG-tools), modkit (bedMethyl) or bedgraph
+    store: str
+        output directory of the store, contains:
+            seq.bin: 2-bit packed bases of contigs, each contig starts at a new byte
+            sites.bin: sorted 5mC sites (uint32) of contigs
+            contigs.tsv: name, length, byte offset in seq.bin, site range in sites.bin,
+                         headed by the `store_header` of inputs
+    fmt: str
+        format of methylation
+    cov_cutoff: float
+        minimum methylation level of 5mC sites
+
+    Returns:
+    --------
+    str:
+        store
+    """
+    if os.path.exists(store) and read_store_header(store) is None:
+        raise ValueError(f"`{store}` exists and is not a methylation-site store.")
+
+    sites_dict = collections.defaultdict(lambda: array('I'))
+    for ctg, pos in iter_methylation_sites(methylation, METHYLATION_COLUMNS[fmt], cov_cutoff):
+        sites_dict[ctg].append(pos)
+
+    tmp = f"{store}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    with open(f"{tmp}/seq.bin", 'wb') as fseq, open(f"{tmp}/sites.bin", 'wb') as fsites, \
+            open(f"{tmp}/contigs.tsv", 'w') as fout:
+        fout.write(store_header(fasta, methylation, fmt, cov_cutoff))
+        seq_start, site_start = 0, 0
+        for ref_name, seq in iter_fasta(fasta):
+            packed_seq, length, sites = contig_methylation(seq, sites_dict.pop(ref_name, ()))
+            packed_seq.tofile(fseq)
+            sites.astype('<u4').tofile(fsites)
+            fout.write(f"{ref_name}\t{length}\t{seq_start}\t{site_start}\t{site_start + len(sites)}\n")
+            seq_start += len(packed_seq)
+            site_start += len(sites)
+
+    # an outdated store is replaced
+    if os.path.exists(store):
+        shutil.rmtree(store)
+    os.replace(tmp, store)
+
+    return store
+
+
+def load_reference_methylation(fasta, methylation, fmt='bedgraph', store=None, cov_cutoff=75):
+    """
+    reference and 5mC sites parsed into memory, or memory-mapped from `store`, 
+        which is (re)built by `build_methylation_store` if not exists or its 
+        header mismatches the inputs.
+    """
+    if store is None:
+        return ReferenceMethylation(parse_fasta(fasta), 
+                                    parse_methylation(methylation, METHYLATION_COLUMNS[fmt], cov_cutoff))
+    
+    header = store_header(fasta, methylation, fmt, cov_cutoff)
+    if read_store_header(store) != header:
+        build_methylation_store(fasta, methylation, store, fmt, cov_cutoff)
+    
+    return ReferenceMethylation.load(store, header)
+
+
+def count_inconsistent_5mC(aln, ref, ont_c_mask, ont_methylation_mask):
+    """
+    count the C bases of read aligned to C (forward) or G (reverse) of reference, 
+        whose 5mC calls are different from HiFi. For reverse strand, 
+        the HiFi site is the C at the previous base of G.
+    """
+    read_aln_pos, ref_aln_pos = get_aligned_positions(aln.cigartuples, aln.reference_start)
+    # for reverse strand, recalculate read_aln_pos based on the contig length
+    if not aln.is_forward:
+        read_aln_pos = aln.infer_query_length() - (read_aln_pos + 1)
+    
+    # C in ONT read
+    retain = read_aln_pos < len(ont_c_mask)
+    retain[retain] = ont_c_mask[read_aln_pos[retain]]
+    read_aln_pos, ref_aln_pos = read_aln_pos[retain], ref_aln_pos[retain]
+    
+    packed_seq, length, hifi_methylation_sites = ref
+    if aln.is_forward:
+        retain = test_base(packed_seq, length, ref_aln_pos, 'C')
+        site_pos = ref_aln_pos
+    else:
+        retain = test_base(packed_seq, length, ref_aln_pos, 'G')
+        site_pos = ref_aln_pos - 1
+    
+    is_methylated = ont_methylation_mask[read_aln_pos[retain]]
+    is_hifi_methylated = test_sites(hifi_methylation_sites, site_pos[retain])
+
+    return int(np.count_nonzero(is_methylated != is_hifi_methylated))
 
 # @profile
 def get_query_alignment_termini(aln):
@@ -165,7 +451,12 @@ def reconstruct_SA_tag(aln):
     return SA_tag
 
 
-def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designate_mapq, recalculate_all, threads):
+def filter_bam(bam, out_bam, ref_methylation, penalty, prob_cutoff, designate_mapq, recalculate_all, threads, 
+               start=None, end=None):
+    """
+    refine the alignments of a name-grouped bam, only the records between 
+        the virtual offsets `start` and `end` are processed if specified.
+    """
     
     # print('Read\tRef\tquery_aln_len\tflag\tMAPQ\tPos\tAlignment_score\tInconsistent_5mC\tAdjusted_score')
     
@@ -173,38 +464,9 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
     cached_aln = []
 
     # @profile
-    def recalculate_score(aln, flg, ont_pos_index, ont_methylation_array):
-        inconsistent_5mC = 0
-        ref_name, is_forward = aln.reference_name, aln.is_forward
-        hifi_methylation_set = hifi_methylation_dict[ref_name]
-        fa_seq = fa_dict[ref_name]
-        for read_aln_pos, ref_aln_pos in aln.get_aligned_pairs():
-            raw_read_aln_pos = read_aln_pos
-            # for reverse strand, recalculate read_aln_pos based on the contig length
-            if not is_forward and read_aln_pos is not None:
-                read_aln_pos = aln.infer_query_length() - (read_aln_pos + 1)
-            # not C in ONT read
-            if read_aln_pos not in ont_pos_index:
-                continue
-            
-            is_methylated = ont_methylation_array[ont_pos_index[read_aln_pos]]
-            
-            # forward strand
-            if is_forward:
-                # mismatch
-                if ref_aln_pos is None or fa_seq[ref_aln_pos] != 'C':
-                    continue
-                if not ((ref_aln_pos in hifi_methylation_set and is_methylated) or 
-                        (ref_aln_pos not in hifi_methylation_set and not is_methylated)):
-                    inconsistent_5mC += 1
-            # reverse strand
-            else:
-                # mismatch
-                if ref_aln_pos is None or fa_seq[ref_aln_pos] != 'G':
-                    continue
-                if not ((ref_aln_pos - 1 in hifi_methylation_set and is_methylated) or
-                        (ref_aln_pos - 1 not in hifi_methylation_set and not is_methylated)):
-                    inconsistent_5mC += 1
+    def recalculate_score(aln, flg, ont_c_mask, ont_methylation_mask):
+        inconsistent_5mC = count_inconsistent_5mC(aln, ref_methylation[aln.reference_name], 
+                                                  ont_c_mask, ont_methylation_mask)
         
         # calculate adjusted score
         score = aln.get_tag('AS')
@@ -238,7 +500,7 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
                             mm_tag, ml_tag = aln.get_tag('MM'), aln.get_tag('ML')
                         else:
                             mm_tag, ml_tag = '', ''
-                        ont_pos_index, ont_methylation_array = get_5mc_sites_from_read(last_read, read_seq, mm_tag, ml_tag, prob_cutoff)
+                        ont_c_mask, ont_methylation_mask = get_5mc_sites_from_read(last_read, read_seq, mm_tag, ml_tag, prob_cutoff)
                     if aln.is_supplementary:
                         any_supplementary = True
                 else:
@@ -259,7 +521,7 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
                         if any_supplementary and aln.is_secondary:
                             ovl_len_list = []
                             # recalculate score for primary and supplementary alignments (always necessary)
-                            recalculate_score(aln, flg, ont_pos_index, ont_methylation_array)
+                            recalculate_score(aln, flg, ont_c_mask, ont_methylation_mask)
                             for n, (ps_qry_start, ps_qry_end) in enumerate(ps_qry_range_list):
                                 query_start, query_end = get_query_alignment_termini(aln)
                                 overlap = closed(query_start + 1, query_end) & closed(ps_qry_start + 1, ps_qry_end)
@@ -270,7 +532,7 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
                             best_ps_index, best_ps_ovl = ovl_len_list[0]
                             aln_list[best_ps_index].append((aln, flg))
                         elif aln.is_secondary:
-                            recalculate_score(aln, flg, ont_pos_index, ont_methylation_array)
+                            recalculate_score(aln, flg, ont_c_mask, ont_methylation_mask)
                             aln_list[0].append((aln, flg))
                     # recalculate score for primary and supplementary alignments
                     # if there are no corresponding secondary alignments, recalculate the score of the primary/supplementary
@@ -278,7 +540,7 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
                     for alns in aln_list:
                         if len(alns) > 1 or recalculate_all:
                             ps_aln, ps_flg = alns[0]
-                            recalculate_score(ps_aln, ps_flg, ont_pos_index, ont_methylation_array)
+                            recalculate_score(ps_aln, ps_flg, ont_c_mask, ont_methylation_mask)
 
                     # if any_secondary:
                     SA_tag_list = []
@@ -363,7 +625,7 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
                     cached_aln.sort(key=lambda x: x[1])
                     for aln, flg in cached_aln:
                         if recalculate_all:
-                            recalculate_score(aln, flg, ont_pos_index, ont_methylation_array)
+                            recalculate_score(aln, flg, ont_c_mask, ont_methylation_mask)
                         fout.write(aln)
         else:
             aln, flg = cached_aln[0]
@@ -375,8 +637,8 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
                         mm_tag, ml_tag = aln.get_tag('MM'), aln.get_tag('ML')
                     else:
                         mm_tag, ml_tag = '', ''
-                    ont_pos_index, ont_methylation_array = get_5mc_sites_from_read(last_read, read_seq, mm_tag, ml_tag, prob_cutoff)
-                    recalculate_score(aln, flg, ont_pos_index, ont_methylation_array)
+                    ont_c_mask, ont_methylation_mask = get_5mc_sites_from_read(last_read, read_seq, mm_tag, ml_tag, prob_cutoff)
+                    recalculate_score(aln, flg, ont_c_mask, ont_methylation_mask)
                 else:
                     pass
                     # print('{}\t{}\t{}\t{}\t{}\t{}\t{}\twhatever'.format(
@@ -388,12 +650,11 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
     
         return last_read
 
-    base_bam = os.path.basename(bam)
-    out_bam = '{}.penalty{}.{}'.format(os.path.splitext(base_bam)[0], penalty, 'methy_filtered.bam')
-    
     format_options = [b'filter=!flag.unmap']
     
     with pysam.AlignmentFile(bam, format_options=format_options, threads=threads) as fin:
+        if start is not None:
+            fin.seek(start)
         with pysam.AlignmentFile(out_bam, 'wb', template=fin, threads=threads) as fout:
             last_read = ''
             for alignment in fin:
@@ -405,10 +666,235 @@ def parse_bam(bam, fa_dict, hifi_methylation_dict, penalty, prob_cutoff, designa
                 else:
                     last_read = read_name
                     cached_aln.append([alignment, flag])
+                # the next record belongs to the next shard
+                if end is not None and fin.tell() >= end:
+                    break
             analyze_cached_aln(fout, last_read, alignment, flag)
 
     return out_bam
 
+
+def read_bgzf_block(fp, coffset):
+    """
+    decompress the BGZF block at the compressed offset.
+
+    Returns:
+    --------
+    tuple or None:
+        (data, block size), None if there is not a valid block at the offset
+    """
+    fp.seek(coffset)
+    header = fp.read(18)
+    if len(header) < 18 or header[:4] != BGZF_MAGIC or header[10:16] != BGZF_EXTRA:
+        return None
+    bsize = struct.unpack_from('<H', header, 16)[0] + 1
+    block = header + fp.read(bsize - 18)
+    if bsize < 26 or len(block) < bsize:
+        return None
+    crc, isize = struct.unpack_from('<II', block, bsize - 8)
+    try:
+        data = zlib.decompress(block[18:-8], -15)
+    except zlib.error:
+        return None
+    if len(data) != isize or zlib.crc32(data) != crc:
+        return None
+
+    return data, bsize
+
+
+def next_bgzf_block(fp, offset, size):
+    """
+    compressed offset of the first BGZF block at or after `offset`, 
+        None if there is no block.
+    """
+    while offset < size:
+        fp.seek(offset)
+        chunk = fp.read(1 << 17)
+        i = chunk.find(BGZF_MAGIC)
+        while i != -1:
+            if read_bgzf_block(fp, offset + i) is not None:
+                return offset + i
+            i = chunk.find(BGZF_MAGIC, i + 1)
+        # the magic may be across the chunks
+        offset += max(len(chunk) - len(BGZF_MAGIC) + 1, 1)
+
+    return None
+
+
+def check_bam_records(buf, u, n_ref, more, n=3):
+    """
+    whether `n` consecutive alignment records are valid from `u` of the decompressed
+        bam, `more()` appends the next block to `buf` and returns False at the end.
+    """
+    def fill(length):
+        while len(buf) < length:
+            if not more():
+                return False
+        return True
+
+    for _ in range(n):
+        if not fill(u + 36):
+            # the end of bam at the end of a record
+            return len(buf) == u
+        (block_size, ref_id, pos, l_read_name, _, _, n_cigar_op, _, 
+            l_seq, next_ref_id, next_pos, _) = struct.unpack_from('<iiiBBHHHIiii', buf, u)
+        if not (-1 <= ref_id < n_ref and -1 <= next_ref_id < n_ref 
+                and pos >= -1 and next_pos >= -1 and l_read_name > 1
+                and block_size >= 32 + l_read_name + 4 * n_cigar_op + (l_seq + 1) // 2 + l_seq):
+            return False
+        
+        cigar_start = u + 36 + l_read_name
+        if not fill(cigar_start + 4 * n_cigar_op):
+            return False
+        if not BAM_QNAME.match(buf, u + 36, cigar_start):
+            return False
+        # the operations of cigar are MIDNSHP=X
+        if any(op & 0xf > 8 for op in struct.unpack_from(f'<{n_cigar_op}I', buf, cigar_start)):
+            return False
+        
+        u += 4 + block_size
+        if not fill(u):
+            return False
+
+    return True
+
+
+def candidate_records(data, n_ref):
+    """
+    offsets of the decompressed block whose fixed fields look like an alignment record, 
+        the offsets of the last 36 bytes are always kept as the fields are in the next block.
+    """
+    n = len(data)
+    b = np.frombuffer(bytes(data) + bytes(36), dtype=np.uint8).astype(np.int64)
+    def int32(k):
+        v = b[k: k + n] | b[k + 1: k + 1 + n] << 8 | b[k + 2: k + 2 + n] << 16 | b[k + 3: k + 3 + n] << 24
+        return np.where(v >= 1 << 31, v - (1 << 32), v)
+
+    block_size, ref_id, pos = int32(0), int32(4), int32(8)
+    next_ref_id, l_read_name = int32(24), b[12: 12 + n]
+    mask = ((ref_id >= -1) & (ref_id < n_ref) & (next_ref_id >= -1) & (next_ref_id < n_ref)
+            & (pos >= -1) & (l_read_name > 1) & (block_size >= 32 + l_read_name))
+    mask[max(n - 36, 0):] = True
+
+    return np.flatnonzero(mask)
+
+
+def next_bam_record(fp, offset, size, n_ref, start=0):
+    """
+    virtual offset of the first alignment record which starts in a BGZF block 
+        at or after the compressed `offset` and not before the virtual offset `start`, 
+        None if there is no record.
+    """
+    coffset = next_bgzf_block(fp, offset, size)
+    while coffset is not None and coffset < size:
+        data, bsize = read_bgzf_block(fp, coffset)
+        buf = bytearray(data)
+        tail = coffset + bsize
+        def more():
+            nonlocal tail
+            block = read_bgzf_block(fp, tail) if tail < size else None
+            if block is None or not block[0]:
+                return False
+            buf.extend(block[0])
+            tail += block[1]
+            return True
+
+        for u in candidate_records(data, n_ref).tolist():
+            voffset = coffset << 16 | u
+            if voffset >= start and check_bam_records(buf, u, n_ref, more):
+                return voffset
+        
+        # a long record across the whole block
+        coffset += bsize
+
+    return None
+
+
+def split_bam(bam, num, threads=1):
+    """
+    split a name-grouped bam into about `num` shards of equal compressed size, 
+        the alignments of a read are kept in the same shard. The boundaries are
+        found by seeking to `size * i / num`, synchronizing to the first record of
+        the next BGZF block, and scanning to the next read.
+
+    Returns:
+    --------
+    list:
+        [(start, end), ...] virtual offsets of shards, the end of last shard is None
+    """
+    size = os.path.getsize(bam)
+    format_options = [b'filter=!flag.unmap']
+    with pysam.AlignmentFile(bam, format_options=format_options, threads=threads) as fin, \
+            open(bam, 'rb') as fp:
+        offsets = [fin.tell()]
+        for i in range(1, num):
+            # the compressed offset is the upper 48 bits of a virtual offset
+            voffset = next_bam_record(fp, max(size * i // num, offsets[-1] >> 16), 
+                                      size, fin.nreferences, offsets[-1])
+            if voffset is None:
+                break
+
+            fin.seek(voffset)
+            first_read = None
+            pos = voffset
+            for alignment in fin:
+                if first_read is None:
+                    first_read = alignment.query_name
+                elif alignment.query_name != first_read:
+                    offsets.append(pos)
+                    break
+                pos = fin.tell()
+            else:
+                break
+    
+    return list(zip(offsets, offsets[1:] + [None]))
+
+
+_REFINE_DATA = None
+
+def _init_refine_worker(ref_methylation):
+    global _REFINE_DATA
+    _REFINE_DATA = ref_methylation
+
+
+def _filter_bam_shard(args):
+    """
+    single function for filter_bam on the reference and methylation of worker.
+    """
+    bam, out_bam, penalty, prob_cutoff, designate_mapq, recalculate_all, threads, start, end = args
+    
+    return filter_bam(bam, out_bam, _REFINE_DATA, penalty, prob_cutoff, 
+                      designate_mapq, recalculate_all, threads, start, end)
+
+
+def parse_bam(bam, ref_methylation, penalty, prob_cutoff, designate_mapq, recalculate_all, threads, 
+              processes=1):
+    """
+    refine the alignments of a name-grouped bam by the methylation information.
+        With `processes` > 1, the bam is split into read-name-consistent shards, 
+        which are processed by a pool whose workers receive the reference and 
+        methylation once, the shards are concatenated in order into one bam.
+    """
+    base_bam = os.path.basename(bam)
+    out_bam = '{}.penalty{}.{}'.format(os.path.splitext(base_bam)[0], penalty, 'methy_filtered.bam')
+    
+    shards = split_bam(bam, processes, threads) if processes > 1 else []
+    if len(shards) <= 1:
+        return filter_bam(bam, out_bam, ref_methylation, penalty, prob_cutoff, 
+                          designate_mapq, recalculate_all, threads)
+
+    args = [(bam, f"{out_bam}.shard{i}.bam", penalty, prob_cutoff, designate_mapq, 
+             recalculate_all, 1, start, end) for i, (start, end) in enumerate(shards)]
+    with multiprocessing.Pool(processes=len(shards), initializer=_init_refine_worker, 
+                              initargs=(ref_methylation,)) as pool:
+        shard_bams = pool.map(_filter_bam_shard, args)
+    
+    pysam.cat("--no-PG", "-o", out_bam, *shard_bams)
+    for shard_bam in shard_bams:
+        os.remove(shard_bam)
+
+    return out_bam
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('fasta', help='input fasta file')
@@ -419,14 +905,16 @@ def main():
     parser.add_argument('--designate_mapq', type=int, default=60, help='designate MAPQ for the best alignments. Set the value to -1 to disable the function, default: %(default)s')
     parser.add_argument('--recalculate_all', default=False, action='store_true', help='recalculate scores for all alignments although there may not be any secondary alignments, default: %(default)s')
     parser.add_argument('--threads', type=int, default=8, help='number of threads for bam reading, default: %(default)s')
+    parser.add_argument('--processes', type=int, default=1, help='number of processes to refine the shards of bam, default: %(default)s')
+    parser.add_argument('--store', default=None, help='binary methylation-site store, built from fasta and bed if not exists or they changed and memory-mapped by later runs, default: %(default)s')
     args = parser.parse_args()
     
     if not -1 <= args.designate_mapq <= 60:
         raise Exception('--designate_mapq should be within the range [-1, 60]')
     
-    fa_dict = parse_fasta(args.fasta)
-    hifi_methylation_dict = parse_bed(args.bed)
-    parse_bam(args.bam, fa_dict, hifi_methylation_dict, args.penalty, args.prob_cutoff, args.designate_mapq, args.recalculate_all, args.threads)
+    ref_methylation = load_reference_methylation(args.fasta, args.bed, 'bed', args.store)
+    parse_bam(args.bam, ref_methylation, args.penalty, args.prob_cutoff, args.designate_mapq, args.recalculate_all, args.threads, 
+              args.processes)
 
 
 if __name__ == '__main__':
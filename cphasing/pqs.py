@@ -10,7 +10,6 @@ import logging
 import datetime
 import os
 import os.path as op
-import sys
 import io 
 import shutil
 import pprint 
@@ -19,6 +18,7 @@ import pandas as pd
 import numpy as np
 
 import bisect
+import itertools
 import polars as pl 
 import glob 
 
@@ -28,12 +28,13 @@ from pytools import natsorted
 from joblib import Parallel, delayed
 from pathlib import Path
 from tempfile import TemporaryDirectory
+## the dtypes in `_metadata` are evaluated with these names
 from polars import String, Categorical, UInt32, UInt64, Utf8, UInt8
 
 from .__init__ import __url__
 from ._config import *
-from .core import Pairs2
-from .utilities import read_chrom_sizes, list_flatten, run_cmd
+from .core import Pairs2, CLM_ORIENTATIONS, write_clm
+from .utilities import read_chrom_sizes, list_flatten
 from .utilities import xopen, binnify, decompress_cmd
 
 
@@ -61,6 +62,11 @@ PAIRS_HEADER_WITHOUT_MAPQ = [
     "strand1",
     "strand2",
 ]
+PQS_ROW_GROUP_SIZE = 2 ** 16
+PIXELS_CHUNKSIZE = 2_000_000
+PQS_INDEX = "_index"
+PQS_SORT_COLUMNS = ["chrom1", "chrom2", "pos1"]
+
 PAIRS_SCHEMA_32 = {
     "read_idx": pl.Utf8,
     "chrom1": pl.Categorical,
@@ -115,10 +121,17 @@ The q0, q1 directory contains the parquet files of the data.
 q0 mean the mapping quality of data >= 0.
 q1 mean the mapping quality of data >= 1.
 
+Each parquet file is sorted by (chrom1, chrom2, pos1) and written with 
+row group statistics, so the predicates of scan can skip row groups.
+
+The optional _index file maps each (chrom1, chrom2) to the (chunk, row group, 
+row range) of the parquet files, which is used by `PQS.query`.
+
 .pqs/  
 |-- _contigsizes 
 |-- _metadata
 |-- _readme 
+|-- _index (optional)
 |-- q0/
 |   |-- 0.parquet
 |   |-- 1.parquet
@@ -138,6 +151,7 @@ class PQS:
         self._readme = _README
         self.path = path 
         self.threads = threads
+        self._index = None
 
         os.environ["POLARS_MAX_THREADS"] = str(self.threads)
 
@@ -346,30 +360,14 @@ class PQS:
         if min_mapq > 0:
             logger.info(f"Filtered the data with mapq >= {min_mapq}.")
         
+        column_names = [self._metadata["columns"][i] for i in columns]
+        filters = pairs_filters(min_mapq=min_mapq) if is_filter else None
         if return_as == "generator":
             if low_memory:
                 for file in target_dir.iterdir():
-                    df = pl.read_parquet(file, columns=columns)
-                    if is_filter:
-                        df = df.filter(pl.col("mapq") >= min_mapq)
-                    else:
-                        if self._metadata['is_with_mapq']:
-                            if column_names:
-                                if 'mapq' not in column_names:
-                                    df = df.drop('mapq')
-                
-                    yield df
+                    yield scan_chunk(file, column_names, filters).collect()
             else:
-                df = pl.read_parquet(target_dir/"*.parquet", columns=columns)
-                if is_filter:
-                    df = df.filter(pl.col("mapq") >= min_mapq).drop('mapq')
-                else:
-                    if self._metadata['is_with_mapq']:
-                            if column_names:
-                                if 'mapq' not in column_names:
-                                    df = df.drop('mapq')
-
-                yield df
+                yield scan_chunk(target_dir/"*.parquet", column_names, filters).collect()
 
         elif return_as == "files":
             for file in target_dir.iterdir():
@@ -378,6 +376,198 @@ class PQS:
         else:
             raise ValueError("The return_as must be 'generator' or 'files'.")
         
+    def scan(self, columns=None, filters=None, min_mapq=0, 
+                chunks=None, path=None):
+        """
+        Lazily scan the .pqs file, the `filters` are pushed down into the 
+        parquet reader, row groups are skipped when their statistics can not 
+        satisfy the predicates.
+
+        Params:
+        --------
+        columns: list or None
+            column names to select, all columns if None
+        filters: list or None
+            list of polars expressions, see `pairs_filters`
+        min_mapq: int
+            minimum mapping quality
+        chunks: list or None
+            parquet chunks to scan, all chunks of q0/q1 if None
+        path: str or None
+            path of .pqs
+
+        Returns:
+        --------
+        pl.LazyFrame
+
+        Examples:
+        --------
+        >>> p = PQS("sample.pairs.pqs")
+        >>> p.init_read()
+        >>> lf = p.scan(columns=["chrom1", "chrom2"],
+        ...             filters=pairs_filters(trans=True), min_mapq=2)
+        >>> df = lf.collect()
+        """
+        if chunks is None:
+            chunks = self.read(path, min_mapq=min_mapq, return_as="files")
+        chunks = [str(chunk) for chunk in chunks]
+        
+        filters = list(filters) if filters else []
+        if self._metadata["is_with_mapq"]:
+            filters.extend(pairs_filters(min_mapq=min_mapq))
+        
+        return scan_chunk(chunks, columns, filters)
+
+
+    def sort_chunks(self, path=None):
+        """
+        Rewrite the chunks of q0 and q1 by `write_chunk`, e.g. the chunks 
+        written by `cphasing-rs pairs2pqs`, which are in the order of input 
+        pairs and carry no useful row group statistics. 
+        """
+        assert path is not None or self.path is not None, "Please provide a path of .pqs."
+        if path is None:
+            path = self.path
+        
+        chunks = [Path(path) / quality / chunk 
+                    for quality in ("q0", "q1")
+                    for chunk in natsorted(os.listdir(Path(path) / quality))]
+        Parallel(n_jobs=self.threads)(
+            delayed(process_chunk_sort)(chunk) for chunk in chunks
+        )
+
+        logger.info(f"Sorted {len(chunks):,} chunks of `{path}`.")
+
+    def build_index(self, path=None):
+        """
+        Build the `_index` sidecar, which maps each (chrom1, chrom2) to the 
+        (chunk, row group, row range) of q0 and q1. 
+        The rows of a contig pair are contiguous in the sorted chunks, 
+        otherwise the range covers all the rows of this pair in the row group.
+        """
+        assert path is not None or self.path is not None, "Please provide a path of .pqs."
+        if path is None:
+            path = self.path
+        
+        args = []
+        for quality in ("q0", "q1"):
+            for chunk in natsorted(os.listdir(Path(path) / quality)):
+                args.append((Path(path).absolute() / quality / chunk, quality))
+        
+        results = Parallel(n_jobs=self.threads)(
+                    delayed(process_chunk_index)(*arg) for arg in args
+                )
+        index = pl.concat(results)
+        index.write_parquet(Path(path) / PQS_INDEX)
+        if path == self.path:
+            self._index = index
+
+        logger.info(f"Successful output index of {len(index):,} entries into `{Path(path) / PQS_INDEX}`.")
+
+    def load_index(self, path=None):
+        """
+        Load the `_index` sidecar, return None if it not exists or older than 
+        the chunks.
+        """
+        if path is None:
+            path = self.path
+
+        if self._index is not None and path == self.path:
+            return self._index
+
+        index_path = Path(path) / PQS_INDEX
+        if not index_path.exists():
+            return None
+        
+        chunk_mtime = max((chunk.stat().st_mtime 
+                            for quality in ("q0", "q1")
+                            for chunk in (Path(path) / quality).iterdir()), 
+                          default=0)
+        if index_path.stat().st_mtime < chunk_mtime:
+            logger.warning(f"The index `{index_path}` is older than the chunks, "
+                           "please rebuild it by `cphasing pairs-index`.")
+            return None
+        
+        index = pl.read_parquet(index_path)
+        if path == self.path:
+            self._index = index 
+        
+        return index
+
+    def query(self, contig1, contig2=None, min_mapq=0, columns=None):
+        """
+        Query the pairs between two contigs, or all pairs of `contig1` when 
+        `contig2` is None. The `_index` is used to read only the related 
+        row ranges, and fall back to a full scan if it not exists.
+
+        Params:
+        --------
+        contig1: str
+            contig name
+        contig2: str or None
+            contig name
+        min_mapq: int
+            minimum mapping quality
+        columns: list or None
+            column names to return, all columns if None
+
+        Returns:
+        --------
+        pl.DataFrame
+
+        Examples:
+        --------
+        >>> p = PQS("sample.pairs.pqs")
+        >>> p.init_read()
+        >>> p.build_index()
+        >>> df = p.query("utg000001l", "utg000002l", min_mapq=1)
+        """
+        import pyarrow as pa 
+        import pyarrow.parquet as pq 
+
+        pl.enable_string_cache()
+        contig1 = str(contig1)
+        chrom1 = pl.col("chrom1").cast(pl.Utf8)
+        chrom2 = pl.col("chrom2").cast(pl.Utf8)
+        if contig2 is None:
+            pair_filter = (chrom1 == contig1) | (chrom2 == contig1)
+        else:
+            contig2 = str(contig2)
+            pair_filter = (((chrom1 == contig1) & (chrom2 == contig2)) 
+                            | ((chrom1 == contig2) & (chrom2 == contig1)))
+        
+        is_with_mapq = self._metadata["is_with_mapq"]
+        quality = "q1" if is_with_mapq and min_mapq > 0 else "q0"
+        filters = [pair_filter]
+        if is_with_mapq and min_mapq > 1:
+            filters.append(pl.col("mapq") >= min_mapq)
+        
+        index = self.load_index()
+        if index is None:
+            logger.warning("The index of pqs not found, scanning all chunks.")
+            chunks = list((Path(self.path) / quality).iterdir())
+            return self.scan(columns=columns, filters=filters, chunks=chunks).collect()
+
+        hits = index.filter((pl.col("quality") == quality) & pair_filter)
+        read_columns = None 
+        if columns is not None:
+            read_columns = list(dict.fromkeys(
+                ["chrom1", "chrom2"] + (["mapq"] if len(filters) > 1 else []) + list(columns)))
+
+        tables = []
+        for (chunk, row_group), ranges in hits.group_by(["chunk", "row_group"], maintain_order=True):
+            table = pq.ParquetFile(Path(self.path) / quality / chunk).read_row_group(
+                        row_group, columns=read_columns)
+            for start, end in merge_ranges(ranges.select(["start", "end"]).iter_rows()):
+                tables.append(table.slice(start, end - start))
+        
+        if not tables:
+            schema = {col: self._schema[col] for col in (columns or self._metadata["columns"])}
+            return pl.DataFrame(schema=schema)
+
+        df = pl.from_arrow(pa.concat_tables(tables, promote_options="default")).filter(*filters)
+
+        return df.select(columns) if columns is not None else df
 
     def to_depth(self, chunks, output, min_mapq=0, binsize=10000):
         """
@@ -476,7 +666,7 @@ class PQS:
             
 
             chunk1 = chunk1.with_columns([
-                pl.col('chrom').map_elements(chromsizes_db.get).alias('length')
+                contig_lookup('chrom', chromsizes_db, pl.Int64).alias('length')
             ])
 
             chunk1 = chunk1.with_columns([
@@ -488,7 +678,7 @@ class PQS:
             chunk1 = chunk1.drop(['length'])
 
             chunk2 = chunk2.with_columns([
-                pl.col('chrom').map_elements(chromsizes_db.get).alias('length')
+                contig_lookup('chrom', chromsizes_db, pl.Int64).alias('length')
             ])
 
             chunk2 = chunk2.with_columns([
@@ -558,9 +748,25 @@ class PQS:
                 binsize=10000, min_mapq=1, low_memory=False):
         """
         Convert the .pqs file to .cool file.
+
+        Each chunk is binned into a run of pixels sorted by (bin1_id, bin2_id) 
+        in parallel, then the runs are k-way merged and streamed into cooler 
+        in bounded-size chunks.
+
+        Params:
+        --------
+        chunks: iterable
+            parquet files or DataFrames of pairs
+        output: str
+            output cool
+        binsize: int
+            bin size
+        min_mapq: int
+            minimum mapping quality
+        low_memory: bool
+            use smaller buffers in merging
         """
-        import cooler 
-        from cooler.create import create, create_cooler
+        from cooler.create import create_cooler
 
         is_with_mapq = self._metadata["is_with_mapq"]
 
@@ -578,55 +784,37 @@ class PQS:
         bin_offset = bin_offset.shift(1).fillna(0).astype(int)
         bin_offset_db = bin_offset.to_dict()
 
-        def process_chunk(chunk):
-            bin1_id = (chunk["pos1"] // binsize) + chunk["chrom1"].map_elements(
-                bin_offset_db.get
-            )
-            bin2_id = (chunk["pos2"] // binsize) + chunk["chrom2"].map_elements(
-                bin_offset_db.get
-            )
-            chunk = (
-                chunk.with_columns([bin1_id.alias("bin1_id"), bin2_id.alias("bin2_id")])
-                .drop(["chrom1", "chrom2", "pos1", "pos2"])
-                .filter(pl.col("bin1_id") <= pl.col("bin2_id"))
-            )
-
-            chunk = chunk.group_by(["bin1_id", "bin2_id"], maintain_order=True).agg(
-                pl.count("bin1_id").alias("count")
-            )
-
-            chunk = chunk.sort(['bin1_id', 'bin2_id'])
-     
-            return chunk
+        n_bins = len(bins)
+        chunksize = PIXELS_CHUNKSIZE // 10 if low_memory else PIXELS_CHUNKSIZE
         
-        def process_chunk_to_cool(chunks):
-            for chunk in chunks:
-                yield process_chunk(chunk).to_pandas()
-        
-        if low_memory:
-            iterator = process_chunk_to_cool(chunks)
-
-            create_cooler(output, bins, iterator, 
-                      triucheck=False, dupcheck=False, boundscheck=False,)
-        
-        else:
-            chunks = list(map(lambda x: Path(x).absolute(), chunks))
-            results = Parallel(n_jobs=self.threads)(
-                delayed(process_chunk_to_cool_global)(*arg)
-                for arg in ((chunk, binsize, bin_offset_db, self._schema,
-                             min_mapq, is_with_mapq) for chunk in chunks)
-            )
+        with TemporaryDirectory(suffix="_pixels", dir="./") as tmpdir:
+            chunks = iter(chunks)
+            first = next(chunks, None)
+            chunks = itertools.chain([first], chunks) if first is not None else iter([])
+            if isinstance(first, (pl.DataFrame, pd.DataFrame)):
+                ## DataFrames from `PQS.read` in low memory mode, 
+                ## each one is written into a run and dropped before the next is read
+                runs = []
+                for i, chunk in enumerate(chunks):
+                    if isinstance(chunk, pd.DataFrame):
+                        chunk = pl.from_pandas(chunk)
+                    runs.append(process_chunk_to_cool_run(chunk, binsize, bin_offset_db, 
+                                                          self._schema, min_mapq, is_with_mapq, 
+                                                          n_bins, f"{tmpdir}/{i}"))
+                    del chunk
+            else:
+                runs = Parallel(n_jobs=self.threads)(
+                    delayed(process_chunk_to_cool_run)(
+                        Path(chunk).absolute(), binsize, bin_offset_db, self._schema, 
+                        min_mapq, is_with_mapq, n_bins, f"{tmpdir}/{i}")
+                            for i, chunk in enumerate(chunks)
+                )
 
             os.environ["POLARS_MAX_THREADS"] = str(self.threads)
 
-            pixels = pl.concat(results)
-
-            pixels = pixels.group_by(["bin1_id", "bin2_id"], maintain_order=True).agg(
-                pl.sum("count").alias("count")
-            )
-            pixels = pixels.sort(["bin1_id", "bin2_id"])  
-            create(output, bins, pixels.to_pandas(), 
-                    triucheck=False, dupcheck=False, boundscheck=False,)
+            pixels = merge_pixel_runs(runs, n_bins, chunksize=chunksize)
+            create_cooler(output, bins, pixels, ordered=True,
+                          triucheck=False, dupcheck=False, boundscheck=False)
 
         logger.info(f"Successful output cooler file into `{output}`.")
     
@@ -636,9 +824,13 @@ class PQS:
         """
         pass
 
-    def to_hg_df(self, chunks, contig_idx, 
-                 min_mapq=1, edge_length=0,
-                 bed=None, hcr_binsize=10000):
+    def iter_hg_df(self, chunks, contig_idx, 
+                   min_mapq=1, edge_length=0,
+                   bed=None, hcr_binsize=10000):
+        """
+        Yield the contig idx pairs (chrom1, chrom2, mapq) of each chunk, 
+        chunks are processed in parallel but consumed one by one.
+        """
         from intervaltree import IntervalTree
         pl.enable_string_cache()
         contigsizes = self.contigsizes_db
@@ -651,7 +843,7 @@ class PQS:
 
             if edge_length > 0:
                 bed_df = bed_df.with_columns([
-                    pl.col('chrom').map_elements(contigsizes.get).alias('length')
+                    contig_lookup('chrom', contigsizes, pl.Int64).alias('length')
                 ]).filter(
                     (pl.col('start') < edge_length) | (pl.col('end') > pl.col('length') - edge_length)
                 )
@@ -672,11 +864,19 @@ class PQS:
         for chunk in chunks:
             args.append((Path(chunk).absolute(), bed_dict, contigsizes, contig_idx, min_mapq, edge_length))
       
-        results = Parallel(n_jobs=self.threads)(
+        results = Parallel(n_jobs=self.threads, return_as="generator")(
                     delayed(process_chunk_hg)(*arg) for arg in args
                 )
         
-        results = list(filter(lambda x: x is not None, results))
+        for result in results:
+            if result is not None:
+                yield result
+
+    def to_hg_df(self, chunks, contig_idx, 
+                 min_mapq=1, edge_length=0,
+                 bed=None, hcr_binsize=10000):
+        results = list(self.iter_hg_df(chunks, contig_idx, min_mapq, 
+                                       edge_length, bed, hcr_binsize))
         if len(results) == 0:
             logger.warning("No data found in the given region.")
             return
@@ -705,47 +905,44 @@ class PQS:
                 min_count=1):
         """
         Convert the .pqs file to .clm file.
+
+        The orientation distances of each chunk are computed as integers and 
+        saved in parquet, then merged in-process by (contig pair, orientation) 
+        in hash buckets of contig pairs, and each bucket is formatted and 
+        written before the next one is merged. 
+        The output is binary clm if it ends with `.parquet`.
         """
         pl.enable_string_cache()
 
         is_with_mapq = self._metadata["is_with_mapq"]    
 
         args = []
-        
-
-        with TemporaryDirectory(suffix="_clm", delete=False, dir="./") as tmpdir:
+        with TemporaryDirectory(suffix="_clm", dir="./") as tmpdir:
             for chunk in chunks:
                 args.append((chunk, self.contigsizes_db, self._schema, min_mapq, is_with_mapq, tmpdir))
-            Parallel(n_jobs=self.threads, backend="multiprocessing")(
-                delayed(process_chunk_clm)(*arg)
-                (*arg) for arg in args
+            results = Parallel(n_jobs=self.threads)(
+                delayed(process_chunk_clm)(*arg) for arg in args
             )
+
+            os.environ["POLARS_MAX_THREADS"] = str(self.threads)
+            ## the buckets are streamed into output
+            write_clm(merge_clm_chunks(results, tmpdir, min_count=min_count), output)
         
-        cmd = ["cphasing-rs", "clm-merge", tmpdir, "-o", output]
-        
-        flag = run_cmd(cmd, log=os.devnull)
-        assert flag == 0, "Failed to merge the clm files."
+        logger.info(f"Successful output clm file into `{output}`.")
 
-    
     def intersect(self, chunks, bed, output, min_mapq=1):
-        from intervaltree import IntervalTree
         is_with_mapq = self._metadata["is_with_mapq"]
         bed_df = pl.read_csv(bed, separator="\t", has_header=False,
-                             columns=[0, 1, 2], new_columns=['chrom', 'start', 'end'])
-        bed_df = bed_df.to_pandas()
-        bed_df.set_index(['chrom'], inplace=True)
-        bed_df['region'] = bed_df.apply(lambda x: (x['start'], x['end']), axis=1)
-        bed_dict = defaultdict(list)
-        for chrom, region in bed_df.groupby(level=0):
-            # bed_dict[chrom] = IntervalTree.from_tuples(region['region'])
-            bed_dict[chrom] = region['region'].values.tolist()
+                             columns=[0, 1, 2], new_columns=['chrom', 'start', 'end'],
+                             schema_overrides={'chrom': pl.Utf8, 'start': pl.Int64, 'end': pl.Int64})
+        bed_df = bed_df.sort("start")
 
         Path(output).mkdir(exist_ok=True)
         Path(f"{output}/q0").mkdir(exist_ok=True)
         Path(f"{output}/q1").mkdir(exist_ok=True)
       
         Parallel(n_jobs=self.threads)(
-            delayed(process_chunk_intersect_global)(chunk, bed_dict, is_with_mapq, min_mapq, output) for chunk in chunks
+            delayed(process_chunk_intersect_global)(chunk, bed_df, is_with_mapq, min_mapq, output) for chunk in chunks
         )
 
         shutil.copy(f"{self.path}/_contigsizes", output)
@@ -764,7 +961,8 @@ class PQS:
     
     def from_pairs(self, pairs,
                    path=None,
-                   chunksize=1e5):
+                   chunksize=1e5,
+                   index=True):
         """
         Create a .pqs file from the given pairs.
         """
@@ -868,6 +1066,9 @@ class PQS:
         with open(Path(path) / "_readme", "w") as f:
             f.write(self._readme)
 
+        if index:
+            self.build_index(path)
+
         logger.info(f"Successful output .pqs file into `{path}`.")
 
     def from_porec_table(self, porec):
@@ -877,6 +1078,208 @@ class PQS:
         pass
 
 
+def contig_lookup_table(mapping, dtype=None):
+    """
+    Build a small columnar lookup table from a per-contig dict,
+        e.g. contig sizes, contig index or bin offsets.
+
+    Params:
+    --------
+    mapping: dict
+        contig -> value
+    dtype: polars.DataType, optional
+        dtype of the value column
+
+    Returns:
+    --------
+    pl.DataFrame with columns `chrom` and `value`
+    """
+    if isinstance(mapping, pd.Series):
+        mapping = mapping.to_dict()
+
+    return pl.DataFrame({
+        "chrom": pl.Series(list(map(str, mapping.keys())), dtype=pl.Utf8),
+        "value": pl.Series(list(mapping.values()), dtype=dtype)
+    })
+
+
+def contig_lookup(column, mapping, dtype=None):
+    """
+    Vectorized replacement of `pl.col(column).map_elements(mapping.get)`,
+        contigs that not in mapping will be null. The distinct contigs of 
+        a chunk are mapped by name once, then the values are gathered by 
+        the physical codes of the Categorical column, so the strings of 
+        each row are not hashed. The codes are matched within the chunk 
+        rather than indexed directly, as they are the ids of the global 
+        string cache, which differ between processes. The expression is 
+        not elementwise, so the predicates using it stay above the scan.
+
+    Params:
+    --------
+    column: str
+        name of the contig column, Categorical or Utf8
+    mapping: dict or pl.DataFrame
+        contig -> value, or the result of `contig_lookup_table`
+    dtype: polars.DataType, optional
+        dtype of the returned values
+
+    Examples:
+    --------
+    >>> chunk.with_columns(contig_lookup("chrom1", contigsizes, pl.Int64).alias("length1"))
+    """
+    if isinstance(mapping, pl.DataFrame):
+        table = mapping
+    else:
+        table = contig_lookup_table(mapping)
+
+    ## `maintain_order` keeps the codes and the values of distinct contigs aligned
+    contigs = pl.col(column).unique(maintain_order=True).drop_nulls()
+    values = contigs.cast(pl.Utf8).replace_strict(table["chrom"], table["value"],
+                                                  default=None, return_dtype=dtype)
+
+    return pl.col(column).to_physical().replace_strict(contigs.to_physical(), values, 
+                                                       default=None, return_dtype=dtype)
+
+
+def write_chunk(chunk, output):
+    """
+    Write a chunk of pairs into parquet, which is sorted by 
+    (chrom1, chrom2, pos1) and carries row group statistics.
+    """
+    sort_keys = [pl.col(col).cast(pl.Utf8) if col.startswith("chrom") else pl.col(col) 
+                    for col in PQS_SORT_COLUMNS if col in chunk.columns]
+    chunk = chunk.sort(sort_keys)
+    chunk.write_parquet(output, statistics=True, row_group_size=PQS_ROW_GROUP_SIZE)
+
+
+def process_chunk_sort(chunk):
+    """
+    sort a chunk in place by `write_chunk`
+    """
+    os.environ["POLARS_MAX_THREADS"] = "1"
+    tmp = f"{chunk}.{os.getpid()}.tmp"
+    write_chunk(pl.read_parquet(chunk), tmp)
+    os.replace(tmp, chunk)
+
+
+def pairs_filters(min_mapq=0, contigs=None, trans=None, 
+                    edge_length=0, contigsizes=None):
+    """
+    Build the predicates of pairs for `scan_chunk` and `PQS.scan`.
+
+    Only the numeric predicates (mapq) are pruned by the row group statistics 
+    of polars. The predicates on the Categorical chrom columns (contigs, trans)
+    are pushed into the scan but only filter the decoded rows, and the 
+    contig-edge predicates are applied after the scan, so neither of them 
+    skips a row group, even in the sorted chunks of `write_chunk`.
+
+    Params:
+    --------
+    min_mapq: int
+        retain pairs with mapq >= min_mapq
+    contigs: list or None
+        retain pairs whose both mates are in the contigs
+    trans: bool or None
+        retain only inter-contig (True) or intra-contig (False) pairs
+    edge_length: int
+        retain pairs whose both mates are within `edge_length` of contig ends,
+        `contigsizes` must be provided
+    contigsizes: dict or pd.Series
+        contig sizes
+    
+    Returns:
+    --------
+    list of pl.Expr
+    """
+    filters = []
+    if min_mapq > 0:
+        filters.append(pl.col("mapq") >= min_mapq)
+    
+    if contigs is not None:
+        contigs = list(map(str, contigs))
+        filters.append(pl.col("chrom1").cast(pl.Utf8).is_in(contigs))
+        filters.append(pl.col("chrom2").cast(pl.Utf8).is_in(contigs))
+
+    if trans is True:
+        filters.append(pl.col("chrom1") != pl.col("chrom2"))
+    elif trans is False:
+        filters.append(pl.col("chrom1") == pl.col("chrom2"))
+
+    if edge_length > 0:
+        assert contigsizes is not None, "contigsizes must be provided with edge_length"
+        sizes_table = contig_lookup_table(contigsizes, pl.Int64)
+        for i in (1, 2):
+            filters.append(
+                (pl.col(f"pos{i}") < edge_length)
+                | (pl.col(f"pos{i}") > (contig_lookup(f"chrom{i}", sizes_table) - edge_length))
+            )
+    
+    return filters
+
+
+def scan_chunk(chunk, columns=None, filters=None):
+    """
+    Lazily scan parquet chunk(s) with the predicates pushed down.
+
+    Params:
+    --------
+    chunk: str, Path or list
+        parquet file(s) or glob
+    columns: list or None
+        column names to select
+    filters: list or None
+        list of polars expressions
+    
+    Returns:
+    --------
+    pl.LazyFrame
+    """
+    if isinstance(chunk, Path):
+        chunk = str(chunk)
+
+    lf = pl.scan_parquet(chunk)
+    ## one filter per predicate, so that the pushable ones still reach the 
+    ## scan when the others (e.g. contig lookups) can not be pushed down
+    for f in filters or []:
+        lf = lf.filter(f)
+    if columns is not None:
+        lf = lf.select(columns)
+    
+    return lf
+
+
+def filter_regions(chunk, bed_df):
+    """
+    Retain pairs whose both mates are located in the regions, 
+    vectorized version of `is_in_regions`.
+
+    Params:
+    --------
+    chunk: pl.DataFrame
+        pairs
+    bed_df: pl.DataFrame
+        regions with columns of chrom (Utf8), start (Int64) and end (Int64), 
+        sorted by start
+    """
+    chunk = chunk.with_row_index("_row")
+    for i in (1, 2):
+        hits = (
+            chunk.select(
+                "_row", 
+                pl.col(f"chrom{i}").cast(pl.Utf8).alias("chrom"),
+                pl.col(f"pos{i}").cast(pl.Int64).alias("pos")
+            )
+            .sort("pos")
+            .join_asof(bed_df, left_on="pos", right_on="start", 
+                       by="chrom", strategy="backward")
+            .filter(pl.col("pos") < pl.col("end"))
+            .select("_row")
+        )
+        chunk = chunk.join(hits, on="_row", how="semi")
+    
+    return chunk.drop("_row")
+
+
 def process_chunk_to_depth_global(chunk, binsize, chromsizes_db,
                                  min_mapq, is_with_mapq):
 
@@ -888,12 +1291,8 @@ def process_chunk_to_depth_global(chunk, binsize, chromsizes_db,
         else ["chrom1", "pos1", "chrom2", "pos2"]
     )
 
-    chunk = pl.read_parquet(chunk,
-                            columns=columns)
-    
-    if min_mapq > 1:
-        if is_with_mapq:
-            chunk = chunk.filter(pl.col("mapq") >= min_mapq)
+    filters = pairs_filters(min_mapq=min_mapq if is_with_mapq else 0)
+    chunk = scan_chunk(chunk, columns, filters).collect()
 
     chunk = chunk.with_columns(
         ((pl.col('pos1')) // binsize).alias('pos1'),
@@ -925,10 +1324,11 @@ def process_chunk_to_depth_global(chunk, binsize, chromsizes_db,
 
     chunk1.columns = ['chrom', 'start', 'end', 'count']
     chunk2.columns = ['chrom', 'start', 'end', 'count']
-    
+
+    sizes_table = contig_lookup_table(chromsizes_db, pl.Int64)
 
     chunk1 = chunk1.with_columns([
-        pl.col('chrom').map_elements(chromsizes_db.get).alias('length')
+        contig_lookup('chrom', sizes_table).alias('length')
     ])
 
     chunk1 = chunk1.with_columns([
@@ -940,7 +1340,7 @@ def process_chunk_to_depth_global(chunk, binsize, chromsizes_db,
     chunk1 = chunk1.drop(['length'])
 
     chunk2 = chunk2.with_columns([
-        pl.col('chrom').map_elements(chromsizes_db.get).alias('length')
+        contig_lookup('chrom', sizes_table).alias('length')
     ])
 
     chunk2 = chunk2.with_columns([
@@ -953,22 +1353,18 @@ def process_chunk_to_depth_global(chunk, binsize, chromsizes_db,
 
     return chunk1, chunk2
 
-def process_chunk_intersect_global(chunk_name, bed_dict, is_with_mapq, min_mapq, output):
-
-    chunk = pl.read_parquet(chunk_name)
+def process_chunk_intersect_global(chunk_name, bed_df, is_with_mapq, min_mapq, output):
+    os.environ["POLARS_MAX_THREADS"] = "1"
+    filters = pairs_filters(min_mapq=min_mapq if is_with_mapq else 0)
+    chunk = scan_chunk(chunk_name, filters=filters).collect()
     chunk_name = Path(chunk_name).stem
-    if min_mapq > 1:
-        chunk = chunk.filter(pl.col("mapq") >= min_mapq)
-
-    chunk = chunk.filter(
-        pl.struct(["chrom1", "pos1"]).apply(lambda x: is_in_regions(x["chrom1"], x["pos1"], bed_dict)), 
-        pl.struct(["chrom2", "pos2"]).apply(lambda x: is_in_regions(x["chrom2"], x["pos2"], bed_dict))
-    )
+    
+    chunk = filter_regions(chunk, bed_df)
 
-    chunk.write_parquet(f"{output}/q0/{chunk_name}.parquet")
+    write_chunk(chunk, f"{output}/q0/{chunk_name}.parquet")
     if is_with_mapq:
         chunk = chunk.filter(pl.col("mapq") >= 1)
-    chunk.write_parquet(f"{output}/q1/{chunk_name}.parquet")
+    write_chunk(chunk, f"{output}/q1/{chunk_name}.parquet")
 
 
 
@@ -981,18 +1377,18 @@ def process_chunk_to_cool_global(chunk, binsize,
 
     os.environ["POLARS_MAX_THREADS"] = "1"
 
-    columns = ["chrom1", "pos1", "chrom2", "pos2", "mapq"] if is_with_mapq else ["chrom1", "pos1", "chrom2", "pos2"]
-    chunk = pl.read_parquet(chunk, columns=columns)
-    if min_mapq > 1:
-        if is_with_mapq:
-            chunk = chunk.filter(pl.col("mapq") >= min_mapq).drop("mapq")
+    columns = ["chrom1", "pos1", "chrom2", "pos2"]
+    if isinstance(chunk, pl.DataFrame):
+        chunk = chunk.select(columns)
+    else:
+        filters = pairs_filters(min_mapq=min_mapq if is_with_mapq and min_mapq > 1 else 0)
+        chunk = scan_chunk(chunk, columns, filters).collect()
     
-    bin1_id = (chunk["pos1"] // binsize) + chunk["chrom1"].map_elements(
-            bin_offset_db.get
-    ).cast(schema["pos1"])
-    bin2_id = (chunk["pos2"] // binsize) + chunk["chrom2"].map_elements(
-        bin_offset_db.get
-    ).cast(schema["pos2"])
+    bin_offset_table = contig_lookup_table(bin_offset_db)
+    bin1_id = (pl.col("pos1") // binsize) + contig_lookup(
+        "chrom1", bin_offset_table, schema["pos1"])
+    bin2_id = (pl.col("pos2") // binsize) + contig_lookup(
+        "chrom2", bin_offset_table, schema["pos2"])
     chunk = (
         chunk.with_columns([bin1_id.alias("bin1_id"), bin2_id.alias("bin2_id")])
         .drop(["chrom1", "chrom2", "pos1", "pos2"])
@@ -1019,6 +1415,80 @@ def process_chunk_to_cool_global(chunk, binsize,
     return chunk
 
 
+def process_chunk_to_cool_run(chunk, binsize, 
+                              bin_offset_db, 
+                              schema,
+                              min_mapq,
+                              is_with_mapq,
+                              n_bins,
+                              prefix):
+    """
+    Bin a chunk and save its pixels as a sorted run of 
+    keys (bin1_id * n_bins + bin2_id, uint64) and counts (uint32).
+    """
+    pixels = process_chunk_to_cool_global(chunk, binsize, bin_offset_db, 
+                                          schema, min_mapq, is_with_mapq)
+    keys = (pixels["bin1_id"].to_numpy().astype(np.uint64) * np.uint64(n_bins) 
+            + pixels["bin2_id"].to_numpy().astype(np.uint64))
+    np.save(f"{prefix}.keys.npy", keys)
+    np.save(f"{prefix}.counts.npy", pixels["count"].to_numpy().astype(np.uint32))
+
+    return prefix
+
+
+def merge_pixel_runs(runs, n_bins, chunksize=PIXELS_CHUNKSIZE):
+    """
+    K-way merge the sorted pixel runs, yield the summed and deduplicated 
+    pixels in order, each of them at most about `chunksize` pixels.
+
+    Params:
+    --------
+    runs: list
+        prefixes of runs written by `process_chunk_to_cool_run`
+    n_bins: int
+        number of bins
+    chunksize: int
+        number of pixels loaded in each round
+    
+    Returns:
+    --------
+    generator of pd.DataFrame with columns of bin1_id, bin2_id and count
+    """
+    keys = [np.load(f"{run}.keys.npy", mmap_mode="r") for run in runs]
+    counts = [np.load(f"{run}.counts.npy", mmap_mode="r") for run in runs]
+    positions = [0] * len(runs)
+    step = max(1, chunksize // max(1, len(runs)))
+
+    while True:
+        active = [i for i in range(len(runs)) if positions[i] < len(keys[i])]
+        if not active:
+            break
+        
+        ends = {i: min(positions[i] + step, len(keys[i])) for i in active}
+        ## keys until the smallest last key of the unfinished runs are complete
+        frontiers = [keys[i][ends[i] - 1] for i in active if ends[i] < len(keys[i])]
+        frontier = min(frontiers) if frontiers else None
+
+        key_list = []
+        count_list = []
+        for i in active:
+            block = keys[i][positions[i]:ends[i]]
+            n = len(block) if frontier is None else np.searchsorted(block, frontier, side="right")
+            key_list.append(block[:n])
+            count_list.append(counts[i][positions[i]:positions[i] + n])
+            positions[i] += n
+        
+        merged_keys, inverse = np.unique(np.concatenate(key_list), return_inverse=True)
+        merged_counts = np.bincount(inverse, weights=np.concatenate(count_list), 
+                                    minlength=len(merged_keys))
+        
+        yield pd.DataFrame({
+            "bin1_id": merged_keys // np.uint64(n_bins),
+            "bin2_id": merged_keys % np.uint64(n_bins),
+            "count": merged_counts.astype(np.uint32)
+        })
+
+
 def is_in_regions2(chrom, pos, bed_dict):
     if chrom not in bed_dict:
         return False
@@ -1050,34 +1520,11 @@ def process_chunk_hg(chunk_name, bed_dict, contigsizes,
     if not Path(chunk_name).exists():
         return None
 
-    columns = ["chrom1", "pos1", "chrom2", "pos2", "mapq"]
-    chunk = pl.scan_parquet(chunk_name).select(columns)
+    columns = ["chrom1", "chrom2", "mapq"]
+    filters = pairs_filters(min_mapq=min_mapq if min_mapq > 1 else 0, 
+                            edge_length=edge_length, contigsizes=contigsizes)
+    chunk = scan_chunk(chunk_name, columns, filters)
     chunk_name = Path(chunk_name).stem
-    if min_mapq > 1:
-        chunk = chunk.filter(pl.col("mapq") >= min_mapq)
-
-    # chunk = chunk.filter(pl.col("chrom1") != pl.col("chrom2"))
-
-    if edge_length > 0:
-        chunk = (
-            chunk.with_columns(
-                pl.col("chrom1")
-                    .map_elements(contigsizes.get, skip_nulls=False)
-                    .alias("length1"),
-                pl.col("chrom2")
-                    .map_elements(contigsizes.get, skip_nulls=False)
-                    .alias("length2"),
-            )
-            .filter(
-                (
-                    ((pl.col("pos1") < edge_length)
-                    | (pl.col("pos1") > (pl.col("length1") - edge_length)))
-                    & ((pl.col("pos2") < edge_length)
-                    | (pl.col("pos2") > (pl.col("length2") - edge_length)))
-                )
-            )
-            .select(["chrom1", "pos1", "chrom2", "pos2", "mapq"])
-        )
 
     if bed_dict:
         # chunk = chunk.filter(
@@ -1096,9 +1543,10 @@ def process_chunk_hg(chunk_name, bed_dict, contigsizes,
 
     
 
+    idx_table = contig_lookup_table(contig_idx, pl.UInt32)
     chunk = chunk.with_columns(
-        pl.col("chrom1").map_elements(contig_idx.get, skip_nulls=False).alias("chrom1"),
-        pl.col("chrom2").map_elements(contig_idx.get, skip_nulls=False).alias("chrom2"),
+        contig_lookup("chrom1", idx_table).alias("chrom1"),
+        contig_lookup("chrom2", idx_table).alias("chrom2"),
     ).drop_nulls(subset=["chrom1", "chrom2"])
 
     return chunk.collect()
@@ -1107,93 +1555,111 @@ def process_chunk_hg(chunk_name, bed_dict, contigsizes,
 def process_chunk_clm(chunk, contigsizes_db, schema,
                       min_mapq=0, is_with_mapq=True,
                       tmp_dir="."):
-    pl.enable_string_cache()
+    """
+    Calculate the distances of four orientations of inter-contig pairs, 
+    and save them into `{tmp_dir}/{chunk_name}.parquet`.
+    """
     os.environ["POLARS_MAX_THREADS"] = "1"
 
-    columns = ["chrom1", "pos1", "chrom2", "pos2", "mapq"] if is_with_mapq else ["chrom1", "pos1", "chrom2", "pos2"]
+    columns = ["chrom1", "pos1", "chrom2", "pos2"]
     
     chunk_name = Path(chunk).stem
 
-    chunk = pl.read_parquet(chunk, columns=columns)
-    if min_mapq > 1:
-        if is_with_mapq:
-            chunk = chunk.filter(pl.col("mapq") >= min_mapq).drop("mapq")   
+    filters = pairs_filters(min_mapq=min_mapq if is_with_mapq and min_mapq > 1 else 0, 
+                            trans=True)
+    chunk = scan_chunk(chunk, columns, filters)
 
-    chunk = chunk.filter(pl.col("chrom1") != pl.col("chrom2"))
-    chunk = chunk.with_columns(
-        pl.col("chrom1")
-        .map_elements(contigsizes_db.get)
-        .cast(schema["pos1"])
-        .alias("length1"),
-        pl.col("chrom2")
-        .map_elements(contigsizes_db.get)
-        .cast(schema["pos2"])
-        .alias("length2"),
-    )
+    sizes_table = contig_lookup_table(contigsizes_db, pl.Int64)
+    pos1 = pl.col("pos1").cast(pl.Int64)
+    pos2 = pl.col("pos2").cast(pl.Int64)
+    length1 = contig_lookup("chrom1", sizes_table)
+    length2 = contig_lookup("chrom2", sizes_table)
 
-    chunk = chunk.with_columns(
-        ((pl.col("length1") - pl.col("pos1")) + pl.col("pos2") )
-        .cast(pl.String)
-        .alias("++"),
-        (
-            (pl.col("length1") - pl.col("pos1")) 
-            + (pl.col("length2") - pl.col("pos2")) 
-        )
-        .cast(pl.String)
-        .alias("+-"),
-        (pl.col("pos1") + pl.col("pos2"))
-        .cast(pl.String)
-        .alias("-+"),
-        (pl.col("pos1") + (pl.col("length2") - pl.col("pos2")))
-        .cast(pl.String)
-        .alias("--"),
-    )
+    chunk = chunk.select(
+        pl.col("chrom1").cast(pl.Utf8),
+        pl.col("chrom2").cast(pl.Utf8),
+        ((length1 - pos1) + pos2).alias("++"),
+        ((length1 - pos1) + (length2 - pos2)).alias("+-"),
+        (pos1 + pos2).alias("-+"),
+        (pos1 + (length2 - pos2)).alias("--"),
+    ).collect()
 
-    chunk = chunk.drop(['length1', 'length2', 'pos1', 'pos2'])
-    try:
-        chunk = chunk.unpivot(["++", "+-", "-+", "--"], index=["chrom1", "chrom2"])
-    except AttributeError:
-        logger.error("The version of polars is too low, please update to the version of >= 1.*")
-        sys.exit(1)
+    output = f"{tmp_dir}/{chunk_name}.parquet"
+    chunk.write_parquet(output)
 
-    chunk = (
-        chunk.group_by(["chrom1", "chrom2", "variable"])
-        .agg(pl.col("value"))
-        .sort(["chrom1", "chrom2", "variable"])
-    )
+    return output
 
-    chunk = chunk.with_columns(
-        (
-            pl.col("chrom1")
-            + pl.col("variable").str.slice(0, 1)
-            + pl.lit(" ")
-            + pl.col("chrom2")
-            + pl.col("variable").str.slice(1, 1)
-        ).cast(Categorical).alias("chrom"),
-    ).drop(["chrom1", "chrom2", "variable"])
-
-    chunk = chunk.with_columns(
-        # (pl.col("chrom1") + pl.col("variable").str.slice(0, 1) + pl.lit(" ") + pl.col("chrom2") + pl.col("variable").str.slice(1, 1)).alias("chrom"),
-        pl.col("value").list.eval(pl.element().len()).alias("count").map_elements(lambda x: x[0]),
-        pl.col("value").list.eval(pl.element().str.join(" ")).alias("value").map_elements(lambda x: x[0]),
-
-    ).select(["chrom", "count", "value"])
 
+def merge_clm_chunks(chunks, tmpdir, min_count=1, bucket_size=2**26):
+    """
+    Merge the distances of chunks into binary clm.
+        The rows of chunks are hashed into buckets of about `bucket_size` 
+        bytes by contig pair, as the cache of `Clm`, and merged bucket 
+        by bucket, so that only a bucket is kept in memory. The records are 
+        sorted by contig pair and orientation within each bucket.
+
+    Params:
+    --------
+    chunks: list
+        parquet files written by `process_chunk_clm`
+    tmpdir: str
+        directory to store the buckets
+    min_count: int
+        minimum number of contacts of a contig pair
+    bucket_size: int
+        bytes of chunk files in each bucket
+    
+    Returns:
+    --------
+    generator of pl.DataFrame with columns of contig1, contig2, orientation, count and distances
+    """
+    import pyarrow.parquet as pq
 
-    chunk.write_csv(f"{tmp_dir}/{chunk_name}.clm", include_header=False, separator="\t")
+    chunks = list(map(str, chunks))
+    size = sum(Path(chunk).stat().st_size for chunk in chunks)
+    n_buckets = int(size // bucket_size) + 1
     
-    # return chunk
+    bucket_writers = {}
+    for chunk in chunks:
+        df = pl.read_parquet(chunk).with_columns(
+            (pl.struct(["chrom1", "chrom2"]).hash(seed=0) % n_buckets).alias("bucket")
+        )
+        for (bucket, ), tmp_df in df.partition_by("bucket", as_dict=True).items():
+            table = tmp_df.drop("bucket").to_arrow()
+            if bucket not in bucket_writers:
+                bucket_writers[bucket] = pq.ParquetWriter(f"{tmpdir}/bucket_{bucket}.parquet", 
+                                                          table.schema, compression="lz4")
+            bucket_writers[bucket].write_table(table)
+        del df
+    
+    for bucket_writer in bucket_writers.values():
+        bucket_writer.close()
+
+    for bucket in sorted(bucket_writers):
+        clm = (
+            pl.scan_parquet(f"{tmpdir}/bucket_{bucket}.parquet")
+            .unpivot(CLM_ORIENTATIONS, index=["chrom1", "chrom2"],
+                    variable_name="orientation", value_name="distance")
+            .group_by(["chrom1", "chrom2", "orientation"])
+            .agg(
+                pl.len().cast(pl.UInt32).alias("count"),
+                pl.col("distance").alias("distances")
+            )
+            .filter(pl.col("count") >= min_count)
+            .rename({"chrom1": "contig1", "chrom2": "contig2"})
+            .sort(["contig1", "contig2", "orientation"])
+            .collect()
+        )
+        Path(f"{tmpdir}/bucket_{bucket}.parquet").unlink()
+        
+        yield clm
+
 
 def process_chunk_cis_depth(chunk, window_size, min_mapq, is_with_mapq):
     os.environ["POLARS_MAX_THREADS"] = "1"
-    chunk = pl.scan_parquet(chunk).select(["chrom1", "pos1", "chrom2", "pos2", "mapq"])
-    if is_with_mapq:
-        if min_mapq > 1:
-            chunk = chunk.filter(pl.col("mapq") >= min_mapq)
-        else:
-            chunk = chunk.drop("mapq")
-
-    chunk = chunk.filter(pl.col("chrom1") == pl.col("chrom2")).drop("chrom2")
+    filters = pairs_filters(min_mapq=min_mapq if is_with_mapq and min_mapq > 1 else 0, 
+                            trans=False)
+    chunk = scan_chunk(chunk, ["chrom1", "pos1", "pos2"], filters)
 
     chunk = chunk.with_columns(
         (pl.when(pl.col('pos1') > pl.col('pos2'))
@@ -1225,7 +1691,60 @@ def process_chunk_split_pairs(i, chunk, q0, q1, columns, schema, is_pairs_with_m
         truncate_ragged_lines=True,
     )
     chunk = chunk.cast(schema)
-    chunk.write_parquet(q0 / f"{i}.parquet")
+    write_chunk(chunk, q0 / f"{i}.parquet")
     if is_pairs_with_mapq:
         chunk = chunk.filter(pl.col("mapq") >= 1)
-    chunk.write_parquet(q1 / f"{i}.parquet")
\ No newline at end of file
+    write_chunk(chunk, q1 / f"{i}.parquet")
+
+
+def merge_ranges(ranges):
+    """
+    Merge the overlapping half-open row ranges.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    
+    return merged
+
+
+def process_chunk_index(chunk, quality):
+    import pyarrow.parquet as pq 
+    os.environ["POLARS_MAX_THREADS"] = "1"
+
+    metadata = pq.ParquetFile(chunk).metadata
+    row_group_sizes = [metadata.row_group(i).num_rows 
+                        for i in range(metadata.num_row_groups)]
+    row_group_offsets = np.cumsum([0] + row_group_sizes)
+
+    df = (
+        pl.scan_parquet(chunk)
+        .select(pl.col("chrom1").cast(pl.Utf8), pl.col("chrom2").cast(pl.Utf8))
+        .with_row_index("row")
+        .collect()
+    )
+    row_group = np.searchsorted(row_group_offsets, df["row"].to_numpy(), side="right") - 1
+    df = df.with_columns(
+        pl.Series("row_group", row_group, dtype=pl.UInt32),
+    ).with_columns(
+        (pl.col("row") - pl.Series(row_group_offsets[row_group], dtype=pl.UInt32)).alias("row")
+    )
+
+    index = (
+        df.group_by(["chrom1", "chrom2", "row_group"], maintain_order=True)
+        .agg(
+            pl.col("row").min().alias("start"),
+            (pl.col("row").max() + 1).alias("end"),
+            pl.len().alias("count")
+        )
+        .with_columns(
+            pl.lit(quality).alias("quality"),
+            pl.lit(Path(chunk).name).alias("chunk")
+        )
+        .select(["quality", "chunk", "row_group", "chrom1", "chrom2", "start", "end", "count"])
+    )
+
+    return index
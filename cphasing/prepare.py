@@ -13,14 +13,14 @@ import sys
 import pandas as pd
 import polars as pl
 
-from collections import OrderedDict
 from pathlib import Path
 
 from .utilities import (
     decompress_cmd,
-    digest, 
+    enzyme_cut_patterns,
+    find_cut_sites,
     get_contig_length,
-    read_fasta,
+    iter_fasta_bytes,
     run_cmd
 )
 
@@ -34,7 +34,7 @@ def write_chrom_sizes(fasta, output):
 
     logger.info(f"Successful output contigs size file in `{output}`.")
 
-def count_re_in_genome(fasta, enzyme, output=None):
+def count_re_in_genome(fasta, enzyme, output=None, threads=4):
     """
     count the RE sites.
 
@@ -43,26 +43,46 @@ def count_re_in_genome(fasta, enzyme, output=None):
     fasta: str
         Path of fasta file.
     enzyme: str
-
-    """
+        Name of restriction enzyme. i.e. HindIII, MboI, Arima
+    output: str, default None
+        Path of output count RE file.
+    threads: int, default 4
+        number of threads to scan contigs.
     
-    fasta_records = read_fasta(fasta)
+    Returns:
+    --------
+    pd.DataFrame:
+        dataframe with columns: "#Contig", "RECounts", "Length".
+    """
+    from joblib import Parallel, delayed
+
+    patterns = enzyme_cut_patterns(enzyme)
+
+    def _records():
+        seen = set()
+        for contig, seq in iter_fasta_bytes(fasta):
+            if contig not in seen:
+                seen.add(contig)
+                yield contig, seq
 
     logger.info(f"Starting count {enzyme} sites in {fasta}...")
-    site_df = digest(fasta_records, enzyme)
-    res_df = site_df.groupby('chrom', sort=False)['start'].count()
-    length_db = OrderedDict(zip(fasta_records.keys(), map(len, fasta_records.values())))
-    length_df = pd.DataFrame(length_db, index=['length']).T
-
-    res_df = pd.concat([res_df, length_df], axis=1)
-    res_df = res_df.reset_index()
-    res_df.columns = ['#Contig', "RECounts", "Length"]
+    res = Parallel(n_jobs=threads)(delayed(
+                    count_cut_sites)(contig, seq, patterns) 
+                        for contig, seq in _records())
+    
+    res_df = pd.DataFrame(res, columns=['#Contig', "RECounts", "Length"])
     
     if output:
         res_df.to_csv(output, sep='\t', header=True, index=None)
         logger.info(f"Successful output Count RE file in `{output}`.")
     return res_df
 
+def count_cut_sites(contig, seq, patterns):
+    """
+    count the fragments of a contig that digested by restriction enzyme.
+    """
+    return contig, len(find_cut_sites(seq, patterns)) + 1, len(seq)
+
 def split_contacts_to_contacts(split_contacts, output):
     df = pl.read_csv(split_contacts, separator='\t', has_header=False,
                      new_columns=['contig1', 'contig2', 'count'],
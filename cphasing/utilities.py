@@ -248,7 +248,23 @@ def is_compressed_table_empty(_file):
 
     return False
 
-def is_file_changed(input_file):
+def is_file_changed(input_file, md5_file=None):
+    """
+    check whether the file is changed by the md5 stored in `md5_file`, 
+        the md5 will be (re)generated if it is changed.
+
+    Params:
+    --------
+    input_file: str
+        input file or .pqs directory
+    md5_file: str, optional
+        path of md5 file, default is `.{prefix}.md5.txt` in the directory 
+        of input file
+    
+    Returns:
+    --------
+    bool
+    """
     from .pqs import PQS
     if input_file is None:
         return False
@@ -266,18 +282,20 @@ def is_file_changed(input_file):
     input_file_path = Path(input_file).absolute().parent
     file_name = Path(input_file).name
     prefix = Path(input_file).stem
+    if md5_file is None:
+        md5_file = f"{input_file_path}/.{prefix}.md5.txt"
 
-    if Path(f"{input_file_path}/.{prefix}.md5.txt").exists():
-        text = os.popen(f"md5sum -c {input_file_path}/.{prefix}.md5.txt 2>/dev/null").read()
+    if Path(md5_file).exists():
+        text = os.popen(f"md5sum -c {md5_file} 2>/dev/null").read()
         if not text.strip():
             return True
         if text.strip().split()[-1] == "OK":
             return False
         else:
-            os.system(f"md5sum {input_file_path}/{file_name} > {input_file_path}/.{prefix}.md5.txt")
+            os.system(f"md5sum {input_file_path}/{file_name} > {md5_file}")
             return True
     else:
-        os.system(f"md5sum {input_file_path}/{file_name} > {input_file_path}/.{prefix}.md5.txt")
+        os.system(f"md5sum {input_file_path}/{file_name} > {md5_file}")
         return True
 
 
@@ -363,6 +381,193 @@ def rm_orientation(contig):
     import re
     return re.sub('[+-]$', '', contig)
 
+IUPAC_BASES = {
+    "A": "A", "C": "C", "G": "G", "T": "T",
+    "R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+    "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT",
+}
+IUPAC_COMPLEMENT = str.maketrans("ACGTRYSWKMBDHVN", "TGCAYRSWMKVHDBN")
+
+def enzyme_cut_patterns(enzyme):
+    """
+    Get the recognition patterns and cut offsets of a restriction enzyme
+        on both strands, the enzyme information is taken from `Bio.Restriction`.
+
+    Params:
+    --------
+    enzyme: str
+        Name of restriction enzyme. i.e. HindIII, MboI, Arima
+    
+    Returns:
+    --------
+    list:
+        list of (site, offset, ovhg), the cut position is `offset` 
+        after the first base of site, and the cut on the crick strand is
+        `ovhg` before it.
+
+    Examples:
+    --------
+    >>> enzyme_cut_patterns("HindIII")
+    [('AAGCTT', 1, -4)]
+    >>> enzyme_cut_patterns("Arima")
+    [('GATC', 0, -4), ('GANTC', 1, -3)]
+    """
+    from Bio import Restriction
+
+    if enzyme.lower() == 'arima':
+        enzymes = ['MboI', 'HinfI']
+    elif enzyme.lower() == 'dnpii':
+        enzymes = ['MboI']
+    else:
+        enzymes = [enzyme]
+
+    patterns = []
+    for name in enzymes:
+        try:
+            enz = getattr(Restriction, name)
+            site = enz.site
+        except AttributeError:
+            raise ValueError(f'Unknown enzyme name: {enzyme}')
+        
+        if not enz.cut_once():
+            raise ValueError(f'Enzyme `{enzyme}` that does not cut once is not supported.')
+    
+        patterns.append((site, enz.fst5, enz.ovhg))
+        if not enz.is_palindromic():
+            rc_site = site.translate(IUPAC_COMPLEMENT)[::-1]
+            patterns.append((rc_site, -enz.fst3, enz.ovhg))
+
+    return patterns
+
+def find_cut_sites(seq, patterns, chunksize=2**24):
+    """
+    Find the cut sites of restriction enzyme in a sequence, the positions
+        are same as `Bio.Restriction` search on linear sequence, 
+        which are the 1-based positions of the first base after the cut.
+
+    Params:
+    --------
+    seq: bytes
+        upper case sequence.
+    patterns: list
+        list of (site, offset, ovhg) from `enzyme_cut_patterns`.
+    chunksize: int
+        number of positions to scan at a time.
+    
+    Returns:
+    --------
+    np.ndarray:
+        sorted cut positions.
+
+    Examples:
+    --------
+    >>> find_cut_sites(b"AAGCAAAGCGGGATCGATCA", enzyme_cut_patterns("MboI"))
+    array([12, 16])
+    """
+    arr = np.frombuffer(seq, dtype=np.uint8)
+    length = len(arr)
+    res = []
+    for site, offset, ovhg in patterns:
+        size = len(site)
+        n_pos = length - size + 1
+        if n_pos <= 0:
+            continue
+        
+        codes = []
+        for i, code in enumerate(site):
+            bases = IUPAC_BASES[code]
+            if bases == "ACGT":
+                continue
+            table = np.zeros(256, dtype=bool)
+            table[np.frombuffer(bases.encode(), dtype=np.uint8)] = True
+            codes.append((i, ord(bases) if len(bases) == 1 else table))
+        
+        for start in range(0, n_pos, chunksize):
+            end = min(start + chunksize, n_pos)
+            mask = np.ones(end - start, dtype=bool)
+            for i, code in codes:
+                window = arr[start + i: end + i]
+                if isinstance(code, int):
+                    mask &= window == code
+                else:
+                    mask &= code[window]
+
+            cuts = np.flatnonzero(mask) + (start + 1 + offset)
+            cuts = cuts[(cuts > 1) & (cuts <= length) 
+                        & (cuts - ovhg > 1) & (cuts - ovhg <= length)]
+            res.append(cuts)
+
+    if not res:
+        return np.array([], dtype=np.int64)
+    
+    return np.unique(np.concatenate(res))
+
+def iter_fasta_bytes(fasta, chunksize=2**24):
+    """
+    Iterate the records of a fasta file without parsing into `Seq`. 
+
+    Params:
+    --------
+    fasta: str
+        Path of fasta file, also support gzip file.
+    chunksize: int
+        bytes to read at a time.
+    
+    Returns:
+    --------
+    generator:
+        (seq_id, seq), seq is upper case bytes without line breaks.
+    
+    Examples:
+    --------
+    >>> for contig, seq in iter_fasta_bytes("sample.fasta"):
+    ...     print(contig, len(seq))
+    ctg1 1000
+    """
+    import gzip
+
+    table = bytes.maketrans(b"acgtnryswkmbdhv", b"ACGTNRYSWKMBDHV")
+    open_func = gzip.open if Path(fasta).suffix == ".gz" else open 
+
+    def _record(header, parts):
+        return (header.split()[0].decode(), 
+                b"".join(parts).translate(table, b"\r\n\t "))
+
+    header = None
+    parts = []
+    buf = b""
+    with open_func(fasta, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunksize), b""):
+            buf += chunk
+            pos = 0
+            while True:
+                idx = buf.find(b">", pos)
+                if idx == -1:
+                    parts.append(buf[pos:])
+                    buf = b""
+                    break
+                
+                parts.append(buf[pos: idx])
+                eol = buf.find(b"\n", idx)
+                if eol == -1:
+                    buf = buf[idx:]
+                    break
+                
+                if header is not None:
+                    yield _record(header, parts)
+                
+                header = buf[idx + 1: eol]
+                parts = []
+                pos = eol + 1
+
+    if buf:
+        if header is not None:
+            yield _record(header, parts)
+        header, parts = buf[1:], []
+    
+    if header is not None:
+        yield _record(header, parts)
+
 def digest(fasta_records, enzyme):
     """
     Divide a genome into restriction fragments. 
@@ -380,46 +585,26 @@ def digest(fasta_records, enzyme):
 
     Examples:
     --------
-    >>> fasta_records = {'Chr1': 'AAGCAAAGCGGGATCGATC', 
-                        'Chr2': 'AAGCTTGATCGATC'}
+    >>> fasta_records = {'Chr1': 'AAGCAAAGCGGGATCGATCA', 
+                        'Chr2': 'AAGCTTGATCGATCA'}
     >>> digest(fasta_records, "MboI")
       chrom  start  end
     0  Chr1      0   13
     1  Chr1     13   17
-    2  Chr1     17   19
+    2  Chr1     17   20
     3  Chr2      0    8
     4  Chr2      8   12
-    5  Chr2     12   14
+    5  Chr2     12   15
     """
-    from Bio import Restriction, Seq
-
+    patterns = enzyme_cut_patterns(enzyme)
 
-    chroms = fasta_records.keys()
-    try:
-        if enzyme.lower() == 'arima':
-            cut_finder = (
-                Restriction.RestrictionBatch(['MboI', 'HinfI'])
-                .search
-                )
-        else:
-            cut_finder = getattr(Restriction, enzyme).search
-    
-    except AttributeError:
-        raise ValueError(f'Unknown enzyme name: {enzyme}')
-    
     def _each(chrom):
-        seq = Seq.Seq(str(fasta_records[chrom]))
-        cut_res = cut_finder(seq)
-        if isinstance(cut_res, list):
-            cut_sites = cut_res
-        elif isinstance(cut_res, dict):
-            cut_sites = []
-            for enzyme in cut_res:
-                cut_sites.extend(cut_sites[enzyme])
-            
-            cut_sites.sort()
+        seq = fasta_records[chrom]
+        if not isinstance(seq, bytes):
+            seq = str(seq).upper().encode()
+        cut_sites = find_cut_sites(seq, patterns)
 
-        cuts = np.r_[0, np.array(cut_sites) + 1, len(seq)].astype(int)
+        cuts = np.r_[0, cut_sites + 1, len(seq)].astype(int)
         n_frags = len(cuts) - 1
         
         fragments = pd.DataFrame(
@@ -431,7 +616,8 @@ def digest(fasta_records, enzyme):
 
         return fragments
 
-    fragments_res_df = pd.concat(map(_each, chroms), axis=0, ignore_index=True)
+    fragments_res_df = pd.concat(map(_each, fasta_records.keys()), 
+                                 axis=0, ignore_index=True)
     
     return fragments_res_df
 
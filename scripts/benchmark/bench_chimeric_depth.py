@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the cis depth of `cphasing chimeric`, the per-span loop
+    over a collected pairs dataframe against the chunked difference-array
+    kernel of `calculate_depth_pqs`, and check that the depth is identical.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+
+import numpy as np
+
+from cphasing.chimeric import calculate_depth_pqs, import_pairs_pqs
+
+
+def loop_depth(pairs_df, contigsizes, window_size):
+    """
+    the depth computed by `data[pos1: pos2 + 1] += 1` for each pair
+    """
+    depth_dict = {}
+    for contig, tmp_df in pairs_df.groupby('chrom1', observed=True):
+        data = np.zeros(contigsizes[contig] // window_size, dtype=np.int32)
+        for pos1, pos2 in tmp_df[['pos1', 'pos2']].values:
+            data[pos1: pos2 + 1] += 1
+        depth_dict[contig] = data
+
+    return depth_dict
+
+
+def diff_array_run(pqs, window_size, min_mapq, threads):
+    start = time.perf_counter()
+    depth_dict, _ = calculate_depth_pqs(pqs, window_size=window_size,
+                                        min_mapq=min_mapq, threads=threads)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return elapsed, peak, depth_dict
+
+
+def loop_run(pqs, window_size, min_mapq, threads):
+    start = time.perf_counter()
+    pairs_df, contigsizes = import_pairs_pqs(pqs, window_size=window_size,
+                                             min_mapq=min_mapq, threads=threads)
+    depth_dict = loop_depth(pairs_df, contigsizes, window_size)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return elapsed, peak, depth_dict
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pReq = p.add_argument_group('Required arguments')
+    pOpt = p.add_argument_group('Optional arguments')
+    pReq.add_argument('pqs',
+            help='input pairs in `.pqs` format')
+    pOpt.add_argument('-w', '--window-size', type=int, default=500,
+            help='window size [default: %(default)s]')
+    pOpt.add_argument('-q', '--min-mapq', type=int, default=0,
+            help='minimum mapping quality [default: %(default)s]')
+    pOpt.add_argument('--skip-loop', action='store_true', default=False,
+            help='only run the difference-array kernel')
+    pOpt.add_argument('-t', '--threads', type=int, default=4,
+            help='number of threads [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    print("method\ttime(s)\tpeak_rss(MB)\tcontigs\ttotal_depth")
+    run_args = (args.pqs, args.window_size, args.min_mapq, args.threads)
+    # fresh processes, the peak rss of each method is not shadowed by the others
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        elapsed, peak, depth_dict = pool.apply(diff_array_run, run_args)
+        total = sum(int(data.sum()) for data in depth_dict.values())
+        print(f"diff-array\t{elapsed:.2f}\t{peak:.0f}\t{len(depth_dict)}\t{total}")
+
+        if args.skip_loop:
+            return
+
+        elapsed, peak, loop_dict = pool.apply(loop_run, run_args)
+        total = sum(int(data.sum()) for data in loop_dict.values())
+        print(f"loop\t{elapsed:.2f}\t{peak:.0f}\t{len(loop_dict)}\t{total}")
+
+    assert loop_dict.keys() == depth_dict.keys()
+    assert all(np.array_equal(loop_dict[contig], depth_dict[contig])
+                    for contig in depth_dict)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the cold startup of `cphasing --help` in a new interpreter 
+    with `python -X importtime -m cphasing`, the wall time covers the imports, 
+    the setup of commands and the rendering of help, and exit with error 
+    when it exceeds the budget or the heavy libraries, which should be 
+    imported only inside the subcommands, are pulled in.
+"""
+
+import argparse
+import shlex
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+HEAVY_MODULES = ["numpy", "pandas", "polars", "pyarrow", "scipy",
+                 "cooler", "h5py", "Bio", "pyranges", "pandarallel",
+                 "joblib", "igraph", "matplotlib", "psutil"]
+
+
+def startup(cli_args="--help"):
+    """
+    run the cli in a new interpreter
+
+    Returns:
+    --------
+    float:
+        wall time in seconds
+    dict:
+        module -> (self, cumulative) import time in seconds
+    """
+    start = time.perf_counter()
+    res = subprocess.run([sys.executable, "-X", "importtime", "-m", "cphasing", 
+                          *shlex.split(cli_args)],
+                         stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                         text=True)
+    elapsed = time.perf_counter() - start
+    
+    db = {}
+    errors = []
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        if "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        db[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    
+    if res.returncode != 0:
+        raise RuntimeError(f"`cphasing {cli_args}` failed:\n" + "\n".join(errors[-10:]))
+
+    return elapsed, db
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-a', '--cli-args', default="--help",
+            help='arguments of cphasing [default: %(default)s]')
+    pOpt.add_argument('-b', '--budget', type=float, default=0.8,
+            help='budget of median wall time in seconds [default: %(default)s]')
+    pOpt.add_argument('-r', '--repeat', type=int, default=5,
+            help='number of runs [default: %(default)s]')
+    pOpt.add_argument('-n', '--top', type=int, default=10,
+            help='show the top n slowest imports [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+
+    ## the first run compiles the bytecode
+    startup(args.cli_args)
+    runs = [startup(args.cli_args) for _ in range(args.repeat)]
+    elapsed = np.median([run[0] for run in runs])
+    db = runs[-1][1]
+
+    print("module\tself(s)\tcumulative(s)")
+    for name, (self_time, cumulative) in sorted(db.items(),
+                                                key=lambda x: x[1][0],
+                                                reverse=True)[:args.top]:
+        print(f"{name}\t{self_time:.4f}\t{cumulative:.4f}")
+
+    heavy = [name for name in HEAVY_MODULES if name in db]
+    print(f"\ncphasing {args.cli_args}: {elapsed:.3f}s (budget: {args.budget:.3f}s)")
+
+    failed = False
+    if heavy:
+        print(f"heavy modules imported: {', '.join(heavy)}")
+        failed = True
+    if elapsed > args.budget:
+        print("startup time exceeds the budget.")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
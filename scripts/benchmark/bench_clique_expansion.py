@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the clique expansions of a random hypergraph in the order of
+    `HyperPartition` (first round, kprune contacts, merge and sub-groups),
+    recomputed by scipy sparse matmul against `CliqueExpansionCache`
+    in memory and on disk, and check that the expansions are identical.
+"""
+
+import argparse
+import logging
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from cphasing.algorithms.hypergraph import (
+    HyperGraph,
+    CliqueExpansionCache,
+    extract_incidence_matrix2
+)
+
+
+def random_hypergraph(contigs, groups, edges, cross_rate, seed=12345):
+    """
+    random incidence matrix, hyperedges with 2-5 vertices lie in one group
+        except a fraction of `cross_rate` that has a vertex from anywhere.
+    """
+    rng = np.random.default_rng(seed)
+    per = contigs // groups
+    orders = rng.integers(2, 6, edges)
+    col = np.repeat(np.arange(edges), orders)
+    row = (rng.integers(0, per, len(col))
+            + np.repeat(rng.integers(0, groups, edges), orders) * per)
+    cross = np.flatnonzero(rng.random(edges) < cross_rate)
+    row[np.r_[0, np.cumsum(orders)[:-1]][cross]] = rng.integers(0, per * groups, len(cross))
+
+    H = csr_matrix((np.ones(len(row), dtype=np.int8), (row, col)),
+                    shape=(per * groups, edges))
+    H.data[:] = 1
+    H = H[:, np.asarray(H.sum(axis=0)).ravel() > 1]
+    vertices = np.array([f"ctg{i}" for i in range(H.shape[0])])
+
+    return H, vertices, per
+
+
+def run(H, vertices, per, groups, cache=None):
+    """
+    the expansions of first round (x3) and every sub-group (x2)
+    """
+    res = []
+    for _ in range(3):
+        if cache is None:
+            A = HyperGraph.clique_expansion(H)
+        else:
+            A = cache.get(H, vertices)
+        res.append(A)
+
+    for g in range(groups):
+        idx = np.arange(g * per, (g + 1) * per)
+        for _ in range(2):
+            if cache is None:
+                sub_H, _, _ = extract_incidence_matrix2(H, idx)
+                A = HyperGraph.clique_expansion(sub_H)
+            else:
+                sub_H = cache.subset(H, idx, vertices)
+                A = cache.get(sub_H, vertices[idx])
+            res.append(A)
+
+    return res
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-n', '--contigs', type=int, default=8000,
+            help='number of contigs [default: %(default)s]')
+    pOpt.add_argument('-g', '--groups', type=int, default=8,
+            help='number of groups [default: %(default)s]')
+    pOpt.add_argument('-e', '--edges', type=int, default=2000000,
+            help='number of hyperedges [default: %(default)s]')
+    pOpt.add_argument('-c', '--cross-rate', type=float, default=0.0,
+            help='rate of hyperedges crossing groups, sub-groups are '
+                 'only sliced when it is 0 [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    H, vertices, per = random_hypergraph(args.contigs, args.groups,
+                                         args.edges, args.cross_rate)
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_clique_expansion_", dir="./")
+    try:
+        print("method\ttime(s)\tpeak_rss(MB)")
+        res = {}
+        for name, cache in [("matmul", None),
+                            ("memory", CliqueExpansionCache(maxsize=args.groups + 1)),
+                            ("disk_first", CliqueExpansionCache(tmpdir)),
+                            ("disk_rerun", CliqueExpansionCache(tmpdir))]:
+            start = time.perf_counter()
+            res[name] = run(H, vertices, per, args.groups, cache)
+            elapsed = time.perf_counter() - start
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{name}\t{elapsed:.2f}\t{peak:.0f}")
+
+        for name in res:
+            for A, B in zip(res["matmul"], res[name]):
+                assert (A != B).nnz == 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the line-by-line parsing of clm into dicts of `ClmLine` against
+    the columnar cache of `Clm`, which is built at the first load
+    and reused while the md5 of clm is unchanged.
+"""
+
+import argparse
+import logging
+import resource
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from cphasing.core import Clm, ClmLine
+from cphasing.utilities import xopen
+
+
+def parse_lines(clmfile):
+    """
+    the dict of contig pair -> dk list and the count db parsed from `ClmLine`
+    """
+    data = {}
+    count_db = {}
+    with xopen(clmfile, 'r') as fp:
+        for line in fp:
+            cl = ClmLine(line)
+            pair = (cl.ctg1, cl.ctg2)
+            data.setdefault(pair, []).append(cl.dk)
+            count_db.setdefault(pair, cl.count)
+
+    return data, count_db
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pReq = p.add_argument_group('Required arguments')
+    pOpt = p.add_argument_group('Optional arguments')
+    pReq.add_argument('clm',
+            help='input clm, text, gzipped text or binary clm')
+    pOpt.add_argument('--skip-lines', action='store_true', default=False,
+            help='only run the columnar cache')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    print("method\ttime(s)\tpeak_rss(MB)\tpairs")
+
+    clm = Clm.__new__(Clm)
+    clm.file = args.clm
+    if clm.cache_dir.exists():
+        shutil.rmtree(clm.cache_dir)
+
+    for method in ("cache-build", "cache-load"):
+        start = time.perf_counter()
+        clm = Clm(args.clm)
+        count_db = clm.count_db()
+        dk_df = clm.dk_df
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{method}\t{elapsed:.2f}\t{peak:.0f}\t{len(count_db)}")
+
+    if args.skip_lines:
+        return
+
+    start = time.perf_counter()
+    data, line_count_db = parse_lines(args.clm)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"lines\t{elapsed:.2f}\t{peak:.0f}\t{len(line_count_db)}")
+
+    assert line_count_db == count_db
+    assert all(np.allclose(data[pair], values)
+                for pair, values in zip(dk_df.index, dk_df.values))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the LIS correction of `hitig correct-alignments` on random
+    windowed UL-ONT alignments, the nested dicts loaded line by line
+    with a joblib task per read against the polars table with
+    a block of reads per task, and check that the outputs are identical.
+"""
+
+import argparse
+import filecmp
+import logging
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from joblib import Parallel, delayed
+
+from cphasing.utilities import xopen
+from cphasing.hitig.correct_alignments import (
+    calculate_LMP_pipeline,
+    checkLIS,
+    outputLIS,
+    select_mapq,
+    workflow
+)
+
+
+def random_paf(paf, reads, contigs, contig_length, win, seed=12345):
+    """
+    random windows of reads, each window has an alignment on the segment of
+        its read and 0-4 secondary alignments, a fraction of reads are chimeric.
+    """
+    rng = np.random.default_rng(seed)
+    with open(paf, 'w') as out:
+        for r in range(reads):
+            n = int(rng.integers(3, 30))
+            segments = [(int(rng.integers(0, contigs)), rng.choice(['+', '-']),
+                         int(rng.integers(0, contig_length - n * win)))]
+            if rng.random() < 0.1:
+                segments.append((int(rng.integers(0, contigs)), rng.choice(['+', '-']),
+                                 int(rng.integers(0, contig_length - n * win))))
+            for qi in range(n):
+                if rng.random() < 0.1:
+                    continue
+                tn, s, start = segments[qi * len(segments) // n]
+                ts = start + (qi if s == '+' else n - 1 - qi) * win + int(rng.integers(-50, 50))
+                AS = int(rng.integers(1500, 9000))
+                mapq = 60 if rng.random() < 0.7 else int(rng.integers(0, 10))
+                alns = [(tn, s, max(ts, 0), AS, mapq)]
+                for _ in range(int(rng.integers(0, 5))):
+                    alns.append((int(rng.integers(0, contigs)), rng.choice(['+', '-']),
+                                 int(rng.integers(0, contig_length - win)),
+                                 AS if rng.random() < 0.1 else int(rng.integers(1000, AS + 1)), 0))
+                for tn, s, ts, AS, mapq in alns:
+                    al = win + int(rng.integers(-100, 100))
+                    out.write(f"read{r}_{qi}\t{win}\t0\t{win}\t{s}\tctg{tn}\t{contig_length}\t"
+                              f"{ts}\t{ts + al}\t{al - 200}\t{al}\t{mapq}\tNM:i:200\t"
+                              f"ms:i:{AS}\tAS:i:{AS}\tnn:i:0\ttp:A:P\tcg:Z:{al}M\n")
+
+
+def dict_read_paf(paf, minAS, nhap):
+    """
+    nested dicts of alignments by splitting the lines
+    """
+    pafDic = {}
+    minAS = int(minAS)
+    maxAlign = int(nhap)
+    with xopen(paf, 'r') as fin:
+        for line in fin:
+            tmpLst = line.split("\t")
+            if len(tmpLst) < 15:
+                continue
+            qn, ql, qs, qe, s, tn, tl, ts, te, al1, al2, mapq, NM, ms, AS = tmpLst[:15]
+            if not qn:
+                continue
+            qi = int(qn.split("_")[-1])
+            originQn = "_".join(qn.split("_")[:-1])
+            NM, AS = list(map(lambda x: int(x.split(":")[-1]), [NM, AS]))
+            if AS < minAS:
+                continue
+            if originQn not in pafDic:
+                pafDic[originQn] = {}
+            if qi not in pafDic[originQn]:
+                pafDic[originQn][qi] = []
+            pafDic[originQn][qi].append([int(qs), int(qe), s, tn, int(ts), int(te), int(ql), int(tl),
+                                         int(al1), int(al2), int(mapq), int(AS)])
+
+    for qn in pafDic:
+        qnDic = pafDic[qn]
+        for qi in qnDic:
+            totalReadsLst = qnDic[qi]
+            totalReadsLst.sort(key=lambda x: x[-1], reverse=True)
+            qnDic[qi] = totalReadsLst[:maxAlign + 1]
+
+    return pafDic
+
+
+def dict_workflow(paf, outPre, win, nhap, minAS, minMapq, threads):
+    """
+    a joblib task per read on the nested dicts
+    """
+    pafDic = dict_read_paf(paf, minAS, nhap)
+    bestASpafDic, mapqPafDic = select_mapq(pafDic, minMapq)
+    AllmergedLIS = Parallel(n_jobs=min(threads, 12))(
+                    delayed(calculate_LMP_pipeline)(bestASpafDic[qn], pafDic[qn],
+                                                    mapqPafDic.get(qn, {}), win, qn)
+                        for qn in pafDic)
+    corLISDic = checkLIS(dict(AllmergedLIS), pafDic)
+    outputLIS(corLISDic, pafDic, outPre)
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-n', '--reads', type=int, default=100000,
+            help='number of reads [default: %(default)s]')
+    pOpt.add_argument('-c', '--contigs', type=int, default=100,
+            help='number of contigs [default: %(default)s]')
+    pOpt.add_argument('-l', '--contig-length', type=int, default=5000000,
+            help='length of contigs [default: %(default)s]')
+    pOpt.add_argument('-w', '--window', type=int, default=5000,
+            help='window size [default: %(default)s]')
+    pOpt.add_argument('-t', '--threads', type=int, default=4,
+            help='number of threads [default: %(default)s]')
+    pOpt.add_argument('--skip-dict', action='store_true', default=False,
+            help='only run the blocks of polars table')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_correct_alignments_", dir="./")
+    try:
+        random_paf(f"{tmpdir}/table.paf", args.reads, args.contigs,
+                   args.contig_length, args.window)
+
+        print("method\tthreads\ttime(s)\tpeak_rss(MB)")
+        start = time.perf_counter()
+        workflow(None, None, args.threads, f"{tmpdir}/table", args.window, 10, 4, 2000, 2)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"table\t{args.threads}\t{elapsed:.2f}\t{peak:.0f}")
+
+        if args.skip_dict:
+            return
+
+        start = time.perf_counter()
+        dict_workflow(f"{tmpdir}/table.paf", f"{tmpdir}/dict", args.window, 4, 2000, 2, args.threads)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"dict\t{args.threads}\t{elapsed:.2f}\t{peak:.0f}")
+
+        for suffix in ["LIS.gtf", "corrected.paf", "mapq.LIS.gtf", "mapq.corrected.paf"]:
+            assert filecmp.cmp(f"{tmpdir}/table.{suffix}", f"{tmpdir}/dict.{suffix}", shallow=False)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the RE counting of a genome, the `Bio.Restriction` search on
+    records loaded by `read_fasta` against the streaming byte scanner of
+    `count_re_in_genome`, and check that the counts are identical.
+"""
+
+import argparse
+import logging
+import resource
+import sys
+import time
+
+from cphasing.prepare import count_re_in_genome
+from cphasing.utilities import read_fasta
+
+
+def bio_count_re(fasta, enzyme):
+    """
+    the fragment counts of each contig from `Bio.Restriction` search
+    """
+    from Bio import Restriction
+
+    if enzyme.lower() == 'arima':
+        enzymes = [Restriction.MboI, Restriction.HinfI]
+    else:
+        enzymes = [getattr(Restriction, enzyme)]
+
+    res = []
+    for contig, seq in read_fasta(fasta).items():
+        cut_sites = set()
+        for enz in enzymes:
+            cut_sites.update(enz.search(seq))
+        res.append((contig, len(cut_sites) + 1, len(seq)))
+
+    return res
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pReq = p.add_argument_group('Required arguments')
+    pOpt = p.add_argument_group('Optional arguments')
+    pReq.add_argument('fasta',
+            help='input fasta, also support gzip file')
+    pOpt.add_argument('-e', '--enzyme', default="MboI",
+            help='restriction enzyme [default: %(default)s]')
+    pOpt.add_argument('--skip-bio', action='store_true', default=False,
+            help='only run the byte scanner')
+    pOpt.add_argument('-t', '--threads', type=int, default=4,
+            help='number of threads [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    print("method\ttime(s)\tpeak_rss(MB)\tcontigs\ttotal_counts")
+
+    start = time.perf_counter()
+    res_df = count_re_in_genome(args.fasta, args.enzyme, threads=args.threads)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"scanner\t{elapsed:.2f}\t{peak:.0f}\t{len(res_df)}\t{res_df['RECounts'].sum()}")
+
+    if args.skip_bio:
+        return
+
+    start = time.perf_counter()
+    res = bio_count_re(args.fasta, args.enzyme)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"bio\t{elapsed:.2f}\t{peak:.0f}\t{len(res)}\t{sum(i[1] for i in res)}")
+
+    assert res == list(res_df.itertuples(index=False, name=None))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the memory of the second round of `HyperPartition.incremental_partition`
+    on a random hypergraph as `--threads` grows, each run in a new process,
+    the proportional set size (PSS) of the process and its workers is sampled,
+    so that the pages of the memory-mapped incidence matrix are counted once.
+    The PSS of the workers is also reported, the first round and 
+    a single thread run in the main process.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+
+from cphasing.algorithms.hypergraph import HyperEdges
+from cphasing.hyperpartition import HyperPartition
+
+
+def random_hyperedges(contigs, groups, edges, cross_rate, seed=12345):
+    """
+    random hyperedges with 2-5 contigs lie in one group, except a fraction
+        of `cross_rate` that has a contig from anywhere.
+    """
+    rng = np.random.default_rng(seed)
+    per = contigs // groups
+    orders = rng.integers(2, 6, edges)
+    col = np.repeat(np.arange(edges), orders)
+    row = (rng.integers(0, per, len(col))
+            + np.repeat(rng.integers(0, groups, edges), orders) * per)
+    cross = np.flatnonzero(rng.random(edges) < cross_rate)
+    row[np.r_[0, np.cumsum(orders)[:-1]][cross]] = rng.integers(0, per * groups, len(cross))
+    mapq = rng.integers(1, 61, len(row))
+
+    contigs = [f"ctg{i}" for i in range(per * groups)]
+    sizes = dict(zip(contigs, rng.integers(20000, 200000, len(contigs)).tolist()))
+    he = HyperEdges(idx=dict(zip(contigs, range(len(contigs)))),
+                    row=row, col=col, mapq=mapq, contigsizes=sizes)
+    he.to_numpy()
+    contigsizes = pd.DataFrame({'length': sizes})
+    contigsizes.index.name = 'chrom'
+
+    return he, contigsizes
+
+
+def pss(pid):
+    """
+    PSS (MB) of the process and of its children
+    """
+    process = psutil.Process(pid)
+    res = [process.memory_full_info().pss, 0]
+    for p in process.children(recursive=True):
+        try:
+            res[1] += p.memory_full_info().pss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+
+    return res[0] / 1024 / 1024, res[1] / 1024 / 1024
+
+
+def run(args, threads, workdir):
+    """
+    partition and return the time, peak PSS of all processes,
+        peak PSS of the workers and the number of groups
+    """
+    logging.disable(logging.CRITICAL)
+    he, contigsizes = random_hyperedges(args.contigs, args.groups,
+                                        args.edges, args.cross_rate)
+    os.chdir(workdir)
+    hp = HyperPartition(he, contigsizes, k=[args.groups, 2],
+                        resolution1=1.0, resolution2=1.0,
+                        min_length=0, threads=threads)
+
+    peak = [0, 0]
+    done = threading.Event()
+    def sample():
+        while not done.wait(0.05):
+            main, workers = pss(os.getpid())
+            peak[0] = max(peak[0], main + workers)
+            peak[1] = max(peak[1], workers)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    start = time.perf_counter()
+    try:
+        hp.incremental_partition([args.groups, 2])
+    finally:
+        elapsed = time.perf_counter() - start
+        done.set()
+        sampler.join()
+
+    return elapsed, peak[0], peak[1], len(hp.K)
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-n', '--contigs', type=int, default=8000,
+            help='number of contigs [default: %(default)s]')
+    pOpt.add_argument('-g', '--groups', type=int, default=8,
+            help='number of first-round groups [default: %(default)s]')
+    pOpt.add_argument('-e', '--edges', type=int, default=2000000,
+            help='number of hyperedges [default: %(default)s]')
+    pOpt.add_argument('-c', '--cross-rate', type=float, default=0.01,
+            help='rate of hyperedges crossing groups [default: %(default)s]')
+    pOpt.add_argument('-t', '--threads', type=int, nargs="+", default=[1, 2, 4, 8],
+            help='threads of each run [default: %(default)s]')
+    pOpt.add_argument('--run', nargs=2, default=None, help=argparse.SUPPRESS)
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+
+    if args.run:
+        threads, workdir = args.run
+        res = run(args, int(threads), workdir)
+        print("\t".join(map(str, res)))
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_incremental_partition_", dir="./")
+    try:
+        print("threads\ttime(s)\tpeak_pss(MB)\tworkers_peak_pss(MB)\tgroups")
+        for threads in args.threads:
+            workdir = f"{tmpdir}/{threads}"
+            os.mkdir(workdir)
+            ## each run in a new interpreter, joblib runs in a single thread 
+            ## within the daemonic processes of multiprocessing.Pool
+            output = subprocess.run([sys.executable, __file__, 
+                                     "-n", str(args.contigs), "-g", str(args.groups),
+                                     "-e", str(args.edges), "-c", str(args.cross_rate),
+                                     "--run", str(threads), os.path.abspath(workdir)],
+                                    check=True, capture_output=True, text=True).stdout
+            elapsed, peak, workers_peak, groups = map(float, output.split()[-4:])
+            print(f"{threads}\t{elapsed:.2f}\t{peak:.0f}\t{workers_peak:.0f}\t{groups:.0f}")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
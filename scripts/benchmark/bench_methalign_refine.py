@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark `methalign refine` on a random name-grouped bam, the serial
+    `parse_bam` against the read-name-consistent shards processed by
+    a pool, and check that the refined alignments are identical.
+"""
+
+import argparse
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pysam
+
+from array import array
+
+from cphasing.methalign.filter_bam_methyl import ReferenceMethylation, parse_bam
+
+
+def random_bam(bam, reads, contigs, contig_length, seed=12345):
+    """
+    random reads with MM/ML tags on the primary alignments, each followed
+        by 0-3 secondary alignments on random contigs.
+    """
+    rng = np.random.default_rng(seed)
+    fa_dict = {f"ctg{i}": "".join(rng.choice(list("ACGT"), contig_length))
+                    for i in range(contigs)}
+    hifi_methylation_dict = {}
+    for contig, seq in fa_dict.items():
+        sites = np.flatnonzero(np.frombuffer(seq.encode(), dtype=np.uint8) == ord('C'))
+        hifi_methylation_dict[contig] = set(sites[rng.random(len(sites)) < 0.5].tolist())
+
+    header = {"HD": {"VN": "1.6", "SO": "queryname"},
+              "SQ": [{"SN": contig, "LN": contig_length} for contig in fa_dict]}
+    names = list(fa_dict)
+    with pysam.AlignmentFile(bam, "wb", header=header) as out:
+        for r in range(reads):
+            read_length = int(rng.integers(2000, 20000))
+            contig = int(rng.integers(0, contigs))
+            start = int(rng.integers(0, contig_length - read_length))
+            seq = fa_dict[names[contig]][start: start + read_length]
+            c_count = seq.count('C')
+            sites = np.sort(rng.choice(c_count, c_count // 2, replace=False))
+            skips = np.diff(np.r_[-1, sites]) - 1
+            for n in range(int(rng.integers(1, 5))):
+                aln = pysam.AlignedSegment(out.header)
+                aln.query_name = f"read{r:07d}"
+                aln.flag = 0 if n == 0 else 256
+                aln.reference_id = contig if n == 0 else int(rng.integers(0, contigs))
+                aln.reference_start = start if n == 0 else int(
+                                rng.integers(0, contig_length - read_length))
+                aln.mapping_quality = 60 if n == 0 else 0
+                aln.cigartuples = [(0, read_length)]
+                if n == 0:
+                    aln.query_sequence = seq
+                    aln.set_tag("MM", "C+m?," + ",".join(map(str, skips)) + ";")
+                    aln.set_tag("ML", array('B', rng.integers(0, 256, len(sites)).tolist()))
+                aln.set_tag("AS", int(rng.integers(read_length // 2, read_length)))
+                aln.set_tag("NM", int(rng.integers(0, 100)))
+                out.write(aln)
+
+    return fa_dict, hifi_methylation_dict
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-n', '--reads', type=int, default=2000,
+            help='number of reads [default: %(default)s]')
+    pOpt.add_argument('-c', '--contigs', type=int, default=10,
+            help='number of contigs [default: %(default)s]')
+    pOpt.add_argument('-l', '--contig-length', type=int, default=1000000,
+            help='length of contigs [default: %(default)s]')
+    pOpt.add_argument('-p', '--processes', type=int, nargs="+", default=[1, 4, 8],
+            help='number of processes [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    workdir = os.getcwd()
+    tmpdir = tempfile.mkdtemp(prefix="bench_methalign_refine_", dir="./")
+    try:
+        os.chdir(tmpdir)
+        fa_dict, hifi_methylation_dict = random_bam("in.bam", args.reads,
+                                                    args.contigs, args.contig_length)
+        ref_methylation = ReferenceMethylation(fa_dict, hifi_methylation_dict)
+
+        print("method\tprocesses\ttime(s)\tpeak_rss(MB)")
+        res = {}
+        for processes in args.processes:
+            start = time.perf_counter()
+            out_bam = parse_bam("in.bam", ref_methylation, 2, 128, 60, False, 1, processes)
+            elapsed = time.perf_counter() - start
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{'serial' if processes == 1 else 'shards'}\t{processes}\t{elapsed:.2f}\t{peak:.0f}")
+
+            with pysam.AlignmentFile(out_bam, "rb", check_sq=False) as fin:
+                res[processes] = [aln.to_string() for aln in fin]
+            os.remove(out_bam)
+
+        ref = res[args.processes[0]]
+        for processes in args.processes:
+            assert res[processes] == ref
+    finally:
+        os.chdir(workdir)
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
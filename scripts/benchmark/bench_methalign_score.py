@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the inconsistent 5mC counting of `methalign refine` on random
+    ultra-long alignments, the base-by-base walk of `get_aligned_pairs`
+    against the masked comparisons of `count_inconsistent_5mC`,
+    and check that the counts are identical.
+"""
+
+import argparse
+import collections
+import random
+import resource
+import sys
+import time
+
+import numpy as np
+import pysam
+
+from array import array
+
+from cphasing.methalign.filter_bam_methyl import (
+    ReferenceMethylation,
+    count_inconsistent_5mC,
+    get_5mc_sites_from_read
+)
+
+
+def pairs_inconsistent_5mC(aln, fa_seq, hifi_methylation_set, read_seq, c_index, methylated):
+    """
+    walk the aligned pairs base by base
+    """
+    inconsistent_5mC = 0
+    ont_pos_index = {pos: n for n, pos in enumerate(c_index)}
+    for read_aln_pos, ref_aln_pos in aln.get_aligned_pairs():
+        if not aln.is_forward and read_aln_pos is not None:
+            read_aln_pos = aln.infer_query_length() - (read_aln_pos + 1)
+        if read_aln_pos not in ont_pos_index:
+            continue
+        is_methylated = methylated[ont_pos_index[read_aln_pos]]
+        if aln.is_forward:
+            if ref_aln_pos is None or fa_seq[ref_aln_pos] != 'C':
+                continue
+            site = ref_aln_pos
+        else:
+            if ref_aln_pos is None or fa_seq[ref_aln_pos] != 'G':
+                continue
+            site = ref_aln_pos - 1
+        if (site in hifi_methylation_set) != bool(is_methylated):
+            inconsistent_5mC += 1
+
+    return inconsistent_5mC
+
+
+def random_alignments(n, read_length, ref_length, seed=12345):
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    fa_dict = {"ctg1": "".join(rng.choice(list("ACGT"), ref_length))}
+    hifi_methylation_dict = collections.defaultdict(set)
+    hifi_methylation_dict["ctg1"] = set(np.flatnonzero(
+                    (np.frombuffer(fa_dict["ctg1"].encode(), dtype=np.uint8) == ord('C'))
+                    & (rng.random(ref_length) < 0.5)).tolist())
+    header = pysam.AlignmentHeader.from_dict({"SQ": [{"SN": "ctg1", "LN": ref_length}]})
+
+    res = []
+    for i in range(n):
+        read_seq = "".join(rng.choice(list("ACGT"), read_length))
+        c_count = read_seq.count('C')
+        sites = np.sort(rng.choice(c_count, c_count // 2, replace=False))
+        skips = np.diff(np.r_[-1, sites]) - 1
+        mm_tag = "C+m?," + ",".join(map(str, skips)) + ";"
+        ml_tag = array('B', rng.integers(0, 256, len(sites)).tolist())
+
+        aln = pysam.AlignedSegment(header)
+        aln.query_name = f"read{i}"
+        aln.reference_id = 0
+        aln.flag = random.choice([0, 16, 256, 272])
+        block = read_length // 4
+        aln.cigartuples = [(4, 100), (0, block), (1, 10), (0, block),
+                           (2, 20), (0, block), (0, read_length - 3 * block - 110), (4, 100)]
+        aln.reference_start = int(rng.integers(0, ref_length - read_length))
+        res.append((aln, read_seq, mm_tag, ml_tag))
+
+    return fa_dict, hifi_methylation_dict, res
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-n', '--alignments', type=int, default=50,
+            help='number of alignments [default: %(default)s]')
+    pOpt.add_argument('-l', '--read-length', type=int, default=100000,
+            help='length of reads [default: %(default)s]')
+    pOpt.add_argument('-r', '--ref-length', type=int, default=2000000,
+            help='length of reference [default: %(default)s]')
+    pOpt.add_argument('--prob-cutoff', type=int, default=128,
+            help='probability cutoff of 5mC [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+
+    fa_dict, hifi_methylation_dict, alns = random_alignments(
+                    args.alignments, args.read_length, args.ref_length)
+
+    print("method\talignments\ttime(s)\tpeak_rss(MB)")
+    start = time.perf_counter()
+    ref_methylation = ReferenceMethylation(fa_dict, hifi_methylation_dict)
+    vectorized = []
+    for aln, read_seq, mm_tag, ml_tag in alns:
+        ont_c_mask, ont_methylation_mask = get_5mc_sites_from_read(
+                    aln.query_name, read_seq, mm_tag, ml_tag, args.prob_cutoff)
+        vectorized.append(count_inconsistent_5mC(aln, ref_methylation["ctg1"],
+                                                 ont_c_mask, ont_methylation_mask))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"vectorized\t{len(alns)}\t{elapsed:.2f}\t{peak:.0f}")
+
+    start = time.perf_counter()
+    pairs = []
+    for aln, read_seq, mm_tag, ml_tag in alns:
+        c_index = [n for n, base in enumerate(read_seq) if base == 'C']
+        methylated = [0] * len(c_index)
+        index_sum = 0
+        for n, shift in enumerate(map(int, mm_tag.rstrip(';').split(',')[1:])):
+            index_sum += shift
+            if ml_tag[n] >= args.prob_cutoff:
+                methylated[n + index_sum] = 1
+        pairs.append(pairs_inconsistent_5mC(aln, fa_dict["ctg1"],
+                                            hifi_methylation_dict["ctg1"],
+                                            read_seq, c_index, methylated))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"aligned_pairs\t{len(alns)}\t{elapsed:.2f}\t{peak:.0f}")
+
+    assert vectorized == pairs
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
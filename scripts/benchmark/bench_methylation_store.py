@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the loading of reference and HiFi 5mC sites for `methalign refine`,
+    the fasta and bedgraph parsed into str and sets against the binary
+    methylation-site store built once and memory-mapped by later runs,
+    and check that the C/G bases and 5mC sites are identical.
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from cphasing.methalign.filter_bam_methyl import (
+    build_methylation_store,
+    load_reference_methylation,
+    test_base,
+    test_sites
+)
+
+
+def random_reference(fasta, bedgraph, contigs, contig_length, seed=12345):
+    """
+    random contigs, half of the C bases are methylated with a random level.
+    """
+    rng = np.random.default_rng(seed)
+    with open(fasta, 'w') as fa, open(bedgraph, 'w') as bg:
+        for i in range(contigs):
+            seq = rng.choice(np.frombuffer(b"ACGTN", dtype=np.uint8), contig_length,
+                             p=[0.24, 0.24, 0.24, 0.24, 0.04])
+            fa.write(f">ctg{i}\n")
+            for j in range(0, contig_length, 60):
+                fa.write(seq[j: j + 60].tobytes().decode() + "\n")
+            sites = np.flatnonzero(seq == ord('C'))
+            sites = sites[rng.random(len(sites)) < 0.5]
+            levels = rng.integers(0, 101, len(sites))
+            bg.writelines(f"ctg{i}\t{pos}\t{pos + 1}\t{level}\n"
+                          for pos, level in zip(sites.tolist(), levels.tolist()))
+
+
+def probe(fasta, bedgraph, store, contigs, contig_length, queries):
+    """
+    load the reference and test random positions of every contig.
+    """
+    start = time.perf_counter()
+    ref_methylation = load_reference_methylation(fasta, bedgraph, 'bedgraph', store)
+    rng = np.random.default_rng(0)
+    res = []
+    for i in range(contigs):
+        pos = rng.integers(-10, contig_length + 10, queries)
+        packed_seq, length, sites = ref_methylation[f"ctg{i}"]
+        res.append((np.packbits(test_base(packed_seq, length, pos, 'C')),
+                    np.packbits(test_base(packed_seq, length, pos, 'G')),
+                    np.packbits(test_sites(sites, pos))))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return elapsed, peak, res
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-c', '--contigs', type=int, default=20,
+            help='number of contigs [default: %(default)s]')
+    pOpt.add_argument('-l', '--contig-length', type=int, default=5000000,
+            help='length of contigs [default: %(default)s]')
+    pOpt.add_argument('-q', '--queries', type=int, default=1000000,
+            help='number of positions tested in each contig [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_methylation_store_", dir="./")
+    try:
+        fasta, bedgraph = f"{tmpdir}/ref.fa", f"{tmpdir}/hifi.bedgraph"
+        store = f"{tmpdir}/ref.mstore"
+        random_reference(fasta, bedgraph, args.contigs, args.contig_length)
+
+        print("method\ttime(s)\tpeak_rss(MB)")
+        # fresh processes, the peak rss of each method is not shadowed by the others
+        with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+            start = time.perf_counter()
+            pool.apply(build_methylation_store, (fasta, bedgraph, store))
+            elapsed = time.perf_counter() - start
+            print(f"store_build\t{elapsed:.2f}\t-")
+
+            res = {}
+            for name, _store in [("store_load", store), ("parse", None)]:
+                elapsed, peak, res[name] = pool.apply(probe, (fasta, bedgraph, _store,
+                                        args.contigs, args.contig_length, args.queries))
+                print(f"{name}\t{elapsed:.2f}\t{peak:.0f}")
+
+        for a, b in zip(res["store_load"], res["parse"]):
+            for x, y in zip(a, b):
+                assert (x == y).all()
+
+        size = sum(os.path.getsize(f"{store}/{f}") for f in os.listdir(store))
+        print(f"# store size: {size / 1024 ** 2:.0f} MB")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the sliding-window depth of `hitig find-chimeric` on random
+    alignments, the per-window counting of overlapping alignments
+    (`bedtools intersect -f 0.5 -c`) against the difference array of
+    `window_depth`, and check that the depths are identical.
+"""
+
+import argparse
+import logging
+import math
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from cphasing.utilities import read_chrom_sizes
+from cphasing.hitig.find_chimeric.paf2depth import window_depth
+
+
+def random_paf(paf, contigsizes, alignments, contigs, contig_length, seed=12345):
+    """
+    random alignments of 1-100 kb, a fraction are secondary or low mapping quality.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(contig_length // 10, contig_length, contigs)
+    with open(contigsizes, 'w') as out:
+        for i, length in enumerate(lengths):
+            out.write(f"ctg{i}\t{length}\n")
+
+    tn = rng.integers(0, contigs, alignments)
+    al = rng.integers(1000, 100000, alignments)
+    ts = (rng.random(alignments) * np.maximum(lengths[tn] - al, 1)).astype(np.int64)
+    te = np.minimum(ts + al, lengths[tn])
+    mapq = np.where(rng.random(alignments) < 0.8, 60, rng.integers(0, 5, alignments))
+    tp = np.where(rng.random(alignments) < 0.1, 'S', 'P')
+    with open(paf, 'w') as out:
+        for i, (t, s, e, q, p) in enumerate(zip(tn.tolist(), ts.tolist(), te.tolist(),
+                                                 mapq.tolist(), tp.tolist())):
+            out.write(f"read{i}\t{e - s}\t0\t{e - s}\t+\tctg{t}\t{lengths[t]}\t{s}\t{e}\t"
+                      f"{e - s}\t{e - s}\t{q}\tNM:i:0\ttp:A:{p}\n")
+
+
+def window_counting(paf, contigsizes, win, step, min_mapq=2, min_fraction=0.5):
+    """
+    sorted intervals of each contig, count the overlapping intervals of each window
+    """
+    intervals = {}
+    with open(paf) as fp:
+        for line in fp:
+            if 'tp:A:S' in line:
+                continue
+            cols = line.split("\t")
+            if int(cols[11]) < min_mapq:
+                continue
+            intervals.setdefault(cols[5], []).append((int(cols[7]), int(cols[8])))
+
+    res = []
+    for chrom, length in contigsizes['length'].items():
+        ivs = sorted(intervals.get(chrom, []))
+        starts = [s for s, _ in ivs]
+        start = 0
+        while start < length:
+            end = min(start + win, length)
+            h = math.ceil((end - start) * min_fraction)
+            count = 0
+            ## the intervals start before end - h
+            for s, e in ivs[:np.searchsorted(starts, end - h, side='right')]:
+                if min(e, end) - max(s, start) >= h:
+                    count += 1
+            res.append((chrom, start, end, count))
+            if end == length:
+                break
+            start += step
+
+    return res
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-n', '--alignments', type=int, default=100000,
+            help='number of alignments [default: %(default)s]')
+    pOpt.add_argument('-c', '--contigs', type=int, default=20,
+            help='number of contigs [default: %(default)s]')
+    pOpt.add_argument('-l', '--contig-length', type=int, default=2000000,
+            help='maximum length of contigs [default: %(default)s]')
+    pOpt.add_argument('-w', '--window', type=int, default=5000,
+            help='window size [default: %(default)s]')
+    pOpt.add_argument('-s', '--step', type=int, default=1000,
+            help='step size [default: %(default)s]')
+    pOpt.add_argument('--skip-counting', action='store_true', default=False,
+            help='only run the difference array')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_paf2depth_", dir="./")
+    try:
+        paf, contigsizes = f"{tmpdir}/aln.paf", f"{tmpdir}/ref.contigsizes"
+        random_paf(paf, contigsizes, args.alignments, args.contigs, args.contig_length)
+        contigsizes = read_chrom_sizes(contigsizes)
+
+        print("method\twindows\ttime(s)\tpeak_rss(MB)")
+        start = time.perf_counter()
+        depth_df = window_depth(paf, contigsizes, args.window, args.step)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"difference_array\t{len(depth_df)}\t{elapsed:.2f}\t{peak:.0f}")
+
+        if args.skip_counting:
+            return
+
+        start = time.perf_counter()
+        res = window_counting(paf, contigsizes, args.window, args.step)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"window_counting\t{len(res)}\t{elapsed:.2f}\t{peak:.0f}")
+
+        assert res == [(chrom, int(start), int(end), int(count))
+                        for chrom, start, end, count in depth_df.itertuples(index=False)]
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
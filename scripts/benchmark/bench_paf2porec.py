@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the conversion of Pore-C paf to pore-c table parts, the pandas
+    chunks that aligned by a pre-read of read names against the streaming
+    polars chunks of `PAFTable`, and check that the filters are identical.
+"""
+
+import argparse
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from cphasing.core import PAFTable
+
+
+def pandas_paf2porec(paf, output, min_quality, min_identity, min_length, chunksize):
+    """
+    read names are imported first to split the paf at read boundaries,
+        then each chunk is filtered by pandas.
+    """
+    os.makedirs(output, exist_ok=True)
+    read_names = pd.read_csv(paf, sep='\t', usecols=[0], header=None)[0]
+    read_idx = pd.Categorical(read_names, pd.unique(read_names), ordered=True).codes
+    del read_names
+    bounds = np.flatnonzero(np.diff(read_idx)) + 1
+    scans = np.unique(np.r_[bounds[np.searchsorted(bounds,
+                            np.arange(chunksize, len(read_idx), chunksize))], len(read_idx)])
+    chunks = pd.read_csv(paf, sep='\t', usecols=range(12), header=None,
+                         names=PAFTable.PAF_HEADER[:12], iterator=True)
+    start = 0
+    for n, end in enumerate(scans):
+        df = chunks.get_chunk(end - start)
+        df['read_idx'] = read_idx[start: end]
+        start = end
+        df['identity'] = (df.matches / df.align_length).round(2).astype(np.float32)
+        df['fragment_length'] = df.end - df.start
+        low_mq = ((df.mapping_quality < min_quality)
+                    | (df.identity < min_identity)
+                    | (df.fragment_length < min_length))
+        pass_count = (~low_mq).groupby(df.read_idx).transform('sum')
+        singleton = ~low_mq & (pass_count == 1)
+        df['filter_reason'] = np.where(low_mq, 'low_mq',
+                                       np.where(singleton, 'singleton', 'pass'))
+        df['pass_filter'] = df['filter_reason'] == 'pass'
+        df.to_parquet(f"{output}/part.{n}.parquet")
+
+
+def load(output):
+    with pl.StringCache():
+        df = pl.read_parquet(f"{output}/*.parquet").select(
+                    'read_name', 'read_idx', 'start', 'identity',
+                    'pass_filter', 'filter_reason')
+    return df.with_columns(pl.col('read_name', 'filter_reason').cast(pl.Utf8),
+                           pl.col('read_idx', 'start').cast(pl.Int64))
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pReq = p.add_argument_group('Required arguments')
+    pOpt = p.add_argument_group('Optional arguments')
+    pReq.add_argument('paf',
+            help='input paf')
+    pOpt.add_argument('-cs', '--chunksize', type=int, default=1000000,
+            help='alignments of each chunk [default: %(default)s]')
+    pOpt.add_argument('--skip-pandas', action='store_true', default=False,
+            help='only run the polars chunks')
+    pOpt.add_argument('-t', '--threads', type=int, nargs="+", default=[1, 4],
+            help='number of threads [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_paf2porec_", dir="./")
+    try:
+        print("method\tthreads\ttime(s)\tpeak_rss(MB)")
+        for threads in args.threads:
+            start = time.perf_counter()
+            PAFTable(args.paf, output=f"{tmpdir}/polars.{threads}",
+                     chunksize=args.chunksize, threads=threads)
+            elapsed = time.perf_counter() - start
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"polars\t{threads}\t{elapsed:.2f}\t{peak:.0f}")
+
+        if args.skip_pandas:
+            return
+
+        start = time.perf_counter()
+        pandas_paf2porec(args.paf, f"{tmpdir}/pandas", 1, 0.75, 50, args.chunksize)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"pandas\t1\t{elapsed:.2f}\t{peak:.0f}")
+
+        key = ['read_name', 'start']
+        ref = load(f"{tmpdir}/pandas").sort(key)
+        for threads in args.threads:
+            assert ref.equals(load(f"{tmpdir}/polars.{threads}").sort(key))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the peak memory and time of hyperedges extraction from `.pqs`,
+    legacy (concat all chunks into a doubled pandas frame) versus 
+    streaming chunks into typed buffers.
+"""
+
+import argparse
+import logging
+import os.path as op
+import resource
+import subprocess
+import sys
+import time
+
+import polars as pl
+
+
+def read_contigsizes(pqs):
+    contigsizes = {}
+    with open(op.join(pqs, "_contigsizes")) as fp:
+        for line in fp:
+            line_list = line.strip().split()
+            if line_list:
+                contigsizes[line_list[0]] = int(line_list[1])
+    
+    return contigsizes
+
+
+def legacy(pqs, min_mapq, edge_length, threads):
+    from cphasing.pqs import PQS
+    from cphasing.algorithms.hypergraph import HyperEdges
+
+    contigsizes = read_contigsizes(pqs)
+    contig_idx = dict(zip(contigsizes, range(len(contigsizes))))
+    p = PQS(path=pqs, threads=threads)
+    p.init_read()
+    chunks = p.read(min_mapq=min_mapq, return_as='files')
+    res = p.to_hg_df(chunks, contig_idx, min_mapq, edge_length=edge_length)
+    res = res.with_row_count("col")
+    df1 = res.select([pl.col("chrom1").alias("row"), pl.col("col"), pl.col("mapq")])
+    df2 = res.select([pl.col("chrom2").alias("row"), pl.col("col"), pl.col("mapq")])
+    res = pl.concat([df1, df2]).to_pandas()
+    edges = HyperEdges(idx=contig_idx, row=res['row'].values.tolist(), 
+                       col=res['col'].values.tolist(), contigsizes=contigsizes, 
+                       mapq=res['mapq'].values.tolist())
+    edges.to_numpy()
+
+    return len(edges.row)
+
+
+def streaming(pqs, min_mapq, edge_length, threads):
+    from cphasing.hypergraph import Extractor
+
+    contigsizes = read_contigsizes(pqs)
+    contig_idx = dict(zip(contigsizes, range(len(contigsizes))))
+    he = Extractor(pqs, contig_idx, contigsizes, min_quality=min_mapq,
+                   edge_length=edge_length, threads=threads)
+    he.edges.to_numpy()
+
+    return len(he.edges.row)
+
+
+METHODS = {"legacy": legacy, "streaming": streaming}
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pReq = p.add_argument_group('Required arguments')
+    pOpt = p.add_argument_group('Optional arguments')
+    pReq.add_argument('pqs', 
+            help='input pairs in `.pqs` format')
+    pOpt.add_argument('-q', '--min-mapq', type=int, default=1,
+            help='minimum mapping quality [default: %(default)s]')
+    pOpt.add_argument('-e', '--edge-length', type=int, default=0,
+            help='only retain pairs in the contig ends [default: %(default)s]')
+    pOpt.add_argument('-t', '--threads', type=int, default=4,
+            help='number of threads [default: %(default)s]')
+    pOpt.add_argument('--method', choices=list(METHODS), default=None,
+            help='run a single method in this process, used internally')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+    
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    if args.method:
+        start = time.perf_counter()
+        n = METHODS[args.method](args.pqs, args.min_mapq, 
+                                 args.edge_length, args.threads)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{args.method}\t{n}\t{elapsed:.2f}\t{peak:.1f}")
+        return 
+
+    print("method\tincidences\ttime(s)\tpeak_rss(MB)")
+    for method in METHODS:
+        cmd = [sys.executable, __file__, args.pqs, 
+               "-q", str(args.min_mapq), "-e", str(args.edge_length),
+               "-t", str(args.threads), "--method", method]
+        subprocess.run(cmd, check=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
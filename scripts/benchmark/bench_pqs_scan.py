@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the eager read-then-filter of `.pqs` chunks against the lazy 
+    `scan_chunk` with predicates pushed down, and report the bytes of 
+    row groups that have to be decoded according to the statistics.
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from cphasing.pqs import PQS, pairs_filters, scan_chunk
+
+
+def row_group_bytes(chunks, columns, min_mapq=0, max_pos=None):
+    """
+    sum the compressed bytes of `columns` in all row groups and in the row 
+    groups that can not be skipped by the min/max statistics of mapq and pos1
+    """
+    total = 0
+    retained = 0
+    for chunk in chunks:
+        metadata = pq.ParquetFile(chunk).metadata
+        names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            stats = {name: row_group.column(j).statistics for j, name in enumerate(names)}
+            size = sum(row_group.column(names.index(col)).total_compressed_size 
+                        for col in columns)
+            total += size
+            
+            skip = False
+            if min_mapq and "mapq" in stats and stats["mapq"].has_min_max:
+                skip |= stats["mapq"].max < min_mapq
+            if max_pos is not None and stats["pos1"].has_min_max:
+                skip |= stats["pos1"].min >= max_pos
+            if not skip:
+                retained += size
+
+    return total, retained
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pReq = p.add_argument_group('Required arguments')
+    pOpt = p.add_argument_group('Optional arguments')
+    pReq.add_argument('pqs', 
+            help='input pairs in `.pqs` format')
+    pOpt.add_argument('-q', '--min-mapq', type=int, default=30,
+            help='minimum mapping quality [default: %(default)s]')
+    pOpt.add_argument('-p', '--max-pos', type=int, default=100000,
+            help='retain pairs with pos1 < max_pos [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+    
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+    pl.enable_string_cache()
+
+    pqs = PQS(args.pqs)
+    pqs.init_read()
+    chunks = [str(chunk) for chunk in pqs.read(min_mapq=1, return_as="files")]
+    columns = ["chrom1", "pos1", "chrom2", "pos2"]
+
+    scenarios = {
+        "mapq": (pairs_filters(min_mapq=args.min_mapq), 
+                    dict(min_mapq=args.min_mapq)),
+        "trans": (pairs_filters(trans=True), {}),
+        "pos1": ([pl.col("pos1") < args.max_pos], 
+                    dict(max_pos=args.max_pos)),
+    }
+
+    print("filter\teager(s)\tscan(s)\trows\tbytes_total\tbytes_not_skipped")
+    for name, (filters, stats_args) in scenarios.items():
+        start = time.perf_counter()
+        eager_rows = 0
+        for chunk in chunks:
+            df = pl.read_parquet(chunk, columns=columns + ["mapq"])
+            eager_rows += len(df.filter(*filters).select(columns))
+        eager = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = sum(len(scan_chunk(chunk, columns, filters).collect()) 
+                    for chunk in chunks)
+        scan = time.perf_counter() - start
+        assert rows == eager_rows 
+
+        total, retained = row_group_bytes(chunks, columns + ["mapq"], **stats_args)
+        print(f"{name}\t{eager:.2f}\t{scan:.2f}\t{rows}\t{total}\t{retained}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the peak memory and time of `.pqs` to `.cool`, 
+    legacy concat (all chunk pixels concatenated and sorted in memory), 
+    legacy low memory (serial chunks, cooler aggregates unsorted pixels) 
+    versus the k-way merge of sorted pixel runs.
+"""
+
+import argparse
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import polars as pl
+from joblib import Parallel, delayed
+
+
+def legacy_concat(p, output, binsize, min_mapq):
+    from cooler.create import create
+    from cphasing.pqs import process_chunk_to_cool_global
+    from cphasing.utilities import binnify
+
+    bins = binnify(p.contigsizes['length'], binsize=binsize)
+    bin_offset = bins.groupby('chrom').size().cumsum().shift(1).fillna(0).astype(int)
+    chunks = p.read(min_mapq=min_mapq, return_as='files')
+    results = Parallel(n_jobs=p.threads)(
+        delayed(process_chunk_to_cool_global)(chunk, binsize, bin_offset.to_dict(), 
+                                              p.schema, min_mapq, p.metadata["is_with_mapq"])
+        for chunk in chunks)
+    pixels = pl.concat(results).group_by(["bin1_id", "bin2_id"]).agg(pl.sum("count"))
+    pixels = pixels.sort(["bin1_id", "bin2_id"])
+    create(output, bins, pixels.to_pandas(), 
+           triucheck=False, dupcheck=False, boundscheck=False)
+
+
+def legacy_low_memory(p, output, binsize, min_mapq):
+    from cooler.create import create_cooler
+    from cphasing.pqs import process_chunk_to_cool_global
+    from cphasing.utilities import binnify
+
+    bins = binnify(p.contigsizes['length'], binsize=binsize)
+    bin_offset = bins.groupby('chrom').size().cumsum().shift(1).fillna(0).astype(int)
+    chunks = p.read(min_mapq=min_mapq, column_names=['chrom1', 'pos1', 'chrom2', 'pos2', 'mapq'])
+    iterator = (process_chunk_to_cool_global(chunk, binsize, bin_offset.to_dict(), 
+                                             p.schema, min_mapq, p.metadata["is_with_mapq"]).to_pandas()
+                for chunk in chunks)
+    create_cooler(output, bins, iterator, 
+                  triucheck=False, dupcheck=False, boundscheck=False)
+
+
+def merge(p, output, binsize, min_mapq):
+    chunks = p.read(min_mapq=min_mapq, return_as='files')
+    p.to_cool(chunks, output, binsize=binsize, min_mapq=min_mapq)
+
+
+METHODS = {"legacy_concat": legacy_concat, 
+           "legacy_low_memory": legacy_low_memory, 
+           "merge": merge}
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pReq = p.add_argument_group('Required arguments')
+    pOpt = p.add_argument_group('Optional arguments')
+    pReq.add_argument('pqs', 
+            help='input pairs in `.pqs` format')
+    pOpt.add_argument('-b', '--binsize', type=int, default=10000,
+            help='bin size [default: %(default)s]')
+    pOpt.add_argument('-q', '--min-mapq', type=int, default=1,
+            help='minimum mapping quality [default: %(default)s]')
+    pOpt.add_argument('-t', '--threads', type=int, default=4,
+            help='number of threads [default: %(default)s]')
+    pOpt.add_argument('--method', choices=list(METHODS), default=None,
+            help='run a single method in this process, used internally')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+    
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    if args.method:
+        from cphasing.pqs import PQS
+        pl.enable_string_cache()
+        pqs = PQS(args.pqs, threads=args.threads)
+        pqs.init_read()
+        output = f"bench.{args.method}.cool"
+        start = time.perf_counter()
+        METHODS[args.method](pqs, output, args.binsize, args.min_mapq)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        child_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        print(f"{args.method}\t{elapsed:.2f}\t{peak:.1f}\t{child_peak:.1f}")
+        os.remove(output)
+        return 
+
+    print("method\ttime(s)\tpeak_rss(MB)\tpeak_worker_rss(MB)")
+    for method in METHODS:
+        cmd = [sys.executable, __file__, args.pqs, 
+               "-b", str(args.binsize), "-q", str(args.min_mapq),
+               "-t", str(args.threads), "--method", method]
+        subprocess.run(cmd, check=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
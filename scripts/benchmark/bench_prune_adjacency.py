@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the pruning of allelic and cross-allelic pairs on a random
+    adjacency matrix, the LIL conversion against the csr-native
+    `prune_adjacency`, and check that the results are identical.
+"""
+
+import argparse
+import logging
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from cphasing.algorithms.hypergraph import prune_adjacency
+
+
+def lil_prune_adjacency(A, P_allelic_idx=None, P_weak_idx=None,
+                        allelic_factor=-1, cross_allelic_factor=0.3):
+    """
+    prune by fancy-index assignment on the LIL matrix
+    """
+    A = A.tolil()
+    if P_allelic_idx:
+        if allelic_factor == 0:
+            A[P_allelic_idx[0], P_allelic_idx[1]] = 0
+        else:
+            A[P_allelic_idx[0], P_allelic_idx[1]] *= allelic_factor
+    if P_weak_idx:
+        if cross_allelic_factor == 0:
+            A[P_weak_idx[0], P_weak_idx[1]] = 0
+        else:
+            A[P_weak_idx[0], P_weak_idx[1]] *= cross_allelic_factor
+
+    return A.tocsr()
+
+
+def random_pairs(rng, n, m):
+    df = pd.DataFrame({"contig1": rng.integers(0, n, m),
+                       "contig2": rng.integers(0, n, m)})
+
+    return [df['contig1'], df['contig2']]
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-n', '--contigs', type=int, default=20000,
+            help='number of contigs [default: %(default)s]')
+    pOpt.add_argument('-d', '--density', type=float, default=0.01,
+            help='density of adjacency matrix [default: %(default)s]')
+    pOpt.add_argument('-p', '--pairs', type=int, default=2000000,
+            help='number of allelic and cross-allelic pairs [default: %(default)s]')
+    pOpt.add_argument('-r', '--retries', type=int, default=5,
+            help='number of resolution retries [default: %(default)s]')
+    pOpt.add_argument('--skip-lil', action='store_true', default=False,
+            help='only run the csr-native pruning')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    rng = np.random.default_rng(12345)
+    A = sp.random(args.contigs, args.contigs, density=args.density,
+                  format='csr', random_state=12345, dtype=np.float32)
+    A = (A + A.T).tocsr()
+    P_allelic_idx = random_pairs(rng, args.contigs, args.pairs // 2)
+    P_weak_idx = random_pairs(rng, args.contigs, args.pairs // 2)
+
+    methods = [("csr", prune_adjacency)]
+    if not args.skip_lil:
+        methods.append(("lil", lil_prune_adjacency))
+
+    print("method\tretries\ttime(s)\tpeak_rss(MB)")
+    res = {}
+    for name, func in methods:
+        start = time.perf_counter()
+        for _ in range(args.retries):
+            res[name] = func(A, P_allelic_idx, P_weak_idx, -1, 0.3)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{name}\t{args.retries}\t{elapsed:.2f}\t{peak:.0f}")
+
+    if "lil" in res:
+        res["lil"].sort_indices()
+        assert (res["csr"] != res["lil"]).nnz == 0
+        assert (res["csr"].indices == res["lil"].indices).all()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the per-group `allhic optimize` of `cphasing scaffolding`
+    on a synthetic polyploid with skewed group sizes, running the groups
+    in cluster-table order against the largest-first schedule.
+    `allhic` must be in the $PATH.
+"""
+
+import argparse
+import logging
+import os
+import os.path as op
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from joblib import Parallel, delayed
+
+from cphasing.algorithms.scaffolding import AllhicOptimize
+
+
+def simulate(outdir, n_chrom, ploidy, min_contigs, max_contigs, seed=12345):
+    """
+    write the count_RE and clm of each group, the number of contigs
+        per group increase with chromosome index.
+    """
+    rng = np.random.default_rng(seed)
+    groups = {}
+    sizes = np.linspace(min_contigs, max_contigs, n_chrom).astype(int)
+    for i, n in enumerate(sizes, 1):
+        for j in range(1, ploidy + 1):
+            group = f"Chr{i:02d}g{j}"
+            contigs = [f"{group}_ctg{k:04d}" for k in range(n)]
+            lengths = rng.integers(20_000, 200_000, n)
+            with open(op.join(outdir, f"{group}.txt"), 'w') as out:
+                out.write("#Contig\tRECounts\tLength\n")
+                for contig, length in zip(contigs, lengths):
+                    out.write(f"{contig}\t{length // 200}\t{length}\n")
+
+            with open(op.join(outdir, f"{group}.clm"), 'w') as out:
+                for a in range(n):
+                    for b in range(a + 1, min(n, a + 6)):
+                        count = int(rng.integers(5, 50)) // (b - a)
+                        gap = lengths[a + 1: b].sum()
+                        for s1, s2 in (("+", "+"), ("+", "-"), ("-", "+"), ("-", "-")):
+                            dists = rng.integers(gap, gap + lengths[a] + lengths[b], count)
+                            out.write(f"{contigs[a]}{s1} {contigs[b]}{s2}\t{count}\t"
+                                      f"{' '.join(map(str, dists))}\n")
+            groups[group] = contigs
+
+    return groups
+
+
+def run(allhic_path, groups, workdir, threads):
+    """
+    run optimize of the groups in the given order
+
+    Returns:
+    --------
+    elapsed: float
+        wall time of all groups
+    group_times: dict
+        wall time of each group
+    """
+    start = time.perf_counter()
+    res = Parallel(n_jobs=threads, return_as="generator_unordered")(delayed(
+                    AllhicOptimize._run)(allhic_path, f"{group}.txt", f"{group}.clm", workdir)
+                    for group in groups)
+    group_times = {tour.group: elapsed for tour, elapsed in res if tour is not None}
+
+    return time.perf_counter() - start, group_times
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('--allhic', default="allhic",
+            help='path of allhic [default: %(default)s]')
+    pOpt.add_argument('-n', '--n-chrom', type=int, default=12,
+            help='number of chromosomes [default: %(default)s]')
+    pOpt.add_argument('-p', '--ploidy', type=int, default=4,
+            help='number of haplotypes per chromosome [default: %(default)s]')
+    pOpt.add_argument('--min-contigs', type=int, default=20,
+            help='contigs of the smallest group [default: %(default)s]')
+    pOpt.add_argument('--max-contigs', type=int, default=400,
+            help='contigs of the largest group [default: %(default)s]')
+    pOpt.add_argument('-t', '--threads', type=int, default=8,
+            help='number of threads [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+
+    args = p.parse_args(args)
+    logging.disable(logging.CRITICAL)
+
+    allhic_path = shutil.which(args.allhic)
+    if not allhic_path:
+        sys.exit(f"`{args.allhic}` is not found in $PATH.")
+
+    workdir = tempfile.mkdtemp(prefix="bench_scaffolding_")
+    cwd = os.getcwd()
+    try:
+        groups = simulate(workdir, args.n_chrom, args.ploidy,
+                          args.min_contigs, args.max_contigs)
+        os.chdir(workdir)
+        optimize = AllhicOptimize.__new__(AllhicOptimize)
+        optimize.clustertable = argparse.Namespace(data=groups)
+
+        ## start the workers and import cphasing in them before timing
+        Parallel(n_jobs=args.threads)(delayed(getattr)(AllhicOptimize, "_run")
+                                        for _ in range(args.threads))
+
+        print("schedule\ttime(s)\tgroups\tlongest_group(s)")
+        for schedule, order in (("input", list(groups)),
+                                ("largest-first", optimize.schedule(list(groups)))):
+            elapsed, group_times = run(allhic_path, order, workdir, args.threads)
+            print(f"{schedule}\t{elapsed:.2f}\t{len(group_times)}\t"
+                  f"{max(group_times.values(), default=0):.2f}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+benchmark the peak memory and time of the normalization of clique expansion,
+    dense (legacy `A.toarray() * NW`) versus sparse diagonal products.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.sparse import coo_matrix
+
+from cphasing.algorithms.hypergraph import normalize_adjacency
+
+
+def dense_normalize(A, weight):
+    A = A.toarray() * np.outer(weight, weight)
+    row, col = np.nonzero(A)
+
+    return A[row, col]
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak / 1024 ** 2
+
+
+def main(args):
+    p = argparse.ArgumentParser(prog=__file__,
+                        description=__doc__,
+                        formatter_class=argparse.RawTextHelpFormatter,
+                        conflict_handler='resolve')
+    pOpt = p.add_argument_group('Optional arguments')
+    pOpt.add_argument('-n', '--vertices', nargs="+", type=int,
+            default=[10000, 50000, 200000], 
+            help='numbers of vertices [default: %(default)s]')
+    pOpt.add_argument('-d', '--degree', type=int, default=50,
+            help='average number of neighbors of a vertex [default: %(default)s]')
+    pOpt.add_argument('--max-dense', type=int, default=60000,
+            help='skip the dense method when vertices exceed it [default: %(default)s]')
+    pOpt.add_argument('-h', '--help', action='help',
+            help='show help message and exit.')
+    
+    args = p.parse_args(args)
+
+    print("vertices\tmethod\ttime(s)\tpeak_memory(MB)")
+    for n in args.vertices:
+        rng = np.random.default_rng(12345)
+        nnz = n * args.degree // 2
+        row = rng.integers(0, n, nnz)
+        col = rng.integers(0, n, nnz)
+        data = rng.random(nnz, dtype=np.float32)
+        A = coo_matrix((data, (row, col)), shape=(n, n)).tocsr()
+        A = A + A.T
+        weight = (1 / rng.integers(10000, 10000000, n)).astype(np.float32)
+
+        elapsed, peak = measure(normalize_adjacency, A, weight)
+        print(f"{n}\tsparse\t{elapsed:.3f}\t{peak:.1f}")
+
+        if n <= args.max_dense:
+            try:
+                elapsed, peak = measure(dense_normalize, A, weight)
+            except MemoryError:
+                tracemalloc.stop()
+                print(f"{n}\tdense\tout of memory\t{n * n * 8 / 1024 ** 2:.1f} (estimated)")
+            else:
+                print(f"{n}\tdense\t{elapsed:.3f}\t{peak:.1f}")
+        else:
+            print(f"{n}\tdense\tskipped\t{n * n * 8 / 1024 ** 2:.1f} (estimated)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -10,9 +10,8 @@ import logging
 import os
 import os.path as op
 import sys
-import msgspec
 from cphasing.hyperpartition import HyperPartition
-from cphasing.algorithms.hypergraph import HyperEdges
+from cphasing.algorithms.hypergraph import load_hyperedges
 from cphasing.algorithms.hypergraph import HyperGraph
 
 def main(args):
@@ -29,8 +28,7 @@ def main(args):
     
     args = p.parse_args(args)
 
-    hypergraph = msgspec.msgpack.decode(open(args.hypergraph, 'rb').read(), type=HyperEdges)
-    hypergraph.to_numpy()
+    hypergraph = load_hyperedges(args.hypergraph)
     HG = HyperGraph(hypergraph)
     H = HG.incidence_matrix()
 